@@ -0,0 +1,127 @@
+"""
+Admission control for the ingestion endpoints.
+
+create-resource and rescrape answer 429 with a Retry-After header instead of
+accepting work the service cannot absorb when:
+  - the workflow already has ADMISSION_MAX_PENDING_JOBS_PER_WORKFLOW queued
+    or running ingestion jobs,
+  - the whole queue has ADMISSION_MAX_PENDING_JOBS, or
+  - (rescrape) this process already holds ADMISSION_MAX_QUEUED_RESCRAPES
+    resources waiting for one of its ADMISSION_MAX_IN_FLIGHT_RESCRAPES slots.
+
+A request is only refused while there is load: one larger than a limit is
+still admitted when nothing else is pending, so it cannot be refused forever.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, status
+
+from .config import settings
+from .database import get_pending_job_counts
+from .schemas import IngestionLoadResponse
+
+logger = logging.getLogger(__name__)
+
+
+def exceeds_limit(current: int, requested: int, limit: int) -> bool:
+    """Whether adding `requested` to a non-idle `current` goes over `limit`."""
+    return limit > 0 and current > 0 and current + requested > limit
+
+
+class RescrapeSlots:
+    """Bounds the resources this process rescrapes at once."""
+
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait for a free rescrape slot and hold it."""
+        if self._semaphore is None:
+            self.in_flight += 1
+            try:
+                yield
+            finally:
+                self.in_flight -= 1
+            return
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+
+rescrape_slots = RescrapeSlots(settings.ADMISSION_MAX_IN_FLIGHT_RESCRAPES)
+
+
+async def get_ingestion_load(workflow_id: Optional[str] = None) -> Dict[str, Any]:
+    """Return the current ingestion load and the limits it is checked against."""
+    counts = await asyncio.to_thread(get_pending_job_counts, workflow_id)
+    return {
+        "pending_jobs": counts["pending_jobs"] if counts else None,
+        "max_pending_jobs": settings.ADMISSION_MAX_PENDING_JOBS,
+        "workflow_pending_jobs": counts["workflow_pending_jobs"] if counts else None,
+        "max_workflow_pending_jobs": settings.ADMISSION_MAX_PENDING_JOBS_PER_WORKFLOW,
+        "rescrapes_in_flight": rescrape_slots.in_flight,
+        "rescrapes_waiting": rescrape_slots.waiting,
+        "max_in_flight_rescrapes": settings.ADMISSION_MAX_IN_FLIGHT_RESCRAPES,
+        "max_queued_rescrapes": settings.ADMISSION_MAX_QUEUED_RESCRAPES,
+    }
+
+
+def get_overload_reason(
+    load: Dict[str, Any], job_count: int, rescrape_count: int
+) -> Optional[str]:
+    """Return why a request must wait, or None if it can be admitted."""
+    # Unknown counts (database error) admit the request rather than block it
+    if load["workflow_pending_jobs"] is not None and exceeds_limit(
+        load["workflow_pending_jobs"], job_count, load["max_workflow_pending_jobs"]
+    ):
+        return "Too many pending ingestion jobs for this workflow"
+    if load["pending_jobs"] is not None and exceeds_limit(
+        load["pending_jobs"], job_count, load["max_pending_jobs"]
+    ):
+        return "Too many pending ingestion jobs"
+    if rescrape_count and exceeds_limit(
+        load["rescrapes_waiting"], rescrape_count, load["max_queued_rescrapes"]
+    ):
+        return "Too many resources being rescraped"
+    return None
+
+
+async def admit_ingestion(
+    workflow_id: str, job_count: int, rescrape_count: int = 0
+) -> Dict[str, Any]:
+    """
+    Raise 429 with Retry-After if the request would overload ingestion,
+    otherwise return the current load.
+    """
+    load = await get_ingestion_load(workflow_id)
+    reason = get_overload_reason(load, job_count, rescrape_count)
+    if reason:
+        logger.warning(
+            f"Refusing {job_count} resources for workflow {workflow_id}: {reason}"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail={
+                "message": reason,
+                "load": IngestionLoadResponse(**load).model_dump(by_alias=True),
+            },
+            headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)},
+        )
+    return load
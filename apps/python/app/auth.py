@@ -0,0 +1,201 @@
+"""
+Verification of Supabase access tokens.
+
+Tokens are verified locally instead of asking Supabase Auth on every request:
+  - HS256 tokens (legacy JWT secret) against SUPABASE_JWT_SECRET,
+  - ES256/RS256 tokens (asymmetric signing keys) against the project's JWKS,
+    fetched from /auth/v1/.well-known/jwks.json and cached for
+    AUTH_JWKS_CACHE_SECONDS.
+The signature, expiry, audience (AUTH_JWT_AUDIENCE) and issuer are checked.
+A token signed with a key id missing from the cached JWKS refetches it, at
+most once per AUTH_JWKS_MIN_REFRESH_SECONDS, so rotated keys are picked up.
+
+Tokens that cannot be verified here (no secret configured, a key id still
+unknown, or asymmetric keys without the `cryptography` package installed) are
+verified remotely with supabase.auth.get_user as before. A token that fails
+local verification is rejected without a remote call; as with any local JWT
+check, a revoked session is accepted until its token expires.
+
+Verified tokens are cached (by their sha256) until they expire, for at most
+AUTH_TOKEN_CACHE_TTL_SECONDS, so bursts of requests with the same token (e.g.
+a multi-file upload) verify it once. invalidate_token and
+invalidate_user_tokens drop them from this process's cache.
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+import jwt
+from jwt.algorithms import has_crypto
+
+from .cache import verified_token_cache
+from .config import settings
+from .supabase import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = ("ES256", "RS256")
+
+
+def get_auth_url() -> str:
+    return f"{settings.NEXT_PUBLIC_SUPABASE_URL.rstrip('/')}/auth/v1"
+
+
+def get_issuer() -> str:
+    """The `iss` claim of the project's tokens."""
+    return settings.AUTH_JWT_ISSUER or get_auth_url()
+
+
+class SigningKeys:
+    """The project's JWKS by key id, refetched when stale or on unknown ids."""
+
+    def __init__(self, ttl: float, min_refresh: float):
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._fetched_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def needs_refresh(self, key_id: str) -> bool:
+        if self._fetched_at is None:
+            return True
+        age = time.monotonic() - self._fetched_at
+        return age > self.ttl or (key_id not in self._keys and age > self.min_refresh)
+
+    async def get(self, key_id: str) -> Optional[jwt.PyJWK]:
+        """Return the signing key with this id, or None if there is none."""
+        if self.needs_refresh(key_id):
+            async with self._lock:
+                # Another request may have refreshed while this one waited
+                if self.needs_refresh(key_id):
+                    await self.refresh()
+        return self._keys.get(key_id)
+
+    async def refresh(self):
+        """Fetch the JWKS; the keys held so far are kept if that fails."""
+        url = f"{get_auth_url()}/.well-known/jwks.json"
+        try:
+            async with aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as session:
+                async with session.get(url) as response:
+                    response.raise_for_status()
+                    jwks = await response.json()
+
+            keys = {}
+            for jwk in jwks.get("keys", []):
+                try:
+                    key = jwt.PyJWK.from_dict(jwk)
+                except jwt.PyJWKError as e:
+                    logger.warning(f"Skipping unusable signing key: {str(e)}")
+                    continue
+                if key.key_id:
+                    keys[key.key_id] = key
+            self._keys = keys
+            logger.info(f"Loaded {len(keys)} auth signing keys")
+        except Exception as e:
+            logger.error(f"Failed to fetch auth signing keys: {str(e)}")
+        finally:
+            self._fetched_at = time.monotonic()
+
+
+signing_keys = SigningKeys(
+    settings.AUTH_JWKS_CACHE_SECONDS, settings.AUTH_JWKS_MIN_REFRESH_SECONDS
+)
+
+
+async def verify_token_locally(token: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the claims of a valid token, or None if it cannot be verified
+    locally. Raises jwt.InvalidTokenError for an invalid token.
+    """
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+
+    if algorithm == "HS256":
+        if not settings.SUPABASE_JWT_SECRET:
+            return None
+        key: Any = settings.SUPABASE_JWT_SECRET
+    elif algorithm in ASYMMETRIC_ALGORITHMS and has_crypto and header.get("kid"):
+        signing_key = await signing_keys.get(header["kid"])
+        if signing_key is None or signing_key.algorithm_name != algorithm:
+            return None
+        key = signing_key.key
+    else:
+        return None
+
+    claims: Dict[str, Any] = jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=settings.AUTH_JWT_AUDIENCE,
+        issuer=get_issuer(),
+        leeway=settings.AUTH_JWT_LEEWAY_SECONDS,
+        options={"require": ["exp", "sub"]},
+    )
+    return claims
+
+
+async def verify_token_remotely(token: str) -> Dict[str, Any]:
+    """Ask Supabase Auth for the token's user. Raises if it is not valid."""
+    supabase = get_supabase_client()
+    response = await asyncio.to_thread(supabase.auth.get_user, token)
+    if not response or not response.user:
+        raise ValueError("Invalid authentication token")
+    return {
+        "sub": response.user.id,
+        "email": response.user.email,
+        "role": response.user.role,
+    }
+
+
+def get_token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def get_token_ttl(token: str) -> float:
+    """Seconds to cache a verified token: until it expires, at most the TTL."""
+    ttl = float(settings.AUTH_TOKEN_CACHE_TTL_SECONDS)
+    try:
+        # Already verified, by signature or by Supabase Auth
+        claims = jwt.decode(token, options={"verify_signature": False})
+    except jwt.InvalidTokenError:
+        return ttl
+    expires_at = claims.get("exp")
+    if isinstance(expires_at, (int, float)):
+        ttl = min(ttl, expires_at - time.time())
+    return ttl
+
+
+async def verify_access_token(token: str) -> Dict[str, Any]:
+    """Return the claims of a Supabase access token, locally if possible."""
+    key = get_token_key(token)
+    claims = verified_token_cache.get(key)
+    if claims is not None:
+        return claims
+
+    if settings.AUTH_LOCAL_VERIFICATION_ENABLED:
+        claims = await verify_token_locally(token)
+    if claims is None:
+        claims = await verify_token_remotely(token)
+
+    ttl = get_token_ttl(token)
+    if ttl > 0:
+        verified_token_cache.set(key, claims, ttl)
+    return claims
+
+
+def invalidate_token(token: str) -> bool:
+    """Forget a verified token, e.g. on logout. Returns whether it was cached."""
+    return verified_token_cache.delete(get_token_key(token))
+
+
+def invalidate_user_tokens(user_id: str) -> int:
+    """Forget every verified token of a user; returns how many."""
+    return verified_token_cache.delete_where(
+        lambda _, claims: claims.get("sub") == user_id
+    )
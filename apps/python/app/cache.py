@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import xxhash
+
+from .config import settings
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """Thread-safe LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> Optional[V]:
+        """Return the cached value, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: K, value: V, ttl_seconds: Optional[float] = None) -> None:
+        """Store a value, evicting the least recently used entries if full."""
+        if self.max_size <= 0:
+            return
+
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: K) -> bool:
+        """Remove a single entry if present; returns whether it was."""
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def delete_where(self, predicate: Callable[[K, V], bool]) -> int:
+        """Remove the entries matching `predicate`; returns how many."""
+        with self._lock:
+            keys = [
+                key
+                for key, (_, value) in self._entries.items()
+                if predicate(key, value)
+            ]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit rate counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Query text -> embedding. Embeddings are deterministic, so the TTL only
+# bounds memory held by queries that are never asked again.
+query_embedding_cache: TTLCache[str, List[float]] = TTLCache(
+    settings.QUERY_EMBEDDING_CACHE_SIZE,
+    settings.QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+)
+
+# (workflow, generation, query hash, k, filters) -> search results. Bumping
+# workflow.search_generation (see database.bump_workflow_search_generation)
+# orphans all of a workflow's cached results in every process; they then age
+# out of the LRU.
+search_result_cache: TTLCache[Tuple[Any, ...], List[Dict[str, Any]]] = TTLCache(
+    settings.SEARCH_RESULT_CACHE_SIZE,
+    settings.SEARCH_RESULT_CACHE_TTL_SECONDS,
+)
+
+# workflow id -> embedding dimensions used to ingest and search it
+workflow_dimensions_cache: TTLCache[str, int] = TTLCache(
+    settings.WORKFLOW_SETTINGS_CACHE_SIZE,
+    settings.WORKFLOW_SETTINGS_CACHE_TTL_SECONDS,
+)
+
+# workflow id -> search generation keying its cached results. An entry is
+# dropped when the generation is bumped (see cache_listener.py); the short TTL
+# bounds staleness while no listener is connected.
+workflow_generation_cache: TTLCache[str, int] = TTLCache(
+    settings.WORKFLOW_SETTINGS_CACHE_SIZE,
+    settings.SEARCH_GENERATION_CACHE_TTL_SECONDS,
+)
+
+# workflow id -> id of the user owning it
+workflow_owner_cache: TTLCache[str, str] = TTLCache(
+    settings.WORKFLOW_SETTINGS_CACHE_SIZE,
+    settings.WORKFLOW_SETTINGS_CACHE_TTL_SECONDS,
+)
+
+# workflow id -> chunks partition its rows are stored in
+chunks_partition_cache: TTLCache[str, str] = TTLCache(
+    settings.WORKFLOW_SETTINGS_CACHE_SIZE,
+    settings.WORKFLOW_SETTINGS_CACHE_TTL_SECONDS,
+)
+
+# sha256 of a bearer token -> claims of its user, until the token expires.
+# Invalidated per process (see auth.invalidate_user_tokens).
+verified_token_cache: TTLCache[str, Dict[str, Any]] = TTLCache(
+    settings.AUTH_TOKEN_CACHE_SIZE,
+    settings.AUTH_TOKEN_CACHE_TTL_SECONDS,
+)
+
+# Content hash of an extracted resource -> its generated title, so rescrapes and
+# duplicate files are not titled again.
+title_cache: TTLCache[str, str] = TTLCache(
+    settings.TITLE_CACHE_SIZE,
+    settings.TITLE_CACHE_TTL_SECONDS,
+)
+
+CACHES: Dict[str, TTLCache] = {
+    "query_embedding": query_embedding_cache,
+    "search_result": search_result_cache,
+    "workflow_dimensions": workflow_dimensions_cache,
+    "workflow_generation": workflow_generation_cache,
+    "workflow_owner": workflow_owner_cache,
+    "chunks_partition": chunks_partition_cache,
+    "verified_token": verified_token_cache,
+    "title": title_cache,
+}
+
+
+def get_query_hash(query: str) -> str:
+    """Hash a query after normalizing whitespace."""
+    normalized = " ".join(query.split())
+    return xxhash.xxh64(normalized.encode("utf-8")).hexdigest()
+
+
+def get_search_cache_key(
+    workflow_id: str,
+    generation: int,
+    query_hash: str,
+    limit: int,
+    knowledge_id: Optional[str],
+    context_ids: Optional[List[str]],
+    ef_search: Optional[int],
+) -> Tuple[Any, ...]:
+    """Build the search result cache key for a query and its filters."""
+    return (
+        workflow_id,
+        generation,
+        query_hash,
+        limit,
+        knowledge_id,
+        tuple(sorted(context_ids or [])),
+        ef_search,
+    )
@@ -0,0 +1,98 @@
+"""
+Push invalidation of the search generations cached by an API process.
+
+Searches key their cached results by the workflow's search_generation, read
+through workflow_generation_cache so a cached search needs no database round
+trip. Every bump of a generation also sends a NOTIFY with the workflow id
+(see database.bump_workflow_search_generation). SearchCacheListener LISTENs
+for it on a dedicated connection and drops the workflow's cached generation,
+so the next search reads the new one. Notifications sent while the listener
+is disconnected are lost: the cache is cleared on every reconnect, and
+SEARCH_GENERATION_CACHE_TTL_SECONDS bounds staleness meanwhile.
+"""
+
+import logging
+import select
+import threading
+from typing import Any, Optional
+
+import psycopg2  # type: ignore[import-untyped]
+
+from .cache import workflow_generation_cache
+from .config import settings
+from .database import SEARCH_INVALIDATION_CHANNEL, engine
+
+logger = logging.getLogger(__name__)
+
+
+class SearchCacheListener:
+    """LISTENs for search generation bumps in a background thread."""
+
+    def __init__(self, reconnect_seconds: float):
+        self.reconnect_seconds = reconnect_seconds
+        self.connected = False
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start listening in the background."""
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self.run, name="search-cache-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop listening and close the connection."""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        """Listen until stopped, reconnecting after connection errors."""
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                connection = self.connect()
+                self.listen(connection)
+            except Exception as e:
+                logger.error(f"Search cache listener disconnected: {str(e)}")
+            finally:
+                self.connected = False
+                if connection is not None:
+                    connection.close()
+            self._stopping.wait(self.reconnect_seconds)
+
+    def connect(self) -> Any:
+        """Open the listening connection, outside the engine's pool."""
+        connection = psycopg2.connect(
+            engine.url.set(drivername="postgresql").render_as_string(
+                hide_password=False
+            )
+        )
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {SEARCH_INVALIDATION_CHANNEL}")
+        # Bumps made while disconnected were not notified
+        workflow_generation_cache.clear()
+        self.connected = True
+        logger.info("Search cache listener connected")
+        return connection
+
+    def listen(self, connection: Any):
+        """Drop the cached generation of each notified workflow."""
+        while not self._stopping.is_set():
+            # Wakes up every second to notice stop()
+            readable, _, _ = select.select([connection], [], [], 1.0)
+            if not readable:
+                continue
+            connection.poll()
+            while connection.notifies:
+                notification = connection.notifies.pop(0)
+                workflow_generation_cache.delete(notification.payload)
+
+
+search_cache_listener = SearchCacheListener(
+    settings.SEARCH_INVALIDATION_RECONNECT_SECONDS
+)
@@ -0,0 +1,89 @@
+"""
+Incremental chunking for streaming ingestion.
+
+StreamingTokenChunker produces the same fixed token windows as chonkie's
+TokenChunker (without overlap), but is fed text piece by piece and returns
+each chunk as soon as its window is full, so embedding can start before the
+whole document is extracted. ChunkBatcher groups the chunks into embedding
+batches as they arrive.
+"""
+
+from typing import Any, List, Optional
+
+from chonkie import Chunk  # type: ignore
+
+
+class StreamingTokenChunker:
+    """Token-window chunker that accepts text incrementally."""
+
+    def __init__(self, tokenizer: Any, chunk_size: int = 512):
+        self.tokenizer = tokenizer
+        self.chunk_size = chunk_size
+        self.chunk_count = 0
+        self._buffer = ""
+        self._offset = 0
+
+    def feed(self, text: str) -> List[Chunk]:
+        """Add text and return the chunks whose windows are now full."""
+        self._buffer += text
+        tokens = self.tokenizer.encode(self._buffer)
+
+        # The last window stays buffered even when full: its final tokens can
+        # still merge with the start of the next piece of text
+        chunks = []
+        start = 0
+        while len(tokens) - start > self.chunk_size:
+            chunks.append(self._emit(tokens[start : start + self.chunk_size]))
+            start += self.chunk_size
+        if start:
+            self._buffer = self.tokenizer.decode(tokens[start:])
+        return chunks
+
+    def flush(self) -> List[Chunk]:
+        """Return the chunks of the remaining text once the input has ended."""
+        tokens = self.tokenizer.encode(self._buffer)
+        self._buffer = ""
+        return [
+            self._emit(tokens[start : start + self.chunk_size])
+            for start in range(0, len(tokens), self.chunk_size)
+        ]
+
+    def _emit(self, tokens: List[int]) -> Chunk:
+        text = self.tokenizer.decode(tokens)
+        chunk = Chunk(
+            text=text,
+            start_index=self._offset,
+            end_index=self._offset + len(text),
+            token_count=len(tokens),
+        )
+        self._offset += len(text)
+        self.chunk_count += 1
+        return chunk
+
+
+class ChunkBatcher:
+    """
+    Groups streamed chunks into batches of up to `token_limit` tokens, the
+    incremental counterpart of services.batch_chunks.
+    """
+
+    def __init__(self, token_limit: int):
+        self.token_limit = token_limit
+        self._batch: List[Chunk] = []
+        self._tokens = 0
+
+    def add(self, chunk: Chunk) -> Optional[List[Chunk]]:
+        """Add a chunk; return the previous batch if this chunk overflowed it."""
+        full_batch = None
+        if self._batch and self._tokens + chunk.token_count > self.token_limit:
+            full_batch = self.flush()
+        self._batch.append(chunk)
+        self._tokens += chunk.token_count
+        return full_batch
+
+    def flush(self) -> Optional[List[Chunk]]:
+        """Return the batch being filled, if any, and start a new one."""
+        batch = self._batch or None
+        self._batch = []
+        self._tokens = 0
+        return batch
@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import Dict, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -11,9 +11,44 @@ class Settings(BaseSettings):
     NEXT_PUBLIC_SUPABASE_URL: str
     SUPABASE_ANON_KEY: str
     POSTGRES_URL: str
+    # Verify access tokens locally (see auth.py); HS256 tokens need the
+    # project's JWT secret, asymmetric ones are checked against its JWKS
+    AUTH_LOCAL_VERIFICATION_ENABLED: bool = True
+    SUPABASE_JWT_SECRET: Optional[str] = None
+    AUTH_JWT_AUDIENCE: str = "authenticated"
+    # Defaults to NEXT_PUBLIC_SUPABASE_URL + /auth/v1
+    AUTH_JWT_ISSUER: Optional[str] = None
+    AUTH_JWT_LEEWAY_SECONDS: int = 30
+    AUTH_JWKS_CACHE_SECONDS: float = 600.0
+    # Unknown key ids refetch the JWKS at most this often
+    AUTH_JWKS_MIN_REFRESH_SECONDS: float = 30.0
+    # Verified tokens are cached until they expire, for at most the TTL
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    AUTH_TOKEN_CACHE_TTL_SECONDS: int = 300
+    # Realtime channels unused this long are left (see RealtimePublisher)
+    REALTIME_CHANNEL_IDLE_SECONDS: float = 300.0
+    REALTIME_MAX_CHANNELS: int = 1000
+    # Progress updates of a resource are coalesced to one per interval
+    REALTIME_PROGRESS_INTERVAL_SECONDS: float = 1.0
+
+    # Usage Metering Configuration (see usage.py)
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 10.0
+    # A workflow with this many bytes pending is flushed at once (0: never)
+    USAGE_FLUSH_THRESHOLD_BYTES: int = 100_000_000
 
     # Rescrape Configuration
     RESCRAPE_CRON_SECRET: str
+    # One Discord summary per rescrape run, and per interval of long runs
+    RESCRAPE_SUMMARY_INTERVAL_SECONDS: float = 300.0
+    # Slowest and failed resources listed in a summary
+    RESCRAPE_SUMMARY_TOP_N: int = 5
+    # Schedule due rescrapes in-service instead of via the external cron
+    RESCRAPE_SCHEDULER_ENABLED: bool = False
+    RESCRAPE_SCHEDULER_INTERVAL_SECONDS: float = 60.0
+    # Resources leased per tick, on top of those still waiting for a slot
+    RESCRAPE_SCHEDULER_BATCH_SIZE: int = 50
+    # Fraction of its period a resource may be rescraped early, to spread load
+    RESCRAPE_SCHEDULER_SPREAD: float = 0.1
 
     # OpenAI Configuration
     OPENAI_API_KEY: Optional[str]
@@ -21,13 +56,145 @@ class Settings(BaseSettings):
     # Itzam API Configuration
     ITZAM_API_KEY: Optional[str]
     ITZAM_API_URL: str = os.getenv("ITZAM_API_URL", "https://itz.am/api/v1")
+    # Titles are generated in the background; past the timeout a resource keeps
+    # the title taken from its first line. Generated titles are cached by
+    # content hash.
+    TITLE_GENERATION_TIMEOUT_SECONDS: float = 15.0
+    TITLE_CACHE_SIZE: int = 10000
+    TITLE_CACHE_TTL_SECONDS: int = 604800
 
     # Tika Configuration
     TIKA_URL: str = os.getenv("TIKA_URL", "https://tika.yllw.software/tika")
 
+    # Extraction Configuration
+    # Convert documents with docling in pooled child processes, the one
+    # converting a document killed when its ingestion is cancelled (see
+    # extraction.py)
+    EXTRACTION_SUBPROCESS_ENABLED: bool = True
+    # Converter processes per API or worker process, and the documents each
+    # converts before it is replaced
+    EXTRACTION_PROCESS_POOL_SIZE: int = 2
+    EXTRACTION_PROCESS_MAX_CONVERSIONS: int = 50
+
     # Next.js App URL for API endpoints
     NEXT_PUBLIC_APP_URL: str = os.getenv("NEXT_PUBLIC_APP_URL", "http://localhost:3000")
 
+    # Admin Configuration (admin endpoints are disabled when unset)
+    ADMIN_SECRET: Optional[str] = None
+
+    # Search Configuration
+    SEARCH_DEFAULT_LIMIT: int = 4
+    SEARCH_MAX_LIMIT: int = 50
+    SEARCH_HNSW_EF_SEARCH: int = 40
+    SEARCH_IVFFLAT_PROBES: int = 10
+    # Keep scanning the index until `limit` rows pass the workflow filter
+    # ("relaxed_order" or "strict_order"); "off" for pgvector < 0.8
+    SEARCH_ITERATIVE_SCAN: str = "relaxed_order"
+    # "none", or "halfvec"/"binary" for a quantized first pass over the
+    # matching index, re-ranked at full precision
+    SEARCH_QUANTIZATION: str = "none"
+    SEARCH_RERANK_CANDIDATES_FACTOR: int = 4
+    # Disable when connecting through a transaction-mode pooler (pgbouncer)
+    SEARCH_USE_PREPARED_STATEMENTS: bool = True
+
+    # Search Cache Configuration (set a size to 0 to disable a cache)
+    QUERY_EMBEDDING_CACHE_SIZE: int = 10000
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS: int = 86400
+    SEARCH_RESULT_CACHE_SIZE: int = 5000
+    SEARCH_RESULT_CACHE_TTL_SECONDS: int = 300
+    WORKFLOW_SETTINGS_CACHE_SIZE: int = 10000
+    WORKFLOW_SETTINGS_CACHE_TTL_SECONDS: int = 300
+    # Bounds how stale a cached search generation gets if a bump notification
+    # is missed (see cache_listener.py)
+    SEARCH_GENERATION_CACHE_TTL_SECONDS: int = 10
+    # LISTEN for search generation bumps; needs a session-mode connection
+    SEARCH_INVALIDATION_LISTENER_ENABLED: bool = True
+    SEARCH_INVALIDATION_RECONNECT_SECONDS: float = 5.0
+
+    # Vector Index Configuration
+    VECTOR_INDEX_METHOD: str = "hnsw"  # "hnsw" or "ivfflat"
+    VECTOR_INDEX_HNSW_M: int = 16
+    VECTOR_INDEX_HNSW_EF_CONSTRUCTION: int = 64
+    VECTOR_INDEX_IVFFLAT_LISTS: int = 100
+    VECTOR_INDEX_MAINTENANCE_WORK_MEM: str = "1GB"
+
+    # Ingestion Job Queue Configuration
+    # Consume ingestion jobs inside the API process
+    JOB_CONSUMER_ENABLED: bool = True
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    # A running job is claimed again if its lease is not extended in time
+    JOB_VISIBILITY_TIMEOUT_SECONDS: int = 300
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_DELAY_SECONDS: float = 10.0
+    JOB_RETRY_MAX_DELAY_SECONDS: float = 600.0
+    # Deadline for running jobs to finish on shutdown; the rest are requeued
+    JOB_SHUTDOWN_TIMEOUT_SECONDS: float = 30.0
+    # How often a consumer checks whether its running jobs were cancelled
+    JOB_CANCEL_POLL_INTERVAL_SECONDS: float = 2.0
+
+    # Fair-Share Scheduling Configuration (see CLAIM_JOBS_QUERY)
+    # Larger shares of the workers for some workflows, e.g. {"workflow-456": 4}
+    SCHEDULER_WORKFLOW_WEIGHTS: Dict[str, float] = {}
+    # A rescrape job waiting this long is scheduled like an interactive upload
+    SCHEDULER_MAX_LANE_WAIT_SECONDS: int = 3600
+    # Jobs ranked per job claimed; more is fairer when workers contend
+    SCHEDULER_CANDIDATES_FACTOR: int = 4
+
+    # Ingestion Pipeline Configuration (workers per stage, see pipeline.py)
+    PIPELINE_FETCH_WORKERS: int = 8
+    PIPELINE_EXTRACT_WORKERS: int = 2
+    PIPELINE_CHUNK_WORKERS: int = 2
+    PIPELINE_EMBED_WORKERS: int = 4
+    PIPELINE_PERSIST_WORKERS: int = 4
+    # Jobs waiting in front of each stage; a full queue blocks the stage before
+    PIPELINE_QUEUE_SIZE: int = 16
+    # How often the standalone worker logs per-stage queue depth (0 disables)
+    PIPELINE_STATS_INTERVAL_SECONDS: float = 60.0
+
+    # Metrics Configuration (see metrics.py)
+    # Serve Prometheus metrics at /metrics from the API
+    METRICS_ENABLED: bool = True
+    # Port of the standalone worker's /metrics and /health (0 disables)
+    WORKER_METRICS_PORT: int = 9100
+
+    # Tracing Configuration (see tracing.py)
+    # Export a trace per resource ingestion over OTLP/HTTP
+    TRACING_ENABLED: bool = False
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_SERVICE_NAME: str = "itzam-python"
+    # Fraction of ingestions traced; jobs follow the decision of their trace
+    TRACING_SAMPLE_RATIO: float = 1.0
+
+    # Streaming Ingestion Configuration
+    # Chunk and embed documents while they are extracted (PDFs are converted
+    # in windows of pages) instead of after the whole document
+    INGESTION_STREAMING_ENABLED: bool = False
+    INGESTION_STREAMING_PAGES_PER_WINDOW: int = 10
+    # Smaller than the per-request limit so the first chunks are searchable early
+    INGESTION_STREAMING_BATCH_TOKENS: int = 32768
+
+    # Ingestion Recovery Configuration
+    # When a job consumer starts, re-enqueue the missing batches of resources
+    # left PENDING without jobs (see CLAIM_STALLED_RESOURCES_QUERY)
+    INGESTION_RECOVERY_ENABLED: bool = True
+    # Resources updated more recently are not considered stalled yet
+    INGESTION_RECOVERY_MIN_AGE_SECONDS: int = 600
+    INGESTION_RECOVERY_BATCH_SIZE: int = 100
+
+    # Admission Control Configuration (0 disables a limit)
+    # Queued and running ingestion jobs, across all workflows and per workflow
+    ADMISSION_MAX_PENDING_JOBS: int = 20000
+    ADMISSION_MAX_PENDING_JOBS_PER_WORKFLOW: int = 2000
+    # Resources a process rescrapes at once, and may hold waiting for a slot
+    ADMISSION_MAX_IN_FLIGHT_RESCRAPES: int = 16
+    ADMISSION_MAX_QUEUED_RESCRAPES: int = 500
+    ADMISSION_RETRY_AFTER_SECONDS: int = 30
+
+    # Chunks Partitioning Configuration (see scripts/partition_chunks.py)
+    CHUNKS_HASH_PARTITIONS: int = 16
+    # Insert straight into a workflow's partition instead of routing via chunks
+    CHUNKS_PARTITION_ROUTING: bool = True
+
     # API Configuration
     API_TITLE: str = "Itzam Processing API"
     API_DESCRIPTION: str = (
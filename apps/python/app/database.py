@@ -1,19 +1,167 @@
+import json
 import logging
 import uuid
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
 
-from sqlalchemy import create_engine, select, update
+from sqlalchemy import (
+    String,
+    any_,
+    bindparam,
+    column,
+    create_engine,
+    delete,
+    event,
+    func,
+    insert,
+    null,
+    select,
+    table,
+    text,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session, sessionmaker
 
+from .cache import (
+    chunks_partition_cache,
+    workflow_dimensions_cache,
+    workflow_generation_cache,
+    workflow_owner_cache,
+)
 from .config import settings
-from .models import Chunks, Resource
+from .metrics import timed, watch_pool
+from .models import Chunks, IngestionJob, Resource, ResourceBatch, Workflow
+from .tracing import traced
+from .vector_expressions import (
+    EMBEDDING_DIMENSIONS,
+    SEARCH_QUANTIZATIONS,
+    SUPPORTED_EMBEDDING_DIMENSIONS,
+    get_distance_expression,
+    get_embedding_column,
+)
 
 logger = logging.getLogger(__name__)
 
 # Create SQLAlchemy engine and session
 engine = create_engine(settings.POSTGRES_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+watch_pool(engine.pool)
+
+# NOTIFY channel carrying the id of a workflow whose search generation was
+# bumped (see bump_workflow_search_generation and cache_listener.py)
+SEARCH_INVALIDATION_CHANNEL = "workflow_search_invalidation"
+
+SEARCH_CHUNKS_FROM = """
+    FROM chunks c
+    JOIN resource r ON r.id = c.resource_id
+    WHERE c.workflow_id = {workflow_id}
+      AND c.active
+      AND r.active
+      AND (
+        ({knowledge_id} IS NULL AND cardinality({context_ids}) = 0)
+        OR r.knowledge_id = {knowledge_id}
+        OR r.context_id = ANY({context_ids})
+      )
+"""
+
+SEARCH_CHUNKS_PARAMETERS = {
+    "embedding": ("vector", "CAST(:embedding AS vector)"),
+    "workflow_id": ("text", ":workflow_id"),
+    "knowledge_id": ("text", "CAST(:knowledge_id AS text)"),
+    "context_ids": ("text[]", "CAST(:context_ids AS text[])"),
+    "limit": ("int", ":limit"),
+    "candidates": ("int", ":candidates"),
+}
+
+
+def build_search_chunks_query(
+    quantization: str, dimensions: int, placeholders: Dict[str, str]
+) -> str:
+    """
+    Build the nearest-neighbour query over chunks for a quantization mode and
+    embedding size.
+
+    The ORDER BY repeats the indexed expression so the planner can use the
+    vector index. Quantized modes fetch `candidates` rows from the quantized
+    index and re-rank them by full-precision cosine distance.
+
+    The workflow and knowledge filters are applied to the rows the index
+    returns. Without an iterative scan (SEARCH_ITERATIVE_SCAN) a small
+    workflow sharing the index with large ones can get fewer than `limit`
+    rows, as the scan stops after ef_search candidates.
+    """
+    embedding = placeholders["embedding"]
+    column = get_embedding_column(dimensions)
+    from_clause = SEARCH_CHUNKS_FROM.format(**placeholders)
+    order_by = get_distance_expression(quantization, embedding, dimensions)
+
+    if quantization == "none":
+        # An iterative index scan may return rows slightly out of order
+        return f"""
+            WITH nearest AS MATERIALIZED (
+                SELECT c.id, c.content, c.resource_id, {order_by} AS distance
+                {from_clause}
+                ORDER BY {order_by}
+                LIMIT {placeholders["limit"]}
+            )
+            SELECT id, content, resource_id, 1 - distance AS similarity
+            FROM nearest
+            ORDER BY distance
+        """
+
+    return f"""
+        WITH candidates AS (
+            SELECT c.id, c.content, c.resource_id, c.{column} AS embedding
+            {from_clause}
+            ORDER BY {order_by}
+            LIMIT {placeholders["candidates"]}
+        )
+        SELECT id, content, resource_id, 1 - (embedding <=> {embedding}) AS similarity
+        FROM candidates
+        ORDER BY embedding <=> {embedding}
+        LIMIT {placeholders["limit"]}
+    """
+
+
+def get_search_statement_name(quantization: str, dimensions: int) -> str:
+    """Return the prepared statement name for a search variant."""
+    return f"search_chunks_{quantization}_{dimensions}"
+
+
+@event.listens_for(engine, "connect")
+def prepare_search_statements(dbapi_connection, connection_record):
+    """
+    Prepare the search statements once per pooled connection, for every
+    embedding size in full precision and in the configured quantization.
+    """
+    connection_record.info["search_prepared"] = set()
+    if not settings.SEARCH_USE_PREPARED_STATEMENTS:
+        return
+
+    types = ", ".join(kind for kind, _ in SEARCH_CHUNKS_PARAMETERS.values())
+    placeholders = {
+        name: f"${position}"
+        for position, name in enumerate(SEARCH_CHUNKS_PARAMETERS, start=1)
+    }
+
+    for quantization in dict.fromkeys(("none", settings.SEARCH_QUANTIZATION)):
+        for dimensions in SUPPORTED_EMBEDDING_DIMENSIONS:
+            name = get_search_statement_name(quantization, dimensions)
+            try:
+                cursor = dbapi_connection.cursor()
+                cursor.execute(
+                    f"PREPARE {name} ({types}) AS "
+                    + build_search_chunks_query(quantization, dimensions, placeholders)
+                )
+                cursor.close()
+                dbapi_connection.commit()
+                connection_record.info["search_prepared"].add(name)
+            except Exception as e:
+                # e.g. binary_quantize needs pgvector >= 0.7
+                logger.warning(f"Failed to prepare {name}: {str(e)}")
+                dbapi_connection.rollback()
 
 
 def get_db_session() -> Session:
@@ -21,13 +169,125 @@ def get_db_session() -> Session:
     return SessionLocal()
 
 
+# Leaf partition of chunks holding a workflow's rows: a dedicated list
+# partition if it has one, else its hash partition under chunks_default.
+# Returns no row while chunks is not partitioned.
+CHUNKS_PARTITION_QUERY = r"""
+    SELECT partition_name FROM (
+        SELECT 0 AS precedence, c.relname AS partition_name
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('chunks')
+          AND pg_get_expr(c.relpartbound, c.oid)
+              = format('FOR VALUES IN (%L)', CAST(:workflow_id AS text))
+        UNION ALL
+        SELECT 1, c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        CROSS JOIN LATERAL regexp_match(
+            pg_get_expr(c.relpartbound, c.oid), 'modulus (\d+), remainder (\d+)'
+        ) AS bound(m)
+        WHERE i.inhparent = to_regclass('chunks_default')
+          AND satisfies_hash_partition(
+              to_regclass('chunks_default'), bound.m[1]::int, bound.m[2]::int,
+              CAST(:workflow_id AS varchar)
+          )
+    ) partitions
+    ORDER BY precedence
+    LIMIT 1
+"""
+
+
+def resolve_chunks_partition(workflow_id: str) -> str:
+    """
+    Return the chunks table a workflow's rows are written to: its leaf
+    partition when chunks is partitioned, else chunks itself (cached).
+    """
+    if not settings.CHUNKS_PARTITION_ROUTING:
+        return "chunks"
+
+    cached_partition = chunks_partition_cache.get(workflow_id)
+    if cached_partition is not None:
+        return cached_partition
+
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        partition = session.execute(
+            text(CHUNKS_PARTITION_QUERY), {"workflow_id": workflow_id}
+        ).scalar_one_or_none()
+        session.close()
+    except Exception as e:
+        logger.error(
+            f"Failed to resolve chunks partition for workflow {workflow_id}: {str(e)}"
+        )
+        if session:
+            session.close()
+        return "chunks"
+
+    partition = partition or "chunks"
+    chunks_partition_cache.set(workflow_id, partition)
+    return partition
+
+
+def get_chunks_table(name: str = "chunks"):
+    """Return a Core table for chunks or one of its partitions."""
+    return table(name, *(column(c.name, c.type) for c in Chunks.__table__.columns))
+
+
+@traced("save_chunks_to_db")
+@timed("db_write")
 def save_chunks_to_db(
-    chunks_data: List[Dict[str, Any]], resource_id: str, workflow_id: str
+    chunks_data: List[Dict[str, Any]],
+    resource_id: str,
+    workflow_id: str,
+    dimensions: int = EMBEDDING_DIMENSIONS,
+    batch_index: Optional[int] = None,
+    replace_chunks_before: Optional[datetime] = None,
+    job_id: Optional[str] = None,
 ) -> Dict[str, Any]:
-    """Save chunks and embeddings to database using SQLAlchemy."""
+    """
+    Save chunks and embeddings to database using SQLAlchemy. Embeddings go to
+    the chunks column matching their dimensions.
+
+    With `replace_chunks_before` (a rescrape), the resource's chunks created
+    before it are deleted in the same transaction, so search sees the old
+    chunks until the first new batch replaces them.
+
+    When chunks is partitioned the rows are inserted straight into the
+    workflow's partition, skipping tuple routing through the parent.
+
+    With a `batch_index` the chunks are one embedding batch of the resource:
+    the batch is recorded as completed and counted in processed_batches in
+    the same transaction, and nothing is saved (`already_stored`) if an
+    earlier attempt of the batch already completed it. The workflow's search
+    generation is then only bumped with the resource's last batch, rather
+    than updating the workflow row for every batch.
+
+    With the `job_id` storing the chunks, nothing is saved and
+    JobCancelledError is raised if the resource's ingestion was cancelled.
+    """
     session: Optional[Session] = None
     try:
+        embedding_column = get_embedding_column(dimensions)
         session = get_db_session()
+        lock_uncancelled_job(session, job_id)
+
+        # Locks the batch's checkpoint until commit, so duplicate attempts of
+        # the batch cannot both store it
+        if batch_index is not None and not mark_batch_completed(
+            session, resource_id, batch_index
+        ):
+            session.rollback()
+            session.close()
+            logger.info(f"Batch {batch_index} of resource {resource_id} already stored")
+            return {
+                "success": True,
+                "chunks_saved": 0,
+                "chunk_ids": [],
+                "already_stored": True,
+                "all_batches_completed": False,
+            }
 
         # Prepare chunk records for insertion
         chunk_records = []
@@ -37,20 +297,49 @@ def save_chunks_to_db(
             chunk_id = str(uuid.uuid4())
             chunk_ids.append(chunk_id)
 
-            chunk_record = Chunks(
-                id=chunk_id,
-                content=chunk_data["content"],
-                embedding=chunk_data["embedding"],
-                resource_id=resource_id,
-                workflow_id=workflow_id,
-                active=True,
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow(),
+            chunk_records.append(
+                {
+                    "id": chunk_id,
+                    "content": chunk_data["content"],
+                    "resource_id": resource_id,
+                    "workflow_id": workflow_id,
+                    "active": True,
+                    "created_at": datetime.now(timezone.utc),
+                    "updated_at": datetime.now(timezone.utc),
+                    embedding_column: chunk_data["embedding"],
+                }
             )
-            chunk_records.append(chunk_record)
 
         # Insert chunks in batch
-        session.add_all(chunk_records)
+        partition = resolve_chunks_partition(workflow_id)
+        try:
+            # A savepoint keeps the batch's completion record on a retry
+            with session.begin_nested():
+                session.execute(insert(get_chunks_table(partition)), chunk_records)
+        except Exception as e:
+            if partition == "chunks":
+                raise
+            # The workflow moved to another partition since it was cached
+            logger.warning(
+                f"Insert into {partition} failed, routing through chunks: {str(e)}"
+            )
+            chunks_partition_cache.delete(workflow_id)
+            session.execute(insert(get_chunks_table()), chunk_records)
+
+        if replace_chunks_before is not None:
+            session.execute(
+                delete(Chunks).where(
+                    Chunks.resource_id == resource_id,
+                    Chunks.workflow_id == workflow_id,
+                    Chunks.created_at < replace_chunks_before,
+                )
+            )
+
+        all_batches_completed = False
+        if batch_index is not None:
+            all_batches_completed = add_processed_batches(session, resource_id, 1)
+        if batch_index is None or all_batches_completed:
+            bump_workflow_search_generation(session, workflow_id)
         session.commit()
         session.close()
 
@@ -58,8 +347,15 @@ def save_chunks_to_db(
             "success": True,
             "chunks_saved": len(chunk_records),
             "chunk_ids": chunk_ids,
+            "already_stored": False,
+            "all_batches_completed": all_batches_completed,
         }
 
+    except JobCancelledError:
+        if session:
+            session.rollback()
+            session.close()
+        raise
     except Exception as e:
         logger.error(f"Failed to save chunks to database: {str(e)}")
         if session:
@@ -68,6 +364,310 @@ def save_chunks_to_db(
         return {"success": False, "error": str(e), "chunks_saved": 0}
 
 
+def get_workflow_embedding_dimensions(workflow_id: str) -> int:
+    """Return the embedding size configured for a workflow (cached)."""
+    cached_dimensions = workflow_dimensions_cache.get(workflow_id)
+    if cached_dimensions is not None:
+        return cached_dimensions
+
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+
+        stmt = select(Workflow.embedding_dimensions).where(Workflow.id == workflow_id)
+        dimensions = session.execute(stmt).scalar_one_or_none()
+        session.close()
+
+    except Exception as e:
+        logger.error(
+            f"Failed to get embedding dimensions for workflow {workflow_id}: {str(e)}"
+        )
+        if session:
+            session.close()
+        dimensions = None
+
+    dimensions = dimensions or EMBEDDING_DIMENSIONS
+    workflow_dimensions_cache.set(workflow_id, dimensions)
+    return dimensions
+
+
+def get_workflow_owner(workflow_id: str) -> Optional[str]:
+    """
+    Return the id of the user owning a workflow, or None if not found. Found
+    owners are cached.
+    """
+    cached_owner = workflow_owner_cache.get(workflow_id)
+    if cached_owner is not None:
+        return cached_owner
+
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+
+        stmt = select(Workflow.user_id).where(Workflow.id == workflow_id)
+        user_id = session.execute(stmt).scalar_one_or_none()
+        session.close()
+
+        if user_id is None:
+            return None
+        workflow_owner_cache.set(workflow_id, str(user_id))
+        return str(user_id)
+
+    except Exception as e:
+        logger.error(f"Failed to get owner of workflow {workflow_id}: {str(e)}")
+        if session:
+            session.close()
+        return None
+
+
+# The owner of the workflow a resource belongs to, through its knowledge or
+# its context (like CLAIM_STALLED_RESOURCES_QUERY)
+RESOURCE_OWNER_QUERY = """
+    SELECT CAST(coalesce(wk.user_id, wc.user_id) AS text) AS user_id
+    FROM resource r
+    LEFT JOIN workflow wk ON wk.knowledge_id = r.knowledge_id
+    LEFT JOIN context c ON c.id = r.context_id
+    LEFT JOIN workflow wc ON wc.id = c.workflow_id
+    WHERE r.id = :resource_id
+    LIMIT 1
+"""
+
+
+def get_resource_owner(resource_id: str) -> Optional[str]:
+    """
+    Return the id of the user owning the workflow of a resource, or None if
+    the resource or its workflow is not found.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        user_id = session.execute(
+            text(RESOURCE_OWNER_QUERY), {"resource_id": resource_id}
+        ).scalar_one_or_none()
+        session.close()
+        return user_id
+
+    except Exception as e:
+        logger.error(f"Failed to get owner of resource {resource_id}: {str(e)}")
+        if session:
+            session.close()
+        return None
+
+
+def get_workflow_search_generation(workflow_id: str) -> Optional[int]:
+    """
+    Return the generation of a workflow's chunks, which keys its cached search
+    results, or None if it cannot be read (search then bypasses the cache).
+    Cached until a bump is notified (see cache_listener.py).
+    """
+    cached_generation = workflow_generation_cache.get(workflow_id)
+    if cached_generation is not None:
+        return cached_generation
+
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+
+        stmt = select(Workflow.search_generation).where(Workflow.id == workflow_id)
+        generation = session.execute(stmt).scalar_one_or_none()
+        session.close()
+
+        if generation is not None:
+            workflow_generation_cache.set(workflow_id, generation)
+        return generation
+
+    except Exception as e:
+        logger.error(
+            f"Failed to get search generation of workflow {workflow_id}: {str(e)}"
+        )
+        if session:
+            session.close()
+        return None
+
+
+def bump_workflow_search_generation(session: Session, workflow_id: str) -> None:
+    """
+    Bump a workflow's search generation without committing, which orphans
+    its cached search results in every process. On commit, listening API
+    processes are notified to drop their cached generation.
+    """
+    session.execute(
+        update(Workflow)
+        .where(Workflow.id == workflow_id)
+        .values(search_generation=Workflow.search_generation + 1)
+    )
+    session.execute(select(func.pg_notify(SEARCH_INVALIDATION_CHANNEL, workflow_id)))
+
+
+def invalidate_workflow_search_cache(workflow_id: str) -> None:
+    """
+    Drop cached search results for a workflow whose chunks changed, in every
+    process, by bumping its search generation. Call after committing the
+    change, when it could not be bumped in the change's own transaction.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+
+        bump_workflow_search_generation(session, workflow_id)
+        session.commit()
+        session.close()
+
+    except Exception as e:
+        logger.error(
+            f"Failed to invalidate search cache of workflow {workflow_id}: {str(e)}"
+        )
+        if session:
+            session.rollback()
+            session.close()
+
+
+def set_workflow_embedding_dimensions(workflow_id: str, dimensions: int) -> bool:
+    """Switch the embedding size used to ingest and search a workflow."""
+    session: Optional[Session] = None
+    try:
+        get_embedding_column(dimensions)
+        session = get_db_session()
+
+        stmt = (
+            update(Workflow)
+            .where(Workflow.id == workflow_id)
+            .values(
+                embedding_dimensions=dimensions, updated_at=datetime.now(timezone.utc)
+            )
+        )
+        session.execute(stmt)
+        bump_workflow_search_generation(session, workflow_id)
+        session.commit()
+        session.close()
+
+        workflow_dimensions_cache.delete(workflow_id)
+        logger.info(
+            f"Set embedding dimensions of workflow {workflow_id} to {dimensions}"
+        )
+        return True
+
+    except Exception as e:
+        logger.error(
+            f"Failed to set embedding dimensions for workflow {workflow_id}: {str(e)}"
+        )
+        if session:
+            session.rollback()
+            session.close()
+        return False
+
+
+def backfill_reduced_embeddings(
+    workflow_id: str, source_dimensions: int, target_dimensions: int, batch_size: int
+) -> int:
+    """
+    Fill the reduced embedding column of up to `batch_size` chunks of a
+    workflow from a larger stored embedding. Returns the number of chunks
+    updated; call until it returns 0.
+
+    text-embedding-3 embeddings can be shortened by keeping their first
+    dimensions and re-normalizing, which is what the model returns for a
+    smaller `dimensions` parameter, so no provider calls are needed.
+    """
+    if target_dimensions >= source_dimensions:
+        raise ValueError("Target dimensions must be smaller than the source")
+
+    source_column = get_embedding_column(source_dimensions)
+    target_column = get_embedding_column(target_dimensions)
+
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+
+        result = session.execute(
+            text(
+                f"""
+                UPDATE chunks
+                SET {target_column} = l2_normalize(
+                        subvector({source_column}, 1, {target_dimensions})
+                    ),
+                    updated_at = now()
+                WHERE id IN (
+                    SELECT id FROM chunks
+                    WHERE workflow_id = :workflow_id
+                      AND {target_column} IS NULL
+                      AND {source_column} IS NOT NULL
+                    LIMIT :batch_size
+                    FOR UPDATE SKIP LOCKED
+                )
+                """
+            ),
+            {"workflow_id": workflow_id, "batch_size": batch_size},
+        )
+        session.commit()
+        session.close()
+
+        updated: int = result.rowcount  # type: ignore[attr-defined]
+        return updated
+
+    except Exception as e:
+        logger.error(
+            f"Failed to backfill reduced embeddings for workflow {workflow_id}: "
+            f"{str(e)}"
+        )
+        if session:
+            session.rollback()
+            session.close()
+        raise
+
+
+def clear_unused_embeddings(workflow_id: str, dimensions: int, batch_size: int) -> int:
+    """
+    Null out embeddings of up to `batch_size` chunks of a workflow in every
+    column other than the one for `dimensions`. Returns the number of chunks
+    updated; call until it returns 0.
+    """
+    keep_column = get_embedding_column(dimensions)
+    other_columns = [
+        get_embedding_column(size)
+        for size in SUPPORTED_EMBEDDING_DIMENSIONS
+        if size != dimensions
+    ]
+    assignments = ", ".join(f"{column} = NULL" for column in other_columns)
+    any_set = " OR ".join(f"{column} IS NOT NULL" for column in other_columns)
+
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+
+        result = session.execute(
+            text(
+                f"""
+                UPDATE chunks
+                SET {assignments}, updated_at = now()
+                WHERE id IN (
+                    SELECT id FROM chunks
+                    WHERE workflow_id = :workflow_id
+                      AND {keep_column} IS NOT NULL
+                      AND ({any_set})
+                    LIMIT :batch_size
+                    FOR UPDATE SKIP LOCKED
+                )
+                """
+            ),
+            {"workflow_id": workflow_id, "batch_size": batch_size},
+        )
+        session.commit()
+        session.close()
+
+        updated: int = result.rowcount  # type: ignore[attr-defined]
+        return updated
+
+    except Exception as e:
+        logger.error(
+            f"Failed to clear unused embeddings for workflow {workflow_id}: {str(e)}"
+        )
+        if session:
+            session.rollback()
+            session.close()
+        raise
+
+
 def update_resource_status(
     resource_id: str,
     status: str,
@@ -108,6 +708,23 @@ def update_resource_status(
             session.close()
 
 
+def update_resource_title(resource_id: str, title: str):
+    """Set the title of a resource, leaving its status untouched."""
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        stmt = update(Resource).where(Resource.id == resource_id).values(title=title)
+        session.execute(stmt)
+        session.commit()
+        session.close()
+
+    except Exception as e:
+        logger.error(f"Failed to update resource title: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+
+
 def get_resource_by_id(resource_id: str) -> Optional[Resource]:
     """Get resource by ID using SQLAlchemy."""
     session: Optional[Session] = None
@@ -127,115 +744,407 @@ def get_resource_by_id(resource_id: str) -> Optional[Resource]:
         return None
 
 
-def update_resource_total_batches(resource_id: str, total_batches: int):
-    """Update the total_batches field for a resource."""
+def get_resources_by_ids(resource_ids: List[str]) -> Dict[str, Resource]:
+    """
+    Load many resources in one `WHERE id = ANY(...)` query, keyed by id.
+    Missing ids are absent from the map; on error the map is empty.
+    """
+    if not resource_ids:
+        return {}
+
     session: Optional[Session] = None
     try:
         session = get_db_session()
 
-        stmt = (
-            update(Resource)
-            .where(Resource.id == resource_id)
-            .values(total_batches=total_batches, updated_at=datetime.utcnow())
+        stmt = select(Resource).where(
+            Resource.id
+            == any_(bindparam("resource_ids", list(resource_ids), type_=ARRAY(String)))
         )
-        session.execute(stmt)
-        session.commit()
+        resources = session.execute(stmt).scalars().all()
         session.close()
 
-        logger.info(
-            f"Updated total_batches to {total_batches} for resource {resource_id}"
-        )
+        return {resource.id: resource for resource in resources}
 
     except Exception as e:
-        logger.error(
-            f"Failed to update total_batches for resource {resource_id}: {str(e)}"
-        )
+        logger.error(f"Failed to get {len(resource_ids)} resources: {str(e)}")
         if session:
-            session.rollback()
             session.close()
+        return {}
+
 
+# Claims rescrapes that are due, like the TypeScript rescrape cron: active
+# LINK resources whose scrape_frequency period has passed since
+# last_scraped_at. Each resource is due up to :spread of its period early, by
+# an offset fixed by its id, so resources scraped together drift apart
+# instead of coming due in the same tick. Setting last_scraped_at is the
+# lease: the row lock and the re-checked due condition let only one node
+# schedule a resource per period.
+CLAIM_DUE_RESCRAPES_QUERY = """
+    WITH due AS (
+        SELECT
+            r.id,
+            coalesce(wk.id, wc.id) AS workflow_id,
+            CAST(coalesce(wk.user_id, wc.user_id) AS text) AS user_id
+        FROM resource r
+        LEFT JOIN workflow wk ON wk.knowledge_id = r.knowledge_id
+        LEFT JOIN context c ON c.id = r.context_id
+        LEFT JOIN workflow wc ON wc.id = c.workflow_id
+        WHERE r.active
+          AND r.type = 'LINK'
+          AND r.scrape_frequency <> 'NEVER'
+          AND coalesce(wk.id, wc.id) IS NOT NULL
+          AND (
+              r.last_scraped_at IS NULL
+              OR r.last_scraped_at
+                 + CASE r.scrape_frequency
+                       WHEN 'HOURLY' THEN interval '1 hour'
+                       WHEN 'DAILY' THEN interval '1 day'
+                       ELSE interval '7 days'
+                   END
+                   * (1 - :spread * ((hashtext(r.id) & 1023) / 1024.0))
+                 <= now()
+          )
+        ORDER BY r.last_scraped_at NULLS FIRST
+        LIMIT :limit
+        FOR UPDATE OF r SKIP LOCKED
+    )
+    UPDATE resource r
+    SET last_scraped_at = now()
+    FROM due
+    WHERE r.id = due.id
+    RETURNING r.id, r.url, CAST(r.type AS text) AS type, r.title, r.knowledge_id,
+              r.context_id, CAST(r.scrape_frequency AS text) AS scrape_frequency,
+              due.workflow_id, due.user_id
+"""
 
-def delete_chunks_for_resource(resource_id: str) -> bool:
-    """Delete all chunks for a resource."""
+
+def claim_due_rescrapes(limit: int, spread: float) -> List[Dict[str, Any]]:
+    """Lease up to `limit` resources whose rescrape is due (see above)."""
     session: Optional[Session] = None
     try:
         session = get_db_session()
-
-        # Delete all chunks for this resource
-        session.query(Chunks).filter(Chunks.resource_id == resource_id).delete()
+        rows = (
+            session.execute(
+                text(CLAIM_DUE_RESCRAPES_QUERY), {"limit": limit, "spread": spread}
+            )
+            .mappings()
+            .all()
+        )
         session.commit()
         session.close()
-
-        logger.info(f"Deleted all chunks for resource {resource_id}")
-        return True
+        return [dict(row) for row in rows]
 
     except Exception as e:
-        logger.error(f"Failed to delete chunks for resource {resource_id}: {str(e)}")
+        logger.error(f"Failed to claim due rescrapes: {str(e)}")
         if session:
             session.rollback()
             session.close()
-        return False
+        return []
 
 
-def increment_processed_batches(resource_id: str, batch_count: int = 1) -> bool:
+def save_resource_batches(
+    resource_id: str,
+    batches: List[List[Dict[str, Any]]],
+    job_id: Optional[str] = None,
+    replace_chunks_before: Optional[datetime] = None,
+) -> None:
     """
-    Atomically increment processed_batches and check if all batches are completed.
-    Returns True if all batches are now processed, False otherwise.
+    Checkpoint the chunked embedding batches of a resource, replacing those of
+    an earlier ingestion, and reset its batch progress to 0/len(batches), in
+    one transaction. Each batch is a list of chunk dicts. The cutoff of a
+    rescrape is stored with them, so a recovered ingestion still replaces the
+    old chunks. Raises JobCancelledError if the ingestion of `job_id` was
+    cancelled.
     """
     session: Optional[Session] = None
     try:
         session = get_db_session()
+        lock_uncancelled_job(session, job_id)
 
-        # Get current resource state
-        select_stmt = select(Resource).where(Resource.id == resource_id)
-        resource = session.execute(select_stmt).scalar_one_or_none()
-
-        if not resource:
-            logger.error(f"Resource {resource_id} not found")
+        session.execute(
+            delete(ResourceBatch).where(ResourceBatch.resource_id == resource_id)
+        )
+        if batches:
+            session.execute(
+                insert(ResourceBatch),
+                [
+                    {
+                        "resource_id": resource_id,
+                        "batch_index": index,
+                        "chunks": chunks,
+                        "created_at": datetime.now(timezone.utc),
+                        "updated_at": datetime.now(timezone.utc),
+                    }
+                    for index, chunks in enumerate(batches)
+                ],
+            )
+        session.execute(
+            update(Resource)
+            .where(Resource.id == resource_id)
+            .values(
+                total_batches=len(batches),
+                processed_batches=0,
+                replace_chunks_before=replace_chunks_before,
+                updated_at=datetime.now(timezone.utc),
+            )
+        )
+        session.commit()
+        session.close()
+
+        logger.info(f"Checkpointed {len(batches)} batches of resource {resource_id}")
+
+    except JobCancelledError:
+        if session:
+            session.rollback()
             session.close()
-            return False
+        raise
+    except Exception as e:
+        logger.error(
+            f"Failed to checkpoint batches of resource {resource_id}: {str(e)}"
+        )
+        if session:
+            session.rollback()
+            session.close()
+        raise
+
+
+def get_resource_batch(resource_id: str, batch_index: int) -> Optional[Dict[str, Any]]:
+    """
+    Return the checkpoint of an embedding batch: its chunks, or
+    `completed` once it is stored. None if the batch is not checkpointed.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        batch = session.get(ResourceBatch, (resource_id, batch_index))
+        session.close()
 
-        new_processed_batches = resource.processed_batches + batch_count
+        if batch is None:
+            return None
+        return {
+            "chunks": batch.chunks or [],
+            "completed": batch.completed_at is not None,
+        }
 
-        # Check if all batches are completed
-        all_batches_completed = new_processed_batches >= resource.total_batches
+    except Exception as e:
+        logger.error(
+            f"Failed to get batch {batch_index} of resource {resource_id}: {str(e)}"
+        )
+        if session:
+            session.close()
+        raise
 
-        if all_batches_completed:
-            # Update both processed_batches and last_scraped_at
-            update_stmt = (
-                update(Resource)
-                .where(Resource.id == resource_id)
-                .values(
-                    processed_batches=min(
-                        new_processed_batches, resource.total_batches
-                    ),
-                    last_scraped_at=datetime.utcnow(),
-                    updated_at=datetime.utcnow(),
-                )
-            )
-            logger.info(
-                f"All {resource.total_batches} batches completed for resource "
-                f"{resource_id}. Updated last_scraped_at."
-            )
+
+class JobCancelledError(Exception):
+    """The ingestion of a job's resource was cancelled while it ran."""
+
+
+def lock_uncancelled_job(session: Session, job_id: Optional[str]) -> None:
+    """
+    Lock a job's row until commit, without committing, and raise
+    JobCancelledError if it was cancelled. cancel_resource_ingestion updates
+    the same row first, so a job's writes either commit before the
+    cancellation (which then deletes them) or are rolled back.
+    """
+    if job_id is None:
+        return
+    job_status = session.execute(
+        text(
+            """
+            SELECT CAST(status AS text) FROM ingestion_job
+            WHERE id = :job_id
+            FOR UPDATE
+            """
+        ),
+        {"job_id": job_id},
+    ).scalar_one_or_none()
+    if job_status == "CANCELLED":
+        raise JobCancelledError(f"Job {job_id} was cancelled")
+
+
+def mark_batch_completed(session: Session, resource_id: str, batch_index: int) -> bool:
+    """
+    Record a batch as completed (dropping its checkpointed chunks) without
+    committing. Returns False if it already was. Batches queued before
+    checkpoints existed get a completion record too.
+    """
+    completed = session.execute(
+        pg_insert(ResourceBatch)
+        .values(
+            resource_id=resource_id,
+            batch_index=batch_index,
+            completed_at=func.now(),
+            created_at=func.now(),
+            updated_at=func.now(),
+        )
+        .on_conflict_do_update(
+            index_elements=["resource_id", "batch_index"],
+            set_={
+                "chunks": null(),
+                "completed_at": func.now(),
+                "updated_at": func.now(),
+            },
+            where=ResourceBatch.completed_at.is_(None),
+        )
+        .returning(ResourceBatch.batch_index)
+    ).first()
+    return completed is not None
+
+
+def complete_resource_batch(
+    resource_id: str, batch_index: int, job_id: Optional[str] = None
+) -> Dict[str, bool]:
+    """
+    Record a batch without chunks to store as completed and count it in
+    processed_batches, atomically. `already_stored` if an earlier attempt did.
+    Raises JobCancelledError if the ingestion of `job_id` was cancelled.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        lock_uncancelled_job(session, job_id)
+        if not mark_batch_completed(session, resource_id, batch_index):
+            session.rollback()
+            session.close()
+            return {"already_stored": True, "all_batches_completed": False}
+
+        all_batches_completed = add_processed_batches(session, resource_id, 1)
+        session.commit()
+        session.close()
+        return {"already_stored": False, "all_batches_completed": all_batches_completed}
+
+    except JobCancelledError:
+        if session:
+            session.rollback()
+            session.close()
+        raise
+    except Exception as e:
+        logger.error(
+            f"Failed to complete batch {batch_index} of resource {resource_id}: "
+            f"{str(e)}"
+        )
+        if session:
+            session.rollback()
+            session.close()
+        raise
+
+
+def delete_chunks_for_resource(
+    resource_id: str,
+    workflow_id: Optional[str] = None,
+    created_before: Optional[datetime] = None,
+) -> bool:
+    """
+    Delete all chunks for a resource, or only those created before
+    `created_before`. Passing the resource's workflow lets Postgres prune the
+    delete to that workflow's partition.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+
+        query = session.query(Chunks).filter(Chunks.resource_id == resource_id)
+        if created_before is not None:
+            query = query.filter(Chunks.created_at < created_before)
+        if workflow_id:
+            query = query.filter(Chunks.workflow_id == workflow_id)
+            workflow_ids: Sequence[str] = [workflow_id]
         else:
-            # Update only processed_batches
-            update_stmt = (
-                update(Resource)
-                .where(Resource.id == resource_id)
-                .values(
-                    processed_batches=new_processed_batches,
-                    updated_at=datetime.utcnow(),
+            # Workflows whose cached search results include this resource
+            workflow_ids = (
+                session.execute(
+                    select(Chunks.workflow_id)
+                    .where(Chunks.resource_id == resource_id)
+                    .distinct()
                 )
-            )
-            logger.info(
-                f"Processed batch for resource {resource_id}. Progress: "
-                f"{new_processed_batches}/{resource.total_batches}"
+                .scalars()
+                .all()
             )
 
-        session.execute(update_stmt)
+        # Delete the chunks for this resource
+        deleted = query.delete(synchronize_session=False)
+        if deleted:
+            for workflow_id in workflow_ids:
+                bump_workflow_search_generation(session, workflow_id)
         session.commit()
         session.close()
 
+        logger.info(f"Deleted {deleted} chunks for resource {resource_id}")
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to delete chunks for resource {resource_id}: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        return False
+
+
+def add_processed_batches(session: Session, resource_id: str, batch_count: int) -> bool:
+    """
+    Increment processed_batches without committing. Returns True if all
+    batches are now processed.
+    """
+    row = (
+        session.execute(
+            text(
+                """
+                UPDATE resource
+                SET processed_batches = least(
+                        processed_batches + :batch_count, total_batches
+                    ),
+                    last_scraped_at = CASE
+                        WHEN processed_batches + :batch_count >= total_batches
+                        THEN now() ELSE last_scraped_at
+                    END,
+                    updated_at = now()
+                WHERE id = :resource_id
+                  AND processed_batches < total_batches
+                RETURNING processed_batches, total_batches
+                """
+            ),
+            {"resource_id": resource_id, "batch_count": batch_count},
+        )
+        .mappings()
+        .first()
+    )
+
+    if not row:
+        logger.error(
+            f"Resource {resource_id} not found or all its batches already done"
+        )
+        return False
+
+    all_batches_completed: bool = row["processed_batches"] >= row["total_batches"]
+    if all_batches_completed:
+        logger.info(
+            f"All {row['total_batches']} batches completed for resource "
+            f"{resource_id}. Updated last_scraped_at."
+        )
+    else:
+        logger.info(
+            f"Processed batch for resource {resource_id}. Progress: "
+            f"{row['processed_batches']}/{row['total_batches']}"
+        )
+
+    return all_batches_completed
+
+
+def increment_processed_batches(resource_id: str, batch_count: int = 1) -> bool:
+    """
+    Atomically increment processed_batches and check if all batches are completed.
+    Returns True if all batches are now processed, False otherwise.
+
+    The increment is a single UPDATE so batches finishing at the same time in
+    different worker processes cannot lose each other's progress, and exactly
+    one of them sees the resource complete.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        all_batches_completed = add_processed_batches(session, resource_id, batch_count)
+        session.commit()
+        session.close()
         return all_batches_completed
 
     except Exception as e:
@@ -247,3 +1156,922 @@ def increment_processed_batches(resource_id: str, batch_count: int = 1) -> bool:
             session.rollback()
             session.close()
         return False
+
+
+def add_workflow_usage(usage: Dict[str, Dict[str, int]]) -> bool:
+    """
+    Add the bytes and resources ingested per workflow to their durable usage
+    totals, in one statement. Returns False if nothing was written.
+    """
+    if not usage:
+        return True
+
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        session.execute(
+            text(
+                """
+                INSERT INTO workflow_usage (
+                    workflow_id, ingested_bytes, ingested_resources, updated_at
+                )
+                SELECT workflow_id, ingested_bytes, ingested_resources, now()
+                FROM unnest(
+                    CAST(:workflow_ids AS varchar[]),
+                    CAST(:ingested_bytes AS bigint[]),
+                    CAST(:ingested_resources AS integer[])
+                ) AS usage(workflow_id, ingested_bytes, ingested_resources)
+                ON CONFLICT (workflow_id) DO UPDATE
+                SET ingested_bytes =
+                        workflow_usage.ingested_bytes + EXCLUDED.ingested_bytes,
+                    ingested_resources =
+                        workflow_usage.ingested_resources
+                        + EXCLUDED.ingested_resources,
+                    updated_at = now()
+                """
+            ),
+            {
+                "workflow_ids": list(usage),
+                "ingested_bytes": [totals["bytes"] for totals in usage.values()],
+                "ingested_resources": [
+                    totals["resources"] for totals in usage.values()
+                ],
+            },
+        )
+        session.commit()
+        session.close()
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to record usage of {len(usage)} workflows: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        return False
+
+
+def enqueue_jobs(jobs: List[Dict[str, Any]]) -> List[str]:
+    """
+    Insert ingestion jobs in one transaction. Each job needs a type,
+    resource_id, workflow_id and payload, and may set a delay in seconds.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        job_ids = add_jobs_to_session(session, jobs)
+        session.commit()
+        session.close()
+        return job_ids
+
+    except Exception as e:
+        logger.error(f"Failed to enqueue {len(jobs)} ingestion jobs: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        raise
+
+
+def get_job_row(
+    job: Dict[str, Any], locked_by: Optional[str] = None, lease_seconds: int = 0
+) -> Dict[str, Any]:
+    """Return the ingestion_job column values of a job to insert."""
+    leased = bool(job.get("leased") and locked_by)
+    return {
+        "id": job.get("id") or str(uuid.uuid4()),
+        "type": job["type"],
+        "status": "RUNNING" if leased else "QUEUED",
+        "payload": job["payload"],
+        "attempts": 1 if leased else 0,
+        "max_attempts": job.get("max_attempts", settings.JOB_MAX_ATTEMPTS),
+        "run_at": datetime.now(timezone.utc)
+        + timedelta(seconds=job.get("delay_seconds", 0)),
+        "locked_by": locked_by if leased else None,
+        "locked_until": datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+        if leased
+        else None,
+        "resource_id": job["resource_id"],
+        "workflow_id": job["workflow_id"],
+        "user_id": job.get("user_id"),
+        "priority": job.get("priority", 0),
+        "created_at": datetime.now(timezone.utc),
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+def add_jobs_to_session(
+    session: Session,
+    jobs: List[Dict[str, Any]],
+    locked_by: Optional[str] = None,
+    lease_seconds: int = 0,
+) -> List[str]:
+    """
+    Add ingestion jobs to a session without committing it. Jobs flagged
+    `leased` are inserted already claimed by `locked_by`, so the worker that
+    produced them can run them without going through the queue.
+    """
+    job_ids = []
+    for job in jobs:
+        row = get_job_row(job, locked_by, lease_seconds)
+        job_ids.append(row["id"])
+        session.add(IngestionJob(**row))
+    return job_ids
+
+
+def get_stream_batch_job_id(stream_id: str, batch_index: int) -> str:
+    """
+    Id of the EMBED_BATCH job of a stream's batch: deterministic, so a retried
+    stream skips the batches it already queued.
+    """
+    return f"{stream_id}:{batch_index}"
+
+
+def start_resource_batch_stream(
+    resource_id: str,
+    stream_id: str,
+    stream_batch_index: int,
+    replace_chunks_before: Optional[datetime] = None,
+):
+    """
+    Prepare a resource for batches dispatched while its text is still being
+    extracted: total_batches starts at 1 for the stream itself, so no batch
+    can complete the resource before the stream ends, and the checkpoints of
+    an earlier ingestion are replaced by the stream's own pseudo-batch
+    `stream_batch_index`. Skipped on a retry of a stream that already
+    dispatched batches: they are dispatched in order, so its first batch job
+    exists (a primary key lookup). The cutoff of a rescrape
+    is stored like in save_resource_batches. The stream is its EXTRACT job:
+    raises JobCancelledError if it was cancelled.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        lock_uncancelled_job(session, stream_id)
+        started = session.execute(
+            text(
+                """
+                UPDATE resource
+                SET total_batches = 1,
+                    processed_batches = 0,
+                    replace_chunks_before = :replace_chunks_before,
+                    updated_at = now()
+                WHERE id = :resource_id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM ingestion_job WHERE id = :first_batch_id
+                  )
+                RETURNING id
+                """
+            ),
+            {
+                "resource_id": resource_id,
+                "first_batch_id": get_stream_batch_job_id(stream_id, 0),
+                "replace_chunks_before": replace_chunks_before,
+            },
+        ).first()
+        if started:
+            session.execute(
+                delete(ResourceBatch).where(ResourceBatch.resource_id == resource_id)
+            )
+            session.execute(
+                insert(ResourceBatch).values(
+                    resource_id=resource_id,
+                    batch_index=stream_batch_index,
+                    created_at=func.now(),
+                    updated_at=func.now(),
+                )
+            )
+        session.commit()
+        session.close()
+
+    except JobCancelledError:
+        if session:
+            session.rollback()
+            session.close()
+        raise
+    except Exception as e:
+        logger.error(
+            f"Failed to start batch stream of resource {resource_id}: {str(e)}"
+        )
+        if session:
+            session.rollback()
+            session.close()
+        raise
+
+
+def enqueue_stream_batch_job(
+    job: Dict[str, Any], chunks: List[Dict[str, Any]], stream_id: Optional[str] = None
+) -> bool:
+    """
+    Queue an EMBED_BATCH job of a stream, checkpoint its chunks and count it
+    in the resource's total_batches, atomically. Returns False, changing
+    nothing, when a previous attempt of the stream already queued a job with
+    the same id. Raises JobCancelledError, queueing nothing, if the stream's
+    job was cancelled.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        lock_uncancelled_job(session, stream_id)
+        inserted = session.execute(
+            pg_insert(IngestionJob)
+            .values(**get_job_row(job))
+            .on_conflict_do_nothing(index_elements=["id"])
+            .returning(IngestionJob.id)
+        ).first()
+        if inserted:
+            session.execute(
+                insert(ResourceBatch).values(
+                    resource_id=job["resource_id"],
+                    batch_index=job["payload"]["batch_index"],
+                    chunks=chunks,
+                    created_at=func.now(),
+                    updated_at=func.now(),
+                )
+            )
+            session.execute(
+                update(Resource)
+                .where(Resource.id == job["resource_id"])
+                .values(total_batches=Resource.total_batches + 1)
+            )
+        session.commit()
+        session.close()
+        return inserted is not None
+
+    except JobCancelledError:
+        if session:
+            session.rollback()
+            session.close()
+        raise
+    except Exception as e:
+        logger.error(f"Failed to enqueue stream batch job {job.get('id')}: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        raise
+
+
+# Claims resources whose ingestion stalled: still PENDING with checkpointed
+# batches, but without a queued or running job left to finish them (e.g. the
+# jobs were lost or pruned). Each comes with the batches still to store, and
+# whether its stream (a negative pseudo-batch) never finished extracting.
+# Bumping updated_at is the lease: the row lock and the re-checked age let
+# only one node recover a resource, and an unrecovered one is retried once
+# :min_age has passed again.
+CLAIM_STALLED_RESOURCES_QUERY = """
+    WITH stalled AS (
+        SELECT
+            r.id,
+            coalesce(wk.id, wc.id) AS workflow_id,
+            CAST(coalesce(wk.user_id, wc.user_id) AS text) AS user_id
+        FROM resource r
+        LEFT JOIN workflow wk ON wk.knowledge_id = r.knowledge_id
+        LEFT JOIN context c ON c.id = r.context_id
+        LEFT JOIN workflow wc ON wc.id = c.workflow_id
+        WHERE r.status = 'PENDING'
+          AND r.updated_at < now() - make_interval(secs => :min_age)
+          AND coalesce(wk.id, wc.id) IS NOT NULL
+          AND EXISTS (SELECT 1 FROM resource_batch b WHERE b.resource_id = r.id)
+          AND NOT EXISTS (
+              SELECT 1 FROM ingestion_job j
+              WHERE j.resource_id = r.id AND j.status IN ('QUEUED', 'RUNNING')
+          )
+        ORDER BY r.updated_at
+        LIMIT :limit
+        FOR UPDATE OF r SKIP LOCKED
+    )
+    UPDATE resource r
+    SET updated_at = now()
+    FROM stalled
+    WHERE r.id = stalled.id
+    RETURNING r.id, r.url, CAST(r.type AS text) AS type, r.title, r.file_size,
+              r.knowledge_id, r.context_id, r.replace_chunks_before,
+              stalled.workflow_id, stalled.user_id,
+              ARRAY(
+                  SELECT b.batch_index FROM resource_batch b
+                  WHERE b.resource_id = r.id
+                    AND b.batch_index >= 0
+                    AND b.completed_at IS NULL
+                  ORDER BY b.batch_index
+              ) AS missing_batches,
+              EXISTS (
+                  SELECT 1 FROM resource_batch b
+                  WHERE b.resource_id = r.id
+                    AND b.batch_index < 0
+                    AND b.completed_at IS NULL
+              ) AS stream_unfinished
+"""
+
+
+def claim_stalled_resources(min_age_seconds: int, limit: int) -> List[Dict[str, Any]]:
+    """Lease up to `limit` resources whose ingestion stalled (see above)."""
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        rows = (
+            session.execute(
+                text(CLAIM_STALLED_RESOURCES_QUERY),
+                {"min_age": min_age_seconds, "limit": limit},
+            )
+            .mappings()
+            .all()
+        )
+        session.commit()
+        session.close()
+        return [dict(row) for row in rows]
+
+    except Exception as e:
+        logger.error(f"Failed to claim stalled resources: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        return []
+
+
+def get_pending_job_counts(
+    workflow_id: Optional[str] = None,
+) -> Optional[Dict[str, int]]:
+    """
+    Count queued and running ingestion jobs, in total and for a workflow.
+    Returns None if the counts could not be read.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        row = (
+            session.execute(
+                text(
+                    """
+                    SELECT count(*) AS pending_jobs,
+                           count(*) FILTER (WHERE workflow_id = :workflow_id)
+                               AS workflow_pending_jobs
+                    FROM ingestion_job
+                    WHERE status IN ('QUEUED', 'RUNNING')
+                    """
+                ),
+                {"workflow_id": workflow_id},
+            )
+            .mappings()
+            .one()
+        )
+        session.close()
+        return dict(row)
+
+    except Exception as e:
+        logger.error(f"Failed to count pending ingestion jobs: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        return None
+
+
+# Runnable jobs: queued ones that are due, and RUNNING ones whose lease
+# expired (their worker died or hung), which are claimed again
+RUNNABLE_JOB_CONDITION = """
+    (j.status = 'QUEUED' AND j.run_at <= now())
+    OR (j.status = 'RUNNING' AND j.locked_until < now())
+"""
+
+# Fair-share claim. Jobs are taken in priority lanes (interactive uploads
+# before rescrapes, unless a rescrape has waited :max_lane_wait seconds), and
+# within a lane by their turn in a round-robin over workflows and over users:
+# a job's position in its workflow's (user's) backlog plus the jobs that
+# workflow (user) already has running, the workflow's scaled down by its
+# weight. A workflow with thousands of queued files thus gets one claim per
+# round like one with a single file, instead of everything in arrival order.
+# Only the head of each backlog can win a turn, so only each workflow's
+# first :limit due jobs are ranked, not every runnable job: the workflows
+# with queued jobs are found by skipping through the status/workflow index
+# (one probe per workflow), and each one's head read in order from it.
+# Expired leases are few (bounded by the workers) and all ranked. Ranking
+# needs window functions, which cannot lock rows, so the best :candidates
+# are ranked first and :limit of them locked.
+CLAIM_JOBS_QUERY = f"""
+    WITH RECURSIVE queued_workflows AS (
+        (
+            SELECT workflow_id
+            FROM ingestion_job
+            WHERE status = 'QUEUED'
+            ORDER BY workflow_id
+            LIMIT 1
+        )
+        UNION ALL
+        SELECT (
+            SELECT j.workflow_id
+            FROM ingestion_job j
+            WHERE j.status = 'QUEUED' AND j.workflow_id > q.workflow_id
+            ORDER BY j.workflow_id
+            LIMIT 1
+        )
+        FROM queued_workflows q
+        WHERE q.workflow_id IS NOT NULL
+    ),
+    candidates AS (
+        SELECT h.*
+        FROM queued_workflows q
+        CROSS JOIN LATERAL (
+            SELECT j.id, j.workflow_id, j.user_id, j.priority, j.run_at
+            FROM ingestion_job j
+            WHERE j.status = 'QUEUED'
+              AND j.workflow_id = q.workflow_id
+              AND j.run_at <= now()
+              AND CAST(j.type AS text) = ANY(:job_types)
+            ORDER BY j.priority, j.run_at
+            LIMIT :limit
+        ) h
+        UNION ALL
+        SELECT j.id, j.workflow_id, j.user_id, j.priority, j.run_at
+        FROM ingestion_job j
+        WHERE j.status = 'RUNNING'
+          AND j.locked_until < now()
+          AND CAST(j.type AS text) = ANY(:job_types)
+    ),
+    running_workflows AS (
+        SELECT workflow_id, count(*) AS running
+        FROM ingestion_job
+        WHERE status = 'RUNNING' AND locked_until >= now()
+        GROUP BY workflow_id
+    ),
+    running_users AS (
+        SELECT user_id, count(*) AS running
+        FROM ingestion_job
+        WHERE status = 'RUNNING' AND locked_until >= now() AND user_id IS NOT NULL
+        GROUP BY user_id
+    ),
+    ranked AS (
+        SELECT
+            j.id,
+            j.run_at,
+            CASE
+                WHEN j.run_at < now() - make_interval(secs => :max_lane_wait) THEN 0
+                ELSE j.priority
+            END AS lane,
+            greatest(
+                (
+                    row_number() OVER (
+                        PARTITION BY j.workflow_id ORDER BY j.priority, j.run_at
+                    )
+                    + coalesce(rw.running, 0)
+                )
+                / coalesce(
+                    CAST(CAST(:weights AS jsonb) ->> j.workflow_id AS float), 1
+                ),
+                row_number() OVER (
+                    PARTITION BY coalesce(j.user_id, j.workflow_id)
+                    ORDER BY j.priority, j.run_at
+                )
+                + coalesce(ru.running, 0)
+            ) AS turn
+        FROM candidates j
+        LEFT JOIN running_workflows rw ON rw.workflow_id = j.workflow_id
+        LEFT JOIN running_users ru ON ru.user_id = j.user_id
+        ORDER BY lane, turn, j.run_at
+        LIMIT :candidates
+    ),
+    claimable AS (
+        SELECT j.id
+        FROM ingestion_job j
+        JOIN ranked r ON r.id = j.id
+        WHERE ({RUNNABLE_JOB_CONDITION})
+        ORDER BY r.lane, r.turn, r.run_at
+        LIMIT :limit
+        FOR UPDATE OF j SKIP LOCKED
+    )
+    UPDATE ingestion_job j
+    SET status = 'RUNNING',
+        attempts = j.attempts + 1,
+        locked_by = :worker_id,
+        locked_until = now() + make_interval(secs => :visibility_timeout),
+        updated_at = now()
+    FROM claimable c
+    WHERE j.id = c.id
+    RETURNING j.id, CAST(j.type AS text) AS type, j.payload, j.attempts,
+              j.max_attempts, j.resource_id, j.workflow_id, j.user_id, j.priority
+"""
+
+
+def claim_jobs(
+    worker_id: str,
+    job_types: List[str],
+    limit: int,
+    visibility_timeout: int,
+) -> List[Dict[str, Any]]:
+    """
+    Lease up to `limit` runnable jobs of the given types to a worker for
+    `visibility_timeout` seconds, fairly across users and workflows (see
+    CLAIM_JOBS_QUERY). Concurrent workers skip each other's rows.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        rows = (
+            session.execute(
+                text(CLAIM_JOBS_QUERY),
+                {
+                    "worker_id": worker_id,
+                    "job_types": list(job_types),
+                    "limit": limit,
+                    "candidates": limit * settings.SCHEDULER_CANDIDATES_FACTOR,
+                    "visibility_timeout": visibility_timeout,
+                    "max_lane_wait": settings.SCHEDULER_MAX_LANE_WAIT_SECONDS,
+                    "weights": json.dumps(settings.SCHEDULER_WORKFLOW_WEIGHTS),
+                },
+            )
+            .mappings()
+            .all()
+        )
+        session.commit()
+        session.close()
+        return [dict(row) for row in rows]
+
+    except Exception as e:
+        logger.error(f"Failed to claim ingestion jobs: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        return []
+
+
+def extend_job_leases(
+    job_ids: List[str], worker_id: str, visibility_timeout: int
+) -> List[str]:
+    """
+    Push back the leases of a worker's running jobs in one statement. Returns
+    the ids still held; the others were lost to another worker.
+    """
+    if not job_ids:
+        return []
+
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        rows = session.execute(
+            text(
+                """
+                UPDATE ingestion_job
+                SET locked_until = now() + make_interval(secs => :visibility_timeout)
+                WHERE id = ANY(:job_ids)
+                  AND locked_by = :worker_id
+                  AND status = 'RUNNING'
+                RETURNING id
+                """
+            ),
+            {
+                "job_ids": list(job_ids),
+                "worker_id": worker_id,
+                "visibility_timeout": visibility_timeout,
+            },
+        ).all()
+        session.commit()
+        session.close()
+        return [row.id for row in rows]
+
+    except Exception as e:
+        logger.error(f"Failed to extend leases of {len(job_ids)} jobs: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        # Unknown, not lost: keep running and retry on the next heartbeat
+        return list(job_ids)
+
+
+def complete_job(
+    job_id: str,
+    worker_id: str,
+    follow_up_jobs: Optional[List[Dict[str, Any]]] = None,
+    lease_seconds: int = 0,
+) -> bool:
+    """
+    Mark a job as succeeded and enqueue the jobs it produced, atomically. The
+    payload is cleared since it can hold a whole document. Follow-up jobs
+    flagged `leased` are leased to the same worker for `lease_seconds`.
+    Returns False, enqueuing nothing, if the lease expired and another worker
+    took the job.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        result = session.execute(
+            text(
+                """
+                UPDATE ingestion_job
+                SET status = 'SUCCEEDED',
+                    payload = '{}'::jsonb,
+                    locked_until = NULL,
+                    last_error = NULL,
+                    updated_at = now()
+                WHERE id = :job_id AND locked_by = :worker_id AND status = 'RUNNING'
+                """
+            ),
+            {"job_id": job_id, "worker_id": worker_id},
+        )
+        if not result.rowcount:  # type: ignore[attr-defined]
+            session.rollback()
+            session.close()
+            logger.warning(f"Lost the lease of job {job_id} before completing it")
+            return False
+
+        add_jobs_to_session(session, follow_up_jobs or [], worker_id, lease_seconds)
+        session.commit()
+        session.close()
+        return True
+
+    except Exception as e:
+        logger.error(f"Failed to complete job {job_id}: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        raise
+
+
+def fail_job(
+    job_id: str,
+    worker_id: str,
+    error: str,
+    retry_delay_seconds: float,
+    retry: bool = True,
+) -> Optional[str]:
+    """
+    Record a failed attempt. The job is queued again after the delay unless
+    it is out of attempts or `retry` is False. Returns the new status, or None
+    if the worker no longer holds the job.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        new_status = session.execute(
+            text(
+                """
+                UPDATE ingestion_job
+                SET status = CASE
+                        WHEN :retry AND attempts < max_attempts
+                        THEN 'QUEUED'::ingestion_job_status
+                        ELSE 'FAILED'::ingestion_job_status
+                    END,
+                    run_at = now() + make_interval(secs => :retry_delay),
+                    locked_by = NULL,
+                    locked_until = NULL,
+                    last_error = :error,
+                    updated_at = now()
+                WHERE id = :job_id AND locked_by = :worker_id AND status = 'RUNNING'
+                RETURNING CAST(status AS text)
+                """
+            ),
+            {
+                "job_id": job_id,
+                "worker_id": worker_id,
+                "error": error[:4000],
+                "retry_delay": retry_delay_seconds,
+                "retry": retry,
+            },
+        ).scalar_one_or_none()
+        session.commit()
+        session.close()
+        return new_status
+
+    except Exception as e:
+        logger.error(f"Failed to record failure of job {job_id}: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        return None
+
+
+def release_jobs(job_ids: List[str], worker_id: str) -> int:
+    """
+    Hand a worker's running jobs back to the queue, runnable at once, when it
+    shuts down before finishing them. The interrupted attempt is not counted.
+    Returns the number of jobs released.
+    """
+    if not job_ids:
+        return 0
+
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        result = session.execute(
+            text(
+                """
+                UPDATE ingestion_job
+                SET status = 'QUEUED',
+                    attempts = greatest(attempts - 1, 0),
+                    run_at = now(),
+                    locked_by = NULL,
+                    locked_until = NULL,
+                    updated_at = now()
+                WHERE id = ANY(:job_ids)
+                  AND locked_by = :worker_id
+                  AND status = 'RUNNING'
+                """
+            ),
+            {"job_ids": list(job_ids), "worker_id": worker_id},
+        )
+        session.commit()
+        session.close()
+        released: int = result.rowcount  # type: ignore[attr-defined]
+        return released
+
+    except Exception as e:
+        logger.error(f"Failed to release {len(job_ids)} jobs: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        # Claimed again by another worker once their leases expire
+        return 0
+
+
+def cancel_resource_ingestion(resource_id: str) -> Optional[int]:
+    """
+    Cancel the ingestion of a resource: mark its queued and running jobs
+    CANCELLED, drop its batch checkpoints so it is not recovered, delete the
+    chunks it stored, and fail it if it was still PENDING. Returns the number
+    of jobs cancelled, or None if the resource does not exist.
+
+    Updating the job rows waits for the writes of a running job, which lock
+    their job row (see lock_uncancelled_job): those that committed first are
+    deleted here, later ones see the job CANCELLED and roll back.
+    """
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        resource = session.execute(
+            select(Resource.id).where(Resource.id == resource_id)
+        ).first()
+        if not resource:
+            session.rollback()
+            session.close()
+            return None
+
+        # Each statement sees the follow-up jobs that jobs completing
+        # concurrently committed, so repeat until none is left
+        cancelled_jobs = 0
+        while True:
+            cancelled = session.execute(
+                text(
+                    """
+                    UPDATE ingestion_job
+                    SET status = 'CANCELLED',
+                        payload = '{}'::jsonb,
+                        locked_until = NULL,
+                        last_error = 'Cancelled',
+                        updated_at = now()
+                    WHERE resource_id = :resource_id
+                      AND status IN ('QUEUED', 'RUNNING')
+                    """
+                ),
+                {"resource_id": resource_id},
+            ).rowcount  # type: ignore[attr-defined]
+            if not cancelled:
+                break
+            cancelled_jobs += cancelled
+
+        session.execute(
+            delete(ResourceBatch).where(ResourceBatch.resource_id == resource_id)
+        )
+        session.execute(
+            update(Resource)
+            .where(Resource.id == resource_id, Resource.status == "PENDING")
+            .values(status="FAILED", updated_at=datetime.now(timezone.utc))
+        )
+        workflow_ids = (
+            session.execute(
+                select(Chunks.workflow_id)
+                .where(Chunks.resource_id == resource_id)
+                .distinct()
+            )
+            .scalars()
+            .all()
+        )
+        session.execute(delete(Chunks).where(Chunks.resource_id == resource_id))
+        for workflow_id in workflow_ids:
+            bump_workflow_search_generation(session, workflow_id)
+        session.commit()
+        session.close()
+
+        logger.info(
+            f"Cancelled {cancelled_jobs} ingestion jobs of resource {resource_id}"
+        )
+        return cancelled_jobs
+
+    except Exception as e:
+        logger.error(f"Failed to cancel ingestion of resource {resource_id}: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        raise
+
+
+def get_cancelled_job_ids(job_ids: List[str]) -> List[str]:
+    """Return which of the given jobs were cancelled."""
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+        rows = session.execute(
+            text(
+                """
+                SELECT id FROM ingestion_job
+                WHERE id = ANY(:job_ids) AND status = 'CANCELLED'
+                """
+            ),
+            {"job_ids": list(job_ids)},
+        ).all()
+        session.close()
+        return [row.id for row in rows]
+
+    except Exception as e:
+        logger.error(f"Failed to check {len(job_ids)} jobs for cancellation: {str(e)}")
+        if session:
+            session.close()
+        return []
+
+
+def search_chunks(
+    embedding: List[float],
+    workflow_id: str,
+    knowledge_id: Optional[str] = None,
+    context_ids: Optional[List[str]] = None,
+    limit: int = 4,
+    ef_search: Optional[int] = None,
+    quantization: Optional[str] = None,
+    exact: bool = False,
+    dimensions: int = EMBEDDING_DIMENSIONS,
+) -> List[Dict[str, Any]]:
+    """
+    Return the chunks closest to an embedding within a workflow, optionally
+    restricted to resources of a knowledge base and/or contexts.
+
+    `dimensions` selects the chunks column to search and must match the size
+    of `embedding`. With `exact`, index scans are disabled so the result is
+    the true top-k (used as ground truth when benchmarking the approximate
+    indexes).
+    """
+    quantization = quantization or settings.SEARCH_QUANTIZATION
+    if quantization not in SEARCH_QUANTIZATIONS:
+        raise ValueError(f"Unsupported search quantization: {quantization}")
+
+    session: Optional[Session] = None
+    try:
+        session = get_db_session()
+
+        if exact:
+            session.execute(text("SET LOCAL enable_indexscan = off"))
+            session.execute(text("SET LOCAL enable_bitmapscan = off"))
+
+        # Search parameters only apply to the current transaction
+        session.execute(
+            text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+            {"ef_search": str(ef_search or settings.SEARCH_HNSW_EF_SEARCH)},
+        )
+        session.execute(
+            text("SELECT set_config('ivfflat.probes', :probes, true)"),
+            {"probes": str(settings.SEARCH_IVFFLAT_PROBES)},
+        )
+        if settings.SEARCH_ITERATIVE_SCAN != "off":
+            session.execute(
+                text("SELECT set_config('hnsw.iterative_scan', :mode, true)"),
+                {"mode": settings.SEARCH_ITERATIVE_SCAN},
+            )
+            # IVFFlat only scans iteratively in relaxed order
+            session.execute(
+                text("SELECT set_config('ivfflat.iterative_scan', :mode, true)"),
+                {"mode": "relaxed_order"},
+            )
+
+        # Fall back to the inline query if this connection could not prepare.
+        # Exact search is always planned inline: a cached generic plan of a
+        # prepared statement would ignore the disabled index scans.
+        statement_name = get_search_statement_name(quantization, dimensions)
+        prepared = session.connection().connection.info.get("search_prepared", ())
+        placeholders = {
+            name: placeholder
+            for name, (_, placeholder) in SEARCH_CHUNKS_PARAMETERS.items()
+        }
+        if statement_name in prepared and not exact:
+            query = f"EXECUTE {statement_name} ({', '.join(placeholders.values())})"
+        else:
+            query = build_search_chunks_query(quantization, dimensions, placeholders)
+
+        rows = (
+            session.execute(
+                text(query),
+                {
+                    "embedding": "[" + ",".join(map(str, embedding)) + "]",
+                    "workflow_id": workflow_id,
+                    "knowledge_id": knowledge_id,
+                    "context_ids": context_ids or [],
+                    "limit": limit,
+                    "candidates": limit * settings.SEARCH_RERANK_CANDIDATES_FACTOR,
+                },
+            )
+            .mappings()
+            .all()
+        )
+        session.commit()
+        session.close()
+
+        return [dict(row) for row in rows]
+
+    except Exception as e:
+        logger.error(f"Failed to search chunks for workflow {workflow_id}: {str(e)}")
+        if session:
+            session.rollback()
+            session.close()
+        raise
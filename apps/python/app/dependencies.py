@@ -1,9 +1,12 @@
 import logging
+import secrets
+from typing import Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-from .supabase import get_supabase_client
+from .auth import verify_access_token
+from .config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -14,20 +17,31 @@ security = HTTPBearer()
 async def verify_auth_token(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ):
-    """Verify Supabase authentication token."""
+    """
+    Verify Supabase authentication token, locally when possible (see auth.py).
+    Returns the token's claims.
+    """
     try:
-        logger.info(f"Verifying auth token: {credentials.credentials}")
-        supabase = get_supabase_client()
-        # Verify the JWT token with Supabase
-        response = supabase.auth.get_user(credentials.credentials)
-        if not response or not response.user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication token",
-            )
-        return response.user
+        return await verify_access_token(credentials.credentials)
     except Exception as e:
         logger.error(f"Authentication failed: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication failed"
         )
+
+
+async def verify_admin_secret(
+    x_admin_secret: Optional[str] = Header(None, alias="X-Admin-Secret"),
+):
+    """Verify the shared secret required by admin endpoints."""
+    if not settings.ADMIN_SECRET:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin endpoints are disabled",
+        )
+    if not x_admin_secret or not secrets.compare_digest(
+        x_admin_secret, settings.ADMIN_SECRET
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin secret"
+        )
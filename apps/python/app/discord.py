@@ -1,5 +1,7 @@
+import asyncio
 import logging
 import os
+import time
 from typing import Any, Dict, List, Optional
 
 import aiohttp
@@ -71,3 +73,110 @@ async def send_discord_notification(
     except Exception as e:
         logger.error(f"Error sending Discord notification: {str(e)}")
         return False
+
+
+# Discord rejects messages longer than 2000 characters
+DISCORD_MAX_CONTENT_LENGTH = 2000
+
+
+class RescrapeReport:
+    """
+    Collects the outcome of each resource of a rescrape run and sends one
+    Discord summary per run, instead of a notification per resource. Long
+    runs (and the scheduler, which never ends) also send one summary per
+    RESCRAPE_SUMMARY_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._outcomes: List[Dict[str, Any]] = []
+        self._started_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Send a summary every interval in the background."""
+        if settings.RESCRAPE_SUMMARY_INTERVAL_SECONDS > 0:
+            self._task = asyncio.create_task(self.run())
+
+    async def close(self):
+        """Stop the periodic summaries and send the last one."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(settings.RESCRAPE_SUMMARY_INTERVAL_SECONDS)
+            await self.flush()
+
+    def record(
+        self,
+        resource_id: str,
+        outcome: str,
+        duration: float,
+        scrape_frequency: Optional[str] = None,
+        error: Optional[str] = None,
+    ):
+        """Record a resource as "cache_hit", "refreshed" or "failed"."""
+        self._outcomes.append(
+            {
+                "resource_id": resource_id,
+                "outcome": outcome,
+                "duration": duration,
+                "scrape_frequency": scrape_frequency or "UNKNOWN",
+                "error": error,
+            }
+        )
+
+    async def flush(self) -> bool:
+        """Send the summary of the outcomes recorded since the last one."""
+        outcomes, self._outcomes = self._outcomes, []
+        elapsed = time.monotonic() - self._started_at
+        self._started_at = time.monotonic()
+        if not outcomes:
+            return True
+        return await send_discord_notification(
+            content=self.summarize(outcomes, elapsed),
+            username="Itzam Rescrape Bot",
+        )
+
+    def summarize(self, outcomes: List[Dict[str, Any]], elapsed: float) -> str:
+        """Counts, durations and the slowest and failed resources."""
+        counts = {"cache_hit": 0, "refreshed": 0, "failed": 0}
+        for outcome in outcomes:
+            counts[outcome["outcome"]] = counts.get(outcome["outcome"], 0) + 1
+        durations = [outcome["duration"] for outcome in outcomes]
+
+        lines = [
+            f"📋 - rescrape {self.name}: {len(outcomes)} resources in "
+            f"{elapsed:.1f}s (avg {sum(durations) / len(durations):.1f}s, "
+            f"max {max(durations):.1f}s)",
+            f"🎯 {counts['cache_hit']} cache hits · 🔄 {counts['refreshed']} "
+            f"refreshed · ❌ {counts['failed']} failed",
+        ]
+
+        top_n = settings.RESCRAPE_SUMMARY_TOP_N
+        slowest = sorted(outcomes, key=lambda outcome: -outcome["duration"])[:top_n]
+        if slowest:
+            lines.append("Slowest:")
+            lines.extend(
+                f"- {outcome['resource_id']} {outcome['duration']:.1f}s "
+                f"({outcome['outcome']}, {outcome['scrape_frequency']})"
+                for outcome in slowest
+            )
+        failed = [outcome for outcome in outcomes if outcome["outcome"] == "failed"]
+        if failed:
+            lines.append("Failed:")
+            lines.extend(
+                f"- {outcome['resource_id']} ({outcome['scrape_frequency']}): "
+                f"{(outcome['error'] or '')[:200]}"
+                for outcome in failed[:top_n]
+            )
+            if len(failed) > top_n:
+                lines.append(f"- and {len(failed) - top_n} more")
+
+        content = "\n".join(lines)
+        if len(content) > DISCORD_MAX_CONTENT_LENGTH:
+            content = content[: DISCORD_MAX_CONTENT_LENGTH - 1] + "…"
+        return content
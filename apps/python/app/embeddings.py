@@ -0,0 +1,53 @@
+import logging
+from typing import List, Optional
+
+from openai import OpenAI
+
+from .config import settings
+from .vector_expressions import EMBEDDING_DIMENSIONS
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_BATCH_SIZE = 128
+
+_client: Optional[OpenAI] = None
+
+
+def get_openai_client() -> OpenAI:
+    """Return the process-wide OpenAI client."""
+    global _client
+    if _client is None:
+        if not settings.OPENAI_API_KEY:
+            raise ValueError("OPENAI_API_KEY environment variable is required")
+        _client = OpenAI(api_key=settings.OPENAI_API_KEY, max_retries=3, timeout=60)
+    return _client
+
+
+def embed_texts(
+    texts: List[str], dimensions: int = EMBEDDING_DIMENSIONS
+) -> List[List[float]]:
+    """
+    Embed texts with text-embedding-3-small, asking the model for
+    `dimensions`-sized vectors (shortened embeddings are cheaper to store,
+    index and transfer).
+    """
+    client = get_openai_client()
+    embeddings: List[List[float]] = []
+
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        batch = texts[start : start + EMBEDDING_BATCH_SIZE]
+        response = client.embeddings.create(
+            model=EMBEDDING_MODEL, input=batch, dimensions=dimensions
+        )
+        # The API may return embeddings in a different order than the input
+        embeddings.extend(
+            item.embedding for item in sorted(response.data, key=lambda d: d.index)
+        )
+
+    return embeddings
+
+
+def embed_text(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> List[float]:
+    """Embed a single text, e.g. a search query."""
+    return embed_texts([text.replace("\n", " ")], dimensions)[0]
@@ -0,0 +1,240 @@
+"""
+Document conversion with docling in child processes.
+
+Conversion is CPU-bound and cannot be interrupted inside a thread, so it
+runs in a small pool of long-lived spawned processes (ConverterPool), each
+keeping its docling converter and models loaded across documents, and
+streaming the markdown of each page window back through a pipe. Cancelling
+the coroutine reading it (e.g. when the ingestion of the resource is
+cancelled) kills the one process converting that document, freeing the CPU
+at once instead of converting a document nobody needs; the pool spawns a
+replacement when next needed. A process is also replaced after
+EXTRACTION_PROCESS_MAX_CONVERSIONS documents, bounding the memory docling
+leaves behind.
+
+With EXTRACTION_SUBPROCESS_ENABLED=false the conversion runs in a thread as
+before, and cannot be interrupted.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from io import BytesIO
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import AsyncIterator, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+from docling.datamodel.base_models import DocumentStream, InputFormat  # type: ignore
+from docling.datamodel.pipeline_options import (  # type: ignore
+    PdfPipelineOptions,
+    VlmPipelineOptions,
+)
+from docling.document_converter import (  # type: ignore
+    DocumentConverter,
+    PdfFormatOption,
+)
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+PageRange = Optional[Tuple[int, int]]
+
+
+def get_document_name(url: str) -> str:
+    """Return a file name for a URL, which docling uses to detect the format."""
+    name = urlparse(str(url)).path.rstrip("/").rsplit("/", 1)[-1]
+    return name or "document.html"
+
+
+def create_docling_converter() -> DocumentConverter:
+    """Create a docling converter with VLM image descriptions for PDFs."""
+    # Configure VLM pipeline for image analysis and description
+    # SmolDocling will analyze images and generate text descriptions instead
+    # of base64 data, e.g. "A bar chart showing quarterly sales"
+    vlm_options = VlmPipelineOptions(
+        do_vlm=True,
+        vlm_model="ds4sd/SmolDocling-256M-preview",
+    )
+
+    # Configure PDF pipeline options for proper document handling
+    pdf_pipeline_options = PdfPipelineOptions()
+    # Keep OCR disabled to avoid EasyOCR dependency issues. Set to True to
+    # extract text from images, which requires EasyOCR dependencies
+    pdf_pipeline_options.do_ocr = False
+    # Keep table structure detection
+    pdf_pipeline_options.do_table_structure = True
+    pdf_pipeline_options.table_structure_options = {
+        "do_cell_matching": True,
+    }
+    # Enable image processing with VLM descriptions: generate and classify
+    # images of picture elements, at a higher resolution
+    pdf_pipeline_options.generate_picture_images = True
+    pdf_pipeline_options.do_picture_classification = True
+    pdf_pipeline_options.images_scale = 2.0
+
+    # Create format options with both pipeline options
+    format_options = PdfFormatOption(
+        pipeline_options=pdf_pipeline_options, vlm_options=vlm_options
+    )
+
+    return DocumentConverter(
+        format_options={
+            InputFormat.PDF: format_options,
+        }
+    )
+
+
+def convert_pages(
+    content: bytes,
+    url: str,
+    page_ranges: Sequence[PageRange],
+    converter: Optional[DocumentConverter] = None,
+) -> Iterator[str]:
+    """Convert a document to markdown, one page range (None: all) at a time."""
+    converter = converter or create_docling_converter()
+    name = get_document_name(url)
+    for page_range in page_ranges:
+        source = DocumentStream(name=name, stream=BytesIO(content))
+        if page_range is None:
+            result = converter.convert(source)
+        else:
+            result = converter.convert(source, page_range=page_range)
+        yield result.document.export_to_markdown()
+
+
+def serve_conversions(connection: Connection):
+    """
+    Converter process entry point: convert the documents sent until None,
+    sending each converted range, then "done" (or "error") per document.
+    """
+    converter = create_docling_converter()
+    try:
+        while True:
+            request = connection.recv()
+            if request is None:
+                return
+            content, url, page_ranges = request
+            try:
+                for text_content in convert_pages(content, url, page_ranges, converter):
+                    connection.send(("text", text_content))
+                connection.send(("done", None))
+            except Exception as e:
+                connection.send(("error", f"{type(e).__name__}: {str(e)}"))
+    except EOFError:
+        # The parent closed its end or exited
+        return
+    finally:
+        connection.close()
+
+
+class ConverterProcess:
+    """A converter child process and its end of the pipe."""
+
+    def __init__(self):
+        context = multiprocessing.get_context("spawn")
+        self.connection, child_connection = context.Pipe()
+        self.process: BaseProcess = context.Process(
+            target=serve_conversions, args=(child_connection,), daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.conversions = 0
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+class ConverterPool:
+    """
+    Up to `size` converter processes, started on demand and reused across
+    documents. A document waits while all of them are converting.
+    """
+
+    def __init__(self, size: int, max_conversions: int):
+        self.size = size
+        self.max_conversions = max_conversions
+        self._idle: List[ConverterProcess] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def convert(
+        self, content: bytes, url: str, page_ranges: Sequence[PageRange]
+    ) -> AsyncIterator[str]:
+        """Convert a document in a pooled process, yielding each page range."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            converter = self._idle.pop() if self._idle else None
+            if converter is None or not converter.process.is_alive():
+                if converter is not None:
+                    converter.kill()
+                converter = await asyncio.to_thread(ConverterProcess)
+
+            finished = False
+            try:
+                converter.conversions += 1
+                converter.connection.send((content, url, list(page_ranges)))
+                while True:
+                    try:
+                        kind, value = await asyncio.to_thread(converter.connection.recv)
+                    except EOFError:
+                        await asyncio.to_thread(converter.process.join)
+                        raise RuntimeError(
+                            "Extraction process exited with code "
+                            f"{converter.process.exitcode}"
+                        )
+                    if kind == "done":
+                        finished = True
+                        return
+                    if kind == "error":
+                        finished = True
+                        raise RuntimeError(value)
+                    yield value
+            finally:
+                if finished and converter.conversions < self.max_conversions:
+                    self._idle.append(converter)
+                else:
+                    # Cancelled or abandoned mid-document: stop converting
+                    # right away (or retire a process that converted enough)
+                    if not finished:
+                        logger.info(
+                            f"Killing extraction process {converter.process.pid} "
+                            f"for {url}"
+                        )
+                    converter.kill()
+
+    def close(self):
+        """Stop the idle processes."""
+        while self._idle:
+            converter = self._idle.pop()
+            try:
+                converter.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            converter.process.join(timeout=5)
+            converter.kill()
+
+
+converter_pool = ConverterPool(
+    settings.EXTRACTION_PROCESS_POOL_SIZE, settings.EXTRACTION_PROCESS_MAX_CONVERSIONS
+)
+
+
+async def convert_document(
+    content: bytes, url: str, page_ranges: Sequence[PageRange]
+) -> AsyncIterator[str]:
+    """Yield the markdown of each page range as soon as it is converted."""
+    if not settings.EXTRACTION_SUBPROCESS_ENABLED:
+        pages = convert_pages(content, url, page_ranges)
+        while True:
+            text_content = await asyncio.to_thread(next, pages, None)
+            if text_content is None:
+                return
+            yield text_content
+
+    async for text_content in converter_pool.convert(content, url, page_ranges):
+        yield text_content
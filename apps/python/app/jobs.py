@@ -0,0 +1,446 @@
+"""
+Consumer of the durable ingestion job queue (the ingestion_job table).
+
+Resources are ingested as a chain of jobs: EXTRACT -> CHUNK -> one
+EMBED_BATCH per embedding batch -> FINALIZE once the last batch is stored.
+Each job is leased with a visibility timeout that is extended while it
+runs; if its worker dies the lease expires and another worker claims it.
+Failed jobs are retried with exponential backoff until max_attempts.
+
+Claimed jobs run through the stage-parallel pipeline (see pipeline.py). A
+job type is only claimed while the stage it enters at has room, and
+follow-up jobs are leased to the same worker and passed straight to their
+stage when it has room, instead of waiting for the next poll.
+
+Cancelling the ingestion of a resource marks its jobs CANCELLED; consumers
+notice within JOB_CANCEL_POLL_INTERVAL_SECONDS (or at once in the process
+serving the request) and drop them between stages, cancelling the step they
+are running. A step that writes after the cancellation raises
+JobCancelledError instead, its writes rolled back.
+
+Stopping a consumer drains it: it stops claiming, hands the jobs that have
+not started back to the queue, and lets the running ones finish until the
+shutdown deadline. Jobs still unfinished then are cancelled and requeued for
+other workers at once instead of waiting for their lease to expire.
+
+Any number of processes can consume the queue concurrently. A consumer
+first recovers resources whose ingestion stalled without jobs left, from
+their batch checkpoints (see services.recover_stalled_ingestions).
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+from .config import settings
+from .database import (
+    JobCancelledError,
+    claim_jobs,
+    complete_job,
+    extend_job_leases,
+    fail_job,
+    get_cancelled_job_ids,
+    release_jobs,
+)
+from .metrics import watch_consumer
+from .pipeline import Pipeline
+from .services import (
+    JOB_ENTRY_STAGES,
+    STAGE_HANDLERS,
+    handle_failed_job,
+    recover_stalled_ingestions,
+)
+
+logger = logging.getLogger(__name__)
+
+JOB_TYPES = tuple(JOB_ENTRY_STAGES)
+STAGES = tuple(STAGE_HANDLERS)
+
+
+def get_default_stage_workers() -> Dict[str, int]:
+    """Return the configured worker count of each pipeline stage."""
+    return {
+        "fetch": settings.PIPELINE_FETCH_WORKERS,
+        "extract": settings.PIPELINE_EXTRACT_WORKERS,
+        "chunk": settings.PIPELINE_CHUNK_WORKERS,
+        "embed": settings.PIPELINE_EMBED_WORKERS,
+        "persist": settings.PIPELINE_PERSIST_WORKERS,
+    }
+
+
+def get_worker_id() -> str:
+    """Return an id identifying this process in job leases."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def get_retry_delay(attempts: int) -> float:
+    """Exponential backoff before the next attempt of a failed job."""
+    return min(
+        settings.JOB_RETRY_BASE_DELAY_SECONDS * 2.0 ** max(attempts - 1, 0),
+        settings.JOB_RETRY_MAX_DELAY_SECONDS,
+    )
+
+
+def is_retryable(error: Exception) -> bool:
+    """Client errors (e.g. a document without text) fail on every attempt."""
+    return not (isinstance(error, HTTPException) and error.status_code < 500)
+
+
+class JobConsumer:
+    """Claims ingestion jobs and runs them through the ingestion pipeline."""
+
+    def __init__(
+        self,
+        job_types: Sequence[str] = JOB_TYPES,
+        stage_workers: Optional[Dict[str, int]] = None,
+        worker_id: Optional[str] = None,
+        queue_size: Optional[int] = None,
+    ):
+        self.job_types = list(job_types)
+        self.worker_id = worker_id or get_worker_id()
+        self.visibility_timeout = settings.JOB_VISIBILITY_TIMEOUT_SECONDS
+        self.pipeline = Pipeline(
+            STAGE_HANDLERS,
+            {**get_default_stage_workers(), **(stage_workers or {})},
+            queue_size or settings.PIPELINE_QUEUE_SIZE,
+            on_complete=self.complete,
+            on_error=self.fail_attempt,
+            on_cancel=self.cancelled,
+        )
+        # Jobs leased to this worker, from claim (or lease) to completion
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # Follow-up jobs waiting for room in their entry stage
+        self._submitting: Dict[asyncio.Task, Dict[str, Any]] = {}
+        self._stopping = asyncio.Event()
+        self._drain_deadline: Optional[float] = None
+        self._draining: Optional[asyncio.Task] = None
+        self._requeued = 0
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._cancellations: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the pipeline and claim jobs in the background."""
+        self.pipeline.start()
+        watch_consumer(self)
+        self._task = asyncio.create_task(self.run())
+        self._heartbeat = asyncio.create_task(self.keep_leases())
+        self._cancellations = asyncio.create_task(self.watch_cancellations())
+
+    def drain(self, timeout: Optional[float] = None):
+        """
+        Start draining: stop claiming, requeue the jobs that have not started
+        and give the running ones until `timeout` to finish. Safe to call
+        again; the first deadline holds.
+        """
+        if self._draining:
+            return
+        self._stopping.set()
+        self._drain_deadline = time.monotonic() + timeout if timeout else None
+        logger.info(
+            f"Job consumer {self.worker_id} draining {len(self._jobs)} jobs"
+            + (f" for up to {timeout:.0f}s" if timeout else "")
+        )
+        self._draining = asyncio.create_task(self.requeue_unstarted())
+
+    async def stop(self, timeout: Optional[float] = None):
+        """
+        Drain, then requeue the jobs still unfinished at the deadline and stop
+        the pipeline.
+        """
+        self.drain(timeout)
+        if self._draining:
+            await self._draining
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.drain_time_left())
+        except asyncio.TimeoutError:
+            await self.requeue_unfinished()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        if self._cancellations:
+            self._cancellations.cancel()
+        await self.pipeline.stop()
+
+    def drain_time_left(self) -> Optional[float]:
+        if self._drain_deadline is None:
+            return None
+        return max(self._drain_deadline - time.monotonic(), 0)
+
+    async def requeue_unstarted(self):
+        """Once claiming stopped, hand back the jobs no stage has started."""
+        if self._task:
+            await self._task
+        jobs = self.pipeline.take_unstarted()
+        for task, job in list(self._submitting.items()):
+            task.cancel()
+            jobs.append(job)
+        await self.requeue(jobs, "not started")
+
+    async def requeue_unfinished(self):
+        """Cancel the jobs still in the pipeline and hand them back."""
+        jobs = list(self._jobs.values())
+        for job in jobs:
+            self.pipeline.cancel(job["id"])
+        await self.requeue(jobs, "unfinished at the shutdown deadline")
+
+    async def requeue(self, jobs: List[Dict[str, Any]], reason: str):
+        if not jobs:
+            return
+        try:
+            requeued = await asyncio.to_thread(
+                release_jobs, [job["id"] for job in jobs], self.worker_id
+            )
+        finally:
+            for job in jobs:
+                self.untrack(job)
+        self._requeued += requeued
+        logger.info(
+            f"Job consumer {self.worker_id} requeued {requeued} of {len(jobs)} "
+            f"jobs {reason}"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the consumer's identity, load and per-stage queue depth."""
+        return {
+            "worker_id": self.worker_id,
+            "job_types": self.job_types,
+            "in_flight": len(self._jobs),
+            "stages": self.pipeline.stats(),
+            "drain": self.drain_stats(),
+        }
+
+    def is_ready(self) -> bool:
+        """Whether the consumer is claiming jobs: started and not draining."""
+        return self._task is not None and not self._stopping.is_set()
+
+    def drain_stats(self) -> Optional[Dict[str, Any]]:
+        """Progress of the drain, or None while the consumer is running."""
+        if not self._draining:
+            return None
+        return {
+            "in_flight": len(self._jobs),
+            "requeued": self._requeued,
+            "seconds_left": self.drain_time_left(),
+            "done": self._idle.is_set(),
+        }
+
+    def track(self, job: Dict[str, Any]):
+        self._jobs[job["id"]] = job
+        self._idle.clear()
+
+    def untrack(self, job: Dict[str, Any]):
+        self._jobs.pop(job["id"], None)
+        if not self._jobs:
+            self._idle.set()
+
+    async def run(self):
+        """Claim jobs while their entry stages have room until stopped."""
+        logger.info(
+            f"Job consumer {self.worker_id} started for {', '.join(self.job_types)} "
+            f"(stages {self.pipeline.stats()})"
+        )
+        if settings.INGESTION_RECOVERY_ENABLED:
+            await self.recover()
+
+        while not self._stopping.is_set():
+            claimed = 0
+            for job_type in self.job_types:
+                stage = JOB_ENTRY_STAGES[job_type]
+                free_slots = self.pipeline.free_slots(stage)
+                if free_slots <= 0:
+                    continue
+
+                jobs = await asyncio.to_thread(
+                    claim_jobs,
+                    self.worker_id,
+                    [job_type],
+                    free_slots,
+                    self.visibility_timeout,
+                )
+                claimed += len(jobs)
+                for job in jobs:
+                    await self.submit(job)
+
+            if not claimed:
+                try:
+                    await asyncio.wait_for(
+                        self._stopping.wait(), settings.JOB_POLL_INTERVAL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+
+        logger.info(f"Job consumer {self.worker_id} stopped claiming jobs")
+
+    async def recover(self):
+        """Re-enqueue the ingestion of stalled resources, a batch at a time."""
+        recovered = 0
+        try:
+            while not self._stopping.is_set():
+                count = await asyncio.to_thread(
+                    recover_stalled_ingestions, settings.INGESTION_RECOVERY_BATCH_SIZE
+                )
+                recovered += count
+                if count < settings.INGESTION_RECOVERY_BATCH_SIZE:
+                    break
+        except Exception as e:
+            logger.error(f"Recovering stalled ingestions failed: {str(e)}")
+        if recovered:
+            logger.info(f"Recovered the ingestion of {recovered} stalled resources")
+
+    async def submit(self, job: Dict[str, Any]):
+        """Queue a leased job at the stage its type enters the pipeline at."""
+        self.track(job)
+
+        # A job whose last attempt died without recording a failure
+        if job["attempts"] > job["max_attempts"]:
+            await self.fail(job, "Job timed out on every attempt", retry=False)
+            return
+
+        logger.info(
+            f"Queued {job['type']} job {job['id']} for resource "
+            f"{job['resource_id']} (attempt {job['attempts']})"
+        )
+        await self.pipeline.submit(JOB_ENTRY_STAGES[job["type"]], job)
+
+    def lease_follow_ups(self, follow_up_jobs: List[Dict[str, Any]]):
+        """
+        Flag the follow-up jobs this worker runs itself: those of its types
+        while their entry stage has room. The rest go through the queue.
+        """
+        if self._stopping.is_set():
+            return
+        free_slots = {
+            stage: self.pipeline.free_slots(stage) for stage in STAGE_HANDLERS
+        }
+        for job in follow_up_jobs:
+            stage = JOB_ENTRY_STAGES[job["type"]]
+            if job["type"] in self.job_types and free_slots[stage] > 0:
+                free_slots[stage] -= 1
+                job["id"] = str(uuid.uuid4())
+                job["leased"] = True
+
+    async def complete(self, job: Dict[str, Any], follow_up_jobs: List[Dict[str, Any]]):
+        """Record a finished job and pass on the follow-ups leased to us."""
+        try:
+            self.lease_follow_ups(follow_up_jobs)
+            completed = await asyncio.to_thread(
+                complete_job,
+                job["id"],
+                self.worker_id,
+                follow_up_jobs,
+                self.visibility_timeout,
+            )
+        finally:
+            self.untrack(job)
+
+        if not completed:
+            return
+        for follow_up in follow_up_jobs:
+            if not follow_up.get("leased"):
+                continue
+            leased_job = {
+                "id": follow_up["id"],
+                "type": follow_up["type"],
+                "payload": follow_up["payload"],
+                "attempts": 1,
+                "max_attempts": follow_up.get(
+                    "max_attempts", settings.JOB_MAX_ATTEMPTS
+                ),
+                "resource_id": follow_up["resource_id"],
+                "workflow_id": follow_up["workflow_id"],
+                "user_id": follow_up.get("user_id"),
+                "priority": follow_up.get("priority", 0),
+            }
+            # Never block the stage worker completing the job: a persist
+            # worker queueing FINALIZE would otherwise wait on its own stage
+            self.track(leased_job)
+            task = asyncio.create_task(self.submit(leased_job))
+            self._submitting[task] = leased_job
+            task.add_done_callback(self.forget_submission)
+
+    def forget_submission(self, task: asyncio.Task):
+        self._submitting.pop(task, None)
+
+    async def fail_attempt(self, job: Dict[str, Any], error: Exception):
+        if isinstance(error, JobCancelledError):
+            # Cancelled after its step started: its writes were rolled back
+            await self.cancelled(job)
+            return
+        logger.error(f"{job['type']} job {job['id']} failed: {str(error)}")
+        await self.fail(job, str(error), retry=is_retryable(error))
+
+    async def keep_leases(self):
+        """
+        Extend the leases of every job in the pipeline well before expiry.
+        A job whose lease was lost belongs to another worker (or was
+        cancelled) by now, so it is cancelled here rather than run twice.
+        """
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            job_ids = list(self._jobs)
+            extended = await asyncio.to_thread(
+                extend_job_leases, job_ids, self.worker_id, self.visibility_timeout
+            )
+            for job_id in set(job_ids) - set(extended):
+                logger.warning(f"Lost the lease of job {job_id}, cancelling it")
+                self.pipeline.cancel(job_id)
+
+    def cancel_resource(self, resource_id: str) -> int:
+        """
+        Cancel this worker's jobs of a resource right away, after they were
+        marked CANCELLED. Returns how many were running here.
+        """
+        job_ids = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job["resource_id"] == resource_id
+        ]
+        for job_id in job_ids:
+            self.pipeline.cancel(job_id)
+        return len(job_ids)
+
+    async def watch_cancellations(self):
+        """Cancel the jobs in the pipeline that were marked CANCELLED."""
+        while True:
+            await asyncio.sleep(settings.JOB_CANCEL_POLL_INTERVAL_SECONDS)
+            job_ids = list(self._jobs)
+            if not job_ids:
+                continue
+            for job_id in await asyncio.to_thread(get_cancelled_job_ids, job_ids):
+                self.pipeline.cancel(job_id)
+
+    async def cancelled(self, job: Dict[str, Any]):
+        """Forget a cancelled job; its row is already CANCELLED."""
+        self.untrack(job)
+        logger.info(
+            f"Cancelled {job['type']} job {job['id']} for resource {job['resource_id']}"
+        )
+
+    async def fail(self, job: Dict[str, Any], error: str, retry: bool = True):
+        """Record a failed attempt and fail the resource once out of retries."""
+        try:
+            new_status = await asyncio.to_thread(
+                fail_job,
+                job["id"],
+                self.worker_id,
+                error,
+                get_retry_delay(job["attempts"]),
+                retry,
+            )
+        finally:
+            self.untrack(job)
+        if new_status == "FAILED":
+            await handle_failed_job(job, error)
+        elif new_status == "QUEUED":
+            logger.info(
+                f"Retrying {job['type']} job {job['id']} in "
+                f"{get_retry_delay(job['attempts']):.0f}s"
+            )
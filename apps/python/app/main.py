@@ -1,10 +1,20 @@
+import asyncio
 import logging
+import signal
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
+from .cache_listener import search_cache_listener
 from .config import settings
-from .routers import health, rescrape, resources
+from .extraction import converter_pool
+from .jobs import JobConsumer
+from .rescrape_scheduler import RescrapeScheduler
+from .routers import admin, health, metrics, rescrape, resources, search
 from .schemas import HealthResponse
+from .supabase import progress_broadcaster, realtime_publisher
+from .tracing import setup_tracing, shutdown_tracing
+from .usage import usage_meter
 
 # Configure logging
 logging.basicConfig(
@@ -12,17 +22,87 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def drain_on_sigterm(consumer: JobConsumer):
+    """
+    Start draining the consumer as soon as the server receives SIGTERM,
+    while uvicorn still finishes the open requests, instead of only at
+    lifespan shutdown. The server's own handler still runs afterwards.
+    """
+    loop = asyncio.get_running_loop()
+    server_handler = signal.getsignal(signal.SIGTERM)
+    if not callable(server_handler):
+        return
+
+    def handle_sigterm(signum, frame):
+        loop.call_soon_threadsafe(consumer.drain, settings.JOB_SHUTDOWN_TIMEOUT_SECONDS)
+        server_handler(signum, frame)
+
+    try:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+    except ValueError:
+        # Not the main thread (e.g. an embedded server): drain at shutdown
+        pass
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Run an ingestion job consumer and the rescrape scheduler alongside the
+    API when enabled. On shutdown the consumer drains (see JobConsumer.stop),
+    and /health reports its progress meanwhile. Realtime updates share one
+    connection for the lifetime of the app, as do notifications of search
+    generation bumps (see cache_listener.py).
+    """
+    setup_tracing("api")
+    realtime_publisher.start()
+    if settings.SEARCH_INVALIDATION_LISTENER_ENABLED:
+        search_cache_listener.start()
+
+    consumer = None
+    if settings.JOB_CONSUMER_ENABLED:
+        consumer = JobConsumer()
+        consumer.start()
+        drain_on_sigterm(consumer)
+    app.state.job_consumer = consumer
+
+    scheduler = None
+    if settings.RESCRAPE_SCHEDULER_ENABLED:
+        scheduler = RescrapeScheduler()
+        scheduler.start()
+    app.state.rescrape_scheduler = scheduler
+
+    yield
+
+    if scheduler:
+        await scheduler.stop(timeout=settings.JOB_SHUTDOWN_TIMEOUT_SECONDS)
+    if consumer:
+        await consumer.stop(timeout=settings.JOB_SHUTDOWN_TIMEOUT_SECONDS)
+    await asyncio.to_thread(converter_pool.close)
+    await usage_meter.close()
+    await progress_broadcaster.close()
+    await realtime_publisher.close()
+    if settings.SEARCH_INVALIDATION_LISTENER_ENABLED:
+        await asyncio.to_thread(search_cache_listener.stop)
+    shutdown_tracing()
+
+
 # Create FastAPI application
 app = FastAPI(
     title=settings.API_TITLE,
     description=settings.API_DESCRIPTION,
     version=settings.API_VERSION,
+    lifespan=lifespan,
 )
 
 # Include routers
 app.include_router(health.router)
 app.include_router(resources.router)
 app.include_router(rescrape.router)
+app.include_router(search.router)
+app.include_router(admin.router)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router)
 
 
 # Root endpoint
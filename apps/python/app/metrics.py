@@ -0,0 +1,253 @@
+"""
+Prometheus metrics of the ingestion pipeline.
+
+Latencies of the ingestion steps (download, docling, tika, chunking,
+embedding, db_write) are histograms labelled by step, observed at the
+function boundaries in services.py and database.py. Ingested bytes, chunks
+and embedded tokens are counters. Cache hits and misses, the job consumer's
+in-flight jobs and per-stage queue depth, and the database connection pool
+are read from their owners when scraped (see RuntimeCollector).
+
+The API serves them at /metrics; a standalone worker on WORKER_METRICS_PORT
+(see serve_metrics). Metrics are per process: when the API runs several
+worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty directory so the
+histograms and counters of all of them are added up (the Dockerfile does).
+The state read when scraped is still that of the process answering, so it
+is labelled with its pid then.
+"""
+
+import functools
+import inspect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Iterator, Optional, TypeVar
+
+from aiohttp import web
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+from .cache import CACHES
+from .schemas import DrainStatusResponse
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+STEP_SECONDS = Histogram(
+    "itzam_ingestion_step_seconds",
+    "Latency of an ingestion step",
+    ["step"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+INGESTED_BYTES = Counter(
+    "itzam_ingested_bytes", "Bytes of text extracted from resources"
+)
+CHUNKS = Counter("itzam_chunks", "Chunks produced by chunking resources")
+EMBEDDED_TOKENS = Counter("itzam_embedded_tokens", "Tokens of the chunks embedded")
+
+
+@contextmanager
+def observe_step(step: str) -> Iterator[None]:
+    """Observe the duration of a block as an ingestion step, even if it fails."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STEP_SECONDS.labels(step).observe(time.perf_counter() - start)
+
+
+def timed(step: str):
+    """Decorate a function (sync or async) to observe its duration as a step."""
+
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with observe_step(step):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with observe_step(step):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+async def observe_iteration(step: str, iterator: AsyncIterator[T]) -> AsyncIterator[T]:
+    """
+    Yield from an async iterator, observing the time spent waiting for its
+    items (but not for the consumer in between) as one step.
+    """
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        STEP_SECONDS.labels(step).observe(elapsed)
+
+
+def is_multiprocess() -> bool:
+    """Whether the metrics of several processes are added up."""
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+class RuntimeCollector(Collector):
+    """
+    Reads cache, job consumer and connection pool state when scraped. In
+    multiprocess mode each scrape only sees the process answering it, so
+    every series gets a `pid` label rather than passing for the whole API.
+    """
+
+    def __init__(self):
+        self.consumer: Optional[Any] = None
+        self.pool: Optional[Any] = None
+
+    def collect(self):
+        process_labels = ["pid"] if is_multiprocess() else []
+        process = [str(os.getpid())] if is_multiprocess() else []
+
+        def gauge(name: str, documentation: str, value: float) -> GaugeMetricFamily:
+            family = GaugeMetricFamily(name, documentation, labels=process_labels)
+            family.add_metric(process, value)
+            return family
+
+        hits = CounterMetricFamily(
+            "itzam_cache_hits",
+            "Lookups answered by a cache",
+            labels=["cache", *process_labels],
+        )
+        misses = CounterMetricFamily(
+            "itzam_cache_misses",
+            "Lookups missed by a cache",
+            labels=["cache", *process_labels],
+        )
+        for name, cache in CACHES.items():
+            hits.add_metric([name, *process], cache.hits)
+            misses.add_metric([name, *process], cache.misses)
+        yield hits
+        yield misses
+
+        if self.consumer is not None:
+            stats = self.consumer.stats()
+            yield gauge(
+                "itzam_jobs_in_flight",
+                "Ingestion jobs leased to this process",
+                stats["in_flight"],
+            )
+            queued = GaugeMetricFamily(
+                "itzam_pipeline_queue_depth",
+                "Jobs waiting in front of a pipeline stage",
+                labels=["stage", *process_labels],
+            )
+            busy = GaugeMetricFamily(
+                "itzam_pipeline_busy_workers",
+                "Workers of a pipeline stage running a step",
+                labels=["stage", *process_labels],
+            )
+            for stage, stage_stats in stats["stages"].items():
+                queued.add_metric([stage, *process], stage_stats["queued"])
+                busy.add_metric([stage, *process], stage_stats["busy"])
+            yield queued
+            yield busy
+
+        if self.pool is not None and hasattr(self.pool, "checkedout"):
+            yield gauge(
+                "itzam_db_pool_size",
+                "Connections the database pool keeps open",
+                self.pool.size(),
+            )
+            yield gauge(
+                "itzam_db_pool_checked_out",
+                "Database connections in use",
+                self.pool.checkedout(),
+            )
+            yield gauge(
+                "itzam_db_pool_overflow",
+                "Database connections open beyond the pool size",
+                max(self.pool.overflow(), 0),
+            )
+
+
+runtime_collector = RuntimeCollector()
+REGISTRY.register(runtime_collector)
+
+
+def watch_consumer(consumer: Any):
+    """Report the load of this process's job consumer."""
+    runtime_collector.consumer = consumer
+
+
+def watch_pool(pool: Any):
+    """Report the usage of the database connection pool."""
+    runtime_collector.pool = pool
+
+
+def get_metrics() -> bytes:
+    """The metrics in the Prometheus text format."""
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(runtime_collector)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+async def serve_metrics(port: int, consumer: Optional[Any] = None) -> web.AppRunner:
+    """
+    Serve /metrics on the running event loop, for processes without the API.
+    With a job consumer, /health answers 200 while it claims jobs and 503
+    before it started or once it drains (with the drain progress, like the
+    API's /health), so the worker is taken out of rotation while stopping.
+    """
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            body=get_metrics(), headers={"Content-Type": CONTENT_TYPE_LATEST}
+        )
+
+    async def handle_health(request: web.Request) -> web.Response:
+        drain = consumer.drain_stats() if consumer else None
+        if drain:
+            return web.json_response(
+                {
+                    "status": "draining",
+                    "drain": DrainStatusResponse(**drain).model_dump(by_alias=True),
+                },
+                status=503,
+            )
+        if consumer and not consumer.is_ready():
+            return web.json_response({"status": "starting"}, status=503)
+        return web.json_response({"status": "healthy"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/health", handle_health)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, port=port).start()
+    logger.info(f"Serving metrics on port {port}")
+    return runner
@@ -325,6 +325,8 @@ class Workflow(Base):
     created_at: Mapped[datetime.datetime] = mapped_column(DateTime(True), server_default=text('CURRENT_TIMESTAMP'))
     updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(True))
     knowledge_id: Mapped[str] = mapped_column(String(256))
+    embedding_dimensions: Mapped[int] = mapped_column(Integer, server_default=text('1536'))
+    search_generation: Mapped[int] = mapped_column(Integer, server_default=text('0'))
     description: Mapped[Optional[str]] = mapped_column(Text)
 
     knowledge: Mapped['Knowledge'] = relationship('Knowledge', back_populates='workflow')
@@ -335,6 +337,8 @@ class Workflow(Base):
     thread: Mapped[List['Thread']] = relationship('Thread', back_populates='workflow')
     run: Mapped[List['Run']] = relationship('Run', back_populates='workflow')
     chunks: Mapped[List['Chunks']] = relationship('Chunks', back_populates='workflow')
+    ingestion_job: Mapped[List['IngestionJob']] = relationship('IngestionJob', back_populates='workflow')
+    workflow_usage: Mapped[Optional['WorkflowUsage']] = relationship('WorkflowUsage', uselist=False, back_populates='workflow')
 
 
 class ChatMessage(Base):
@@ -457,10 +461,13 @@ class Resource(Base):
     last_scraped_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(True))
     content_hash: Mapped[Optional[str]] = mapped_column(String(256))
     context_id: Mapped[Optional[str]] = mapped_column(String(256))
+    replace_chunks_before: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(True))
 
     context: Mapped[Optional['Context']] = relationship('Context', back_populates='resource')
     knowledge: Mapped[Optional['Knowledge']] = relationship('Knowledge', back_populates='resource')
     chunks: Mapped[List['Chunks']] = relationship('Chunks', back_populates='resource')
+    ingestion_job: Mapped[List['IngestionJob']] = relationship('IngestionJob', back_populates='resource')
+    resource_batch: Mapped[List['ResourceBatch']] = relationship('ResourceBatch', back_populates='resource')
     run_resource: Mapped[List['RunResource']] = relationship('RunResource', back_populates='resource')
 
 
@@ -560,24 +567,92 @@ class Chunks(Base):
     __table_args__ = (
         ForeignKeyConstraint(['resource_id'], ['resource.id'], name='chunks_resource_id_resource_id_fk'),
         ForeignKeyConstraint(['workflow_id'], ['workflow.id'], name='chunks_workflow_id_workflow_id_fk'),
-        PrimaryKeyConstraint('id', name='chunks_pkey'),
+        PrimaryKeyConstraint('id', 'workflow_id', name='chunks_pkey'),
         Index('chunks_resource_id_idx', 'resource_id'),
         Index('chunks_workflow_id_idx', 'workflow_id')
     )
 
     id: Mapped[str] = mapped_column(String(256), primary_key=True)
+    workflow_id: Mapped[str] = mapped_column(String(256), primary_key=True)
     content: Mapped[str] = mapped_column(Text)
-    embedding: Mapped[Any] = mapped_column(VECTOR(1536))
     active: Mapped[bool] = mapped_column(Boolean, server_default=text('true'))
     created_at: Mapped[datetime.datetime] = mapped_column(DateTime(True), server_default=text('CURRENT_TIMESTAMP'))
     updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(True))
     resource_id: Mapped[str] = mapped_column(String(256))
-    workflow_id: Mapped[str] = mapped_column(String(256))
+    embedding: Mapped[Optional[Any]] = mapped_column(VECTOR(1536))
+    embedding_1024: Mapped[Optional[Any]] = mapped_column(VECTOR(1024))
+    embedding_512: Mapped[Optional[Any]] = mapped_column(VECTOR(512))
+    embedding_256: Mapped[Optional[Any]] = mapped_column(VECTOR(256))
 
     resource: Mapped['Resource'] = relationship('Resource', back_populates='chunks')
     workflow: Mapped['Workflow'] = relationship('Workflow', back_populates='chunks')
 
 
+class IngestionJob(Base):
+    __tablename__ = 'ingestion_job'
+    __table_args__ = (
+        ForeignKeyConstraint(['resource_id'], ['resource.id'], name='ingestion_job_resource_id_resource_id_fk'),
+        ForeignKeyConstraint(['workflow_id'], ['workflow.id'], name='ingestion_job_workflow_id_workflow_id_fk'),
+        PrimaryKeyConstraint('id', name='ingestion_job_pkey'),
+        Index('ingestion_job_resource_id_idx', 'resource_id'),
+        Index('ingestion_job_status_run_at_idx', 'status', 'run_at'),
+        Index('ingestion_job_status_workflow_id_idx', 'status', 'workflow_id', 'priority', 'run_at')
+    )
+
+    id: Mapped[str] = mapped_column(String(256), primary_key=True)
+    type: Mapped[str] = mapped_column(Enum('EXTRACT', 'CHUNK', 'EMBED_BATCH', 'FINALIZE', name='ingestion_job_type'))
+    status: Mapped[str] = mapped_column(Enum('QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', 'CANCELLED', name='ingestion_job_status'), server_default=text("'QUEUED'::ingestion_job_status"))
+    payload: Mapped[dict] = mapped_column(JSONB, server_default=text("'{}'::jsonb"))
+    attempts: Mapped[int] = mapped_column(Integer, server_default=text('0'))
+    max_attempts: Mapped[int] = mapped_column(Integer, server_default=text('5'))
+    run_at: Mapped[datetime.datetime] = mapped_column(DateTime(True), server_default=text('CURRENT_TIMESTAMP'))
+    resource_id: Mapped[str] = mapped_column(String(256))
+    workflow_id: Mapped[str] = mapped_column(String(256))
+    priority: Mapped[int] = mapped_column(Integer, server_default=text('0'))
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(True), server_default=text('CURRENT_TIMESTAMP'))
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(True))
+    locked_until: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(True))
+    locked_by: Mapped[Optional[str]] = mapped_column(String(256))
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+    user_id: Mapped[Optional[str]] = mapped_column(String(256))
+
+    resource: Mapped['Resource'] = relationship('Resource', back_populates='ingestion_job')
+    workflow: Mapped['Workflow'] = relationship('Workflow', back_populates='ingestion_job')
+
+
+class ResourceBatch(Base):
+    __tablename__ = 'resource_batch'
+    __table_args__ = (
+        ForeignKeyConstraint(['resource_id'], ['resource.id'], name='resource_batch_resource_id_resource_id_fk'),
+        PrimaryKeyConstraint('resource_id', 'batch_index', name='resource_batch_pkey')
+    )
+
+    resource_id: Mapped[str] = mapped_column(String(256), primary_key=True)
+    batch_index: Mapped[int] = mapped_column(Integer, primary_key=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(True), server_default=text('CURRENT_TIMESTAMP'))
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(True))
+    chunks: Mapped[Optional[list]] = mapped_column(JSONB)
+    completed_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime(True))
+
+    resource: Mapped['Resource'] = relationship('Resource', back_populates='resource_batch')
+
+
+class WorkflowUsage(Base):
+    __tablename__ = 'workflow_usage'
+    __table_args__ = (
+        ForeignKeyConstraint(['workflow_id'], ['workflow.id'], name='workflow_usage_workflow_id_workflow_id_fk'),
+        PrimaryKeyConstraint('workflow_id', name='workflow_usage_pkey')
+    )
+
+    workflow_id: Mapped[str] = mapped_column(String(256), primary_key=True)
+    ingested_bytes: Mapped[int] = mapped_column(BigInteger, server_default=text('0'))
+    ingested_resources: Mapped[int] = mapped_column(Integer, server_default=text('0'))
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(True), server_default=text('CURRENT_TIMESTAMP'))
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(True))
+
+    workflow: Mapped['Workflow'] = relationship('Workflow', back_populates='workflow_usage')
+
+
 class RunResource(Base):
     __tablename__ = 'run_resource'
     __table_args__ = (
@@ -0,0 +1,634 @@
+"""
+Partitioning of the chunks table by workflow.
+
+Layout once migrated (scripts/partition_chunks.py):
+
+    chunks                  PARTITION BY LIST (workflow_id)
+    ├── chunks_wf_<hash>    FOR VALUES IN ('<workflow id>'), one per very
+    │                       large workflow
+    └── chunks_default      DEFAULT, PARTITION BY HASH (workflow_id)
+        ├── chunks_h00      FOR VALUES WITH (MODULUS n, REMAINDER 0)
+        └── ...
+
+Every query filtering on workflow_id is pruned to one partition, so deletes,
+vacuum and the per-partition vector indexes of one tenant stay out of the
+way of the others.
+"""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import xxhash
+from sqlalchemy import text
+
+from .cache import chunks_partition_cache
+from .database import engine, invalidate_workflow_search_cache
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLE = "chunks_partitioned"
+UNPARTITIONED_TABLE = "chunks_unpartitioned"
+DEFAULT_PARTITION = "chunks_default"
+MIRROR_TRIGGER = "chunks_mirror_to_partitioned"
+
+# Keeps chunks_partitioned in sync with writes to chunks while rows are copied
+MIRROR_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION {MIRROR_TRIGGER}() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM {PARTITIONED_TABLE}
+            WHERE id = OLD.id AND workflow_id = OLD.workflow_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO {PARTITIONED_TABLE} SELECT NEW.*
+            ON CONFLICT (id, workflow_id) DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+# Set by the transactions deleting a moved workflow's rows from
+# chunks_default, whose deletes are not mirrored
+MOVING_WORKFLOW_SETTING = "itzam.moving_workflow"
+
+# Keeps a workflow's standalone partition (TG_ARGV[0]) in sync with writes to
+# its rows (workflow TG_ARGV[1]) in chunks_default. As an AFTER trigger it
+# mirrors them while the rows are copied; as a BEFORE trigger it diverts new
+# and updated rows to the table only, so they never land in chunks_default
+# while its rows of the workflow are deleted ahead of the attach.
+WORKFLOW_MIRROR_TRIGGER = "chunks_mirror_to_workflow_partition"
+WORKFLOW_MIRROR_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION {WORKFLOW_MIRROR_TRIGGER}() RETURNS trigger AS $$
+    BEGIN
+        IF current_setting('{MOVING_WORKFLOW_SETTING}', true) = TG_ARGV[1] THEN
+            RETURN OLD;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.workflow_id = TG_ARGV[1] THEN
+            EXECUTE format(
+                'DELETE FROM %I WHERE id = $1 AND workflow_id = $2', TG_ARGV[0]
+            ) USING OLD.id, OLD.workflow_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.workflow_id = TG_ARGV[1] THEN
+            EXECUTE format(
+                'INSERT INTO %I SELECT ($1).* ON CONFLICT (id, workflow_id) DO NOTHING',
+                TG_ARGV[0]
+            ) USING NEW;
+            IF TG_WHEN = 'BEFORE' THEN
+                RETURN NULL;
+            END IF;
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            RETURN OLD;
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+# FOR SHARE makes concurrent updates and deletes of the batch wait until it
+# is copied, so the mirror trigger always applies them after the copy
+COPY_BATCH_QUERY = f"""
+    WITH batch AS (
+        SELECT * FROM chunks
+        WHERE id > :after_id
+        ORDER BY id
+        LIMIT :batch_size
+        FOR SHARE
+    ), copied AS (
+        INSERT INTO {PARTITIONED_TABLE} SELECT * FROM batch
+        ON CONFLICT (id, workflow_id) DO NOTHING
+    )
+    SELECT max(id) AS last_id, count(*) AS row_count FROM batch
+"""
+
+PARTITIONS_QUERY = """
+    SELECT c.relname AS name,
+           p.relname AS parent,
+           t.isleaf AS is_leaf,
+           pg_get_expr(c.relpartbound, c.oid) AS bound,
+           greatest(c.reltuples, 0)::bigint AS estimated_rows,
+           pg_total_relation_size(c.oid) AS total_bytes
+    FROM pg_partition_tree(CAST(:table_name AS regclass)) t
+    JOIN pg_class c ON c.oid = t.relid
+    LEFT JOIN pg_class p ON p.oid = t.parentrelid
+    ORDER BY t.level, c.relname
+"""
+
+CONSTRAINTS_QUERY = """
+    SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table_name AS regclass)
+"""
+
+# Indexes not owned by a constraint (those are renamed with the constraint)
+INDEXES_QUERY = """
+    SELECT c.relname AS name, pg_get_indexdef(i.indexrelid) AS definition
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE i.indrelid = CAST(:table_name AS regclass)
+      AND NOT EXISTS (
+          SELECT 1 FROM pg_constraint k
+          WHERE k.conindid = i.indexrelid AND k.contype IN ('p', 'u', 'x')
+      )
+"""
+
+
+def get_hash_partition_name(remainder: int) -> str:
+    """Return the name of a hash partition under chunks_default."""
+    return f"chunks_h{remainder:02d}"
+
+
+def get_workflow_partition_name(workflow_id: str) -> str:
+    """Return the name of a workflow's dedicated list partition."""
+    return f"chunks_wf_{xxhash.xxh64(workflow_id.encode('utf-8')).hexdigest()[:12]}"
+
+
+def table_exists(table_name: str) -> bool:
+    """Return whether a table exists."""
+    with engine.connect() as connection:
+        return (
+            connection.execute(
+                text("SELECT to_regclass(:table_name) IS NOT NULL"),
+                {"table_name": table_name},
+            ).scalar()
+            is True
+        )
+
+
+def is_chunks_partitioned() -> bool:
+    """Return whether chunks has already been migrated to a partitioned table."""
+    with engine.connect() as connection:
+        relkind = connection.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass('chunks')")
+        ).scalar()
+    return relkind == "p"
+
+
+def get_chunks_partitions(table_name: str = "chunks") -> List[Dict[str, Any]]:
+    """Return the tables of the chunks partition tree with sizes and bounds."""
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text(PARTITIONS_QUERY), {"table_name": table_name}
+        ).mappings()
+        return [dict(row) for row in rows]
+
+
+def _quote_literal(connection, value: str) -> str:
+    """Quote a value for use in DDL, which cannot take bind parameters."""
+    literal: str = connection.execute(
+        text("SELECT quote_literal(:value)"), {"value": value}
+    ).scalar()
+    return literal
+
+
+def create_partitioned_chunks_table(
+    hash_partitions: int, dedicated_workflow_ids: Optional[List[str]] = None
+) -> None:
+    """
+    Create chunks_partitioned with the layout described above, its keys and
+    btree indexes. The table is empty, so this only takes catalog locks.
+    """
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                f"CREATE TABLE {PARTITIONED_TABLE} "
+                "(LIKE chunks INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                "PARTITION BY LIST (workflow_id)"
+            )
+        )
+        connection.execute(
+            text(
+                f"ALTER TABLE {PARTITIONED_TABLE} "
+                f"ADD CONSTRAINT {PARTITIONED_TABLE}_pkey "
+                "PRIMARY KEY (id, workflow_id), "
+                f"ADD CONSTRAINT {PARTITIONED_TABLE}_resource_id_resource_id_fk "
+                "FOREIGN KEY (resource_id) REFERENCES resource(id), "
+                f"ADD CONSTRAINT {PARTITIONED_TABLE}_workflow_id_workflow_id_fk "
+                "FOREIGN KEY (workflow_id) REFERENCES workflow(id)"
+            )
+        )
+        connection.execute(
+            text(
+                f"CREATE INDEX {PARTITIONED_TABLE}_resource_id_idx "
+                f"ON {PARTITIONED_TABLE} (resource_id)"
+            )
+        )
+        connection.execute(
+            text(
+                f"CREATE INDEX {PARTITIONED_TABLE}_workflow_id_idx "
+                f"ON {PARTITIONED_TABLE} (workflow_id)"
+            )
+        )
+
+        for workflow_id in dedicated_workflow_ids or []:
+            connection.execute(
+                text(
+                    f"CREATE TABLE {get_workflow_partition_name(workflow_id)} "
+                    f"PARTITION OF {PARTITIONED_TABLE} "
+                    f"FOR VALUES IN ({_quote_literal(connection, workflow_id)})"
+                )
+            )
+
+        connection.execute(
+            text(
+                f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARTITIONED_TABLE} "
+                "DEFAULT PARTITION BY HASH (workflow_id)"
+            )
+        )
+        for remainder in range(hash_partitions):
+            connection.execute(
+                text(
+                    f"CREATE TABLE {get_hash_partition_name(remainder)} "
+                    f"PARTITION OF {DEFAULT_PARTITION} "
+                    f"FOR VALUES WITH (MODULUS {hash_partitions}, "
+                    f"REMAINDER {remainder})"
+                )
+            )
+
+    logger.info(
+        f"Created {PARTITIONED_TABLE} with {hash_partitions} hash partitions and "
+        f"{len(dedicated_workflow_ids or [])} dedicated workflow partitions"
+    )
+
+
+def install_mirror_trigger() -> None:
+    """Mirror writes to chunks into chunks_partitioned until the swap."""
+    with engine.begin() as connection:
+        connection.execute(text(MIRROR_FUNCTION))
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {MIRROR_TRIGGER} ON chunks"))
+        connection.execute(
+            text(
+                f"CREATE TRIGGER {MIRROR_TRIGGER} "
+                "AFTER INSERT OR UPDATE OR DELETE ON chunks "
+                f"FOR EACH ROW EXECUTE FUNCTION {MIRROR_TRIGGER}()"
+            )
+        )
+
+
+def copy_chunks_batch(after_id: str, batch_size: int) -> Tuple[Optional[str], int]:
+    """
+    Copy the next `batch_size` chunks by id into chunks_partitioned. Returns
+    the last id copied (None when done) and the number of rows read.
+    """
+    with engine.begin() as connection:
+        row = (
+            connection.execute(
+                text(COPY_BATCH_QUERY),
+                {"after_id": after_id, "batch_size": batch_size},
+            )
+            .mappings()
+            .one()
+        )
+    return row["last_id"], row["row_count"]
+
+
+def _rename_relations(
+    connection, table_name: str, prefix: str, new_prefix: str
+) -> None:
+    """Rename the constraints and indexes of a table from one prefix to another."""
+    constraints = (
+        connection.execute(text(CONSTRAINTS_QUERY), {"table_name": table_name})
+        .scalars()
+        .all()
+    )
+    indexes = (
+        connection.execute(text(INDEXES_QUERY), {"table_name": table_name})
+        .mappings()
+        .all()
+    )
+
+    for name in constraints:
+        if name.startswith(prefix):
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table_name} RENAME CONSTRAINT {name} "
+                    f"TO {new_prefix}{name[len(prefix) :]}"
+                )
+            )
+    for index in indexes:
+        if index["name"].startswith(prefix):
+            connection.execute(
+                text(
+                    f"ALTER INDEX {index['name']} "
+                    f"RENAME TO {new_prefix}{index['name'][len(prefix) :]}"
+                )
+            )
+
+
+def swap_partitioned_chunks_table(lock_timeout: str = "10s") -> None:
+    """
+    Replace chunks with chunks_partitioned in one short transaction. The old
+    table is kept as chunks_unpartitioned (with its indexes and constraints
+    renamed to match) for rollback until it is dropped.
+
+    Prepared statements (see database.prepare_search_statements) stay bound
+    to the old table, so the API processes must be restarted afterwards.
+    """
+    with engine.begin() as connection:
+        connection.execute(
+            text("SELECT set_config('lock_timeout', :value, true)"),
+            {"value": lock_timeout},
+        )
+        connection.execute(text("LOCK TABLE chunks IN ACCESS EXCLUSIVE MODE"))
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {MIRROR_TRIGGER} ON chunks"))
+
+        _rename_relations(connection, "chunks", "chunks_", f"{UNPARTITIONED_TABLE}_")
+        connection.execute(text(f"ALTER TABLE chunks RENAME TO {UNPARTITIONED_TABLE}"))
+
+        _rename_relations(
+            connection, PARTITIONED_TABLE, f"{PARTITIONED_TABLE}_", "chunks_"
+        )
+        connection.execute(text(f"ALTER TABLE {PARTITIONED_TABLE} RENAME TO chunks"))
+        connection.execute(text(f"DROP FUNCTION IF EXISTS {MIRROR_TRIGGER}()"))
+
+    chunks_partition_cache.clear()
+    logger.info("Swapped chunks for its partitioned copy")
+
+
+def _copy_workflow_batch(
+    partition: str, workflow_id: str, after_id: str, batch_size: int
+) -> Tuple[Optional[str], int]:
+    """Copy the next batch of a workflow's chunks into a standalone table."""
+    with engine.begin() as connection:
+        row = (
+            connection.execute(
+                text(
+                    f"""
+                    WITH batch AS (
+                        SELECT * FROM chunks
+                        WHERE workflow_id = :workflow_id AND id > :after_id
+                        ORDER BY id
+                        LIMIT :batch_size
+                        FOR SHARE
+                    ), copied AS (
+                        INSERT INTO {partition} SELECT * FROM batch
+                        ON CONFLICT (id, workflow_id) DO NOTHING
+                    )
+                    SELECT max(id) AS last_id, count(*) AS row_count FROM batch
+                    """
+                ),
+                {
+                    "workflow_id": workflow_id,
+                    "after_id": after_id,
+                    "batch_size": batch_size,
+                },
+            )
+            .mappings()
+            .one()
+        )
+    return row["last_id"], row["row_count"]
+
+
+def _create_partition_indexes(partition: str) -> None:
+    """
+    Build the indexes of the chunks parent on a standalone table, concurrently
+    and under the names ATTACH PARTITION would give them, so attaching it
+    reuses them instead of building them under lock.
+    """
+    with engine.connect() as connection:
+        indexes = (
+            connection.execute(text(INDEXES_QUERY), {"table_name": "chunks"})
+            .mappings()
+            .all()
+        )
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for index in indexes:
+            name = f"{partition}_{index['name'][len('chunks_') :]}"
+            definition = re.sub(
+                r"^CREATE (UNIQUE )?INDEX \S+ ON ONLY \S+ ",
+                rf"CREATE \1INDEX CONCURRENTLY IF NOT EXISTS {name} ON {partition} ",
+                index["definition"],
+            )
+            logger.info(f"Building index {name}")
+            connection.execute(text(definition))
+
+
+def _exclude_workflow_from_default(
+    workflow_literal: str, partition: str, lock_timeout: str
+) -> List[str]:
+    """
+    Add a NOT VALID CHECK (workflow_id <> the workflow) to every leaf of
+    chunks_default, each in its own short transaction. Returns the leaves.
+    """
+    leaves = [
+        table["name"]
+        for table in get_chunks_partitions(DEFAULT_PARTITION)
+        if table["is_leaf"]
+    ]
+    for leaf in leaves:
+        with engine.begin() as connection:
+            connection.execute(
+                text("SELECT set_config('lock_timeout', :value, true)"),
+                {"value": lock_timeout},
+            )
+            connection.execute(
+                text(
+                    f"""
+                    DO $$
+                    BEGIN
+                        ALTER TABLE {leaf} ADD CONSTRAINT {leaf}_{partition}_excluded
+                        CHECK (workflow_id <> {workflow_literal}) NOT VALID;
+                    EXCEPTION WHEN duplicate_object THEN NULL;
+                    END $$
+                    """
+                )
+            )
+    return leaves
+
+
+def _delete_workflow_from_default(workflow_id: str, batch_size: int) -> int:
+    """
+    Delete a workflow's rows from chunks_default in batches, without
+    mirroring the deletes to its standalone table. Returns the rows deleted.
+    """
+    deleted = 0
+    while True:
+        with engine.begin() as connection:
+            connection.execute(
+                text("SELECT set_config(:name, :workflow_id, true)"),
+                {"name": MOVING_WORKFLOW_SETTING, "workflow_id": workflow_id},
+            )
+            row_count: int = connection.execute(
+                text(
+                    f"""
+                    DELETE FROM {DEFAULT_PARTITION}
+                    WHERE workflow_id = :workflow_id
+                      AND id IN (
+                          SELECT id FROM {DEFAULT_PARTITION}
+                          WHERE workflow_id = :workflow_id
+                          LIMIT :batch_size
+                      )
+                    """
+                ),
+                {"workflow_id": workflow_id, "batch_size": batch_size},
+            ).rowcount
+        if not row_count:
+            return deleted
+        deleted += row_count
+        logger.info(
+            f"Deleted {deleted} chunks of workflow {workflow_id} from chunks_default"
+        )
+
+
+def dedicate_workflow_partition(
+    workflow_id: str, batch_size: int = 5000, lock_timeout: str = "10s"
+) -> Dict[str, Any]:
+    """
+    Move a very large workflow out of the shared hash partitions into its own
+    list partition, with its own vector indexes.
+
+    The rows are copied into a standalone table while the workflow stays
+    live, with a trigger on chunks_default mirroring its writes into the table
+    as in the main migration. Then the trigger diverts the workflow's new
+    writes to the table only, every leaf of chunks_default gets a NOT VALID
+    CHECK excluding the workflow, and its rows are deleted from the shared
+    partition in batches. Once the checks are validated (which does not block
+    writes), ATTACH PARTITION knows chunks_default holds none of its rows and
+    skips scanning it, so the final step only holds its lock for catalog
+    changes.
+
+    Between the diversion and the attach, the workflow's own searches miss
+    the rows already moved; other workflows are not affected.
+    """
+    partition = get_workflow_partition_name(workflow_id)
+    if not is_chunks_partitioned():
+        raise RuntimeError("chunks is not partitioned, run the migration first")
+
+    with engine.begin() as connection:
+        attached = connection.execute(
+            text(
+                "SELECT 1 FROM pg_inherits "
+                "WHERE inhrelid = to_regclass(:partition) "
+                "AND inhparent = 'chunks'::regclass"
+            ),
+            {"partition": partition},
+        ).scalar()
+        if attached:
+            return {"success": True, "action": "skipped", "partition": partition}
+
+        workflow_literal = _quote_literal(connection, workflow_id)
+        if not connection.execute(
+            text("SELECT to_regclass(:partition)"), {"partition": partition}
+        ).scalar():
+            connection.execute(
+                text(f"CREATE TABLE {partition} (LIKE chunks INCLUDING DEFAULTS)")
+            )
+            # The CHECK constraint lets ATTACH PARTITION skip validating rows
+            connection.execute(
+                text(
+                    f"ALTER TABLE {partition} "
+                    f"ADD CONSTRAINT {partition}_pkey PRIMARY KEY (id, workflow_id), "
+                    f"ADD CONSTRAINT {partition}_workflow_check "
+                    f"CHECK (workflow_id = {workflow_literal})"
+                )
+            )
+
+        triggers = set(
+            connection.execute(
+                text(
+                    "SELECT tgname FROM pg_trigger "
+                    "WHERE tgrelid = CAST(:table_name AS regclass) "
+                    "AND tgname IN (:mirror, :divert)"
+                ),
+                {
+                    "table_name": DEFAULT_PARTITION,
+                    "mirror": f"{partition}_mirror",
+                    "divert": f"{partition}_divert",
+                },
+            ).scalars()
+        )
+        # Rows copied without the trigger may be stale, start over
+        if not triggers:
+            connection.execute(text(f"TRUNCATE {partition}"))
+            connection.execute(text(WORKFLOW_MIRROR_FUNCTION))
+            connection.execute(
+                text(
+                    f"CREATE TRIGGER {partition}_mirror "
+                    f"AFTER INSERT OR UPDATE OR DELETE ON {DEFAULT_PARTITION} "
+                    f"FOR EACH ROW EXECUTE FUNCTION {WORKFLOW_MIRROR_TRIGGER}"
+                    f"('{partition}', {workflow_literal})"
+                )
+            )
+
+    # Rows diverted already are only in the table, copying would be pointless
+    if f"{partition}_divert" not in triggers:
+        copied = 0
+        after_id = ""
+        while True:
+            last_id, row_count = _copy_workflow_batch(
+                partition, workflow_id, after_id, batch_size
+            )
+            if last_id is None:
+                break
+            copied += row_count
+            after_id = last_id
+            logger.info(
+                f"Copied {copied} chunks of workflow {workflow_id} to {partition}"
+            )
+
+    _create_partition_indexes(partition)
+
+    with engine.begin() as connection:
+        connection.execute(
+            text("SELECT set_config('lock_timeout', :value, true)"),
+            {"value": lock_timeout},
+        )
+        connection.execute(
+            text(f"DROP TRIGGER IF EXISTS {partition}_mirror ON {DEFAULT_PARTITION}")
+        )
+        connection.execute(
+            text(f"DROP TRIGGER IF EXISTS {partition}_divert ON {DEFAULT_PARTITION}")
+        )
+        connection.execute(
+            text(
+                f"CREATE TRIGGER {partition}_divert "
+                f"BEFORE INSERT OR UPDATE OR DELETE ON {DEFAULT_PARTITION} "
+                f"FOR EACH ROW EXECUTE FUNCTION {WORKFLOW_MIRROR_TRIGGER}"
+                f"('{partition}', {workflow_literal})"
+            )
+        )
+
+    leaves = _exclude_workflow_from_default(workflow_literal, partition, lock_timeout)
+    moved = _delete_workflow_from_default(workflow_id, batch_size)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for leaf in leaves:
+            constraint = f"{leaf}_{partition}_excluded"
+            logger.info(f"Validating {constraint}")
+            connection.execute(
+                text(f"ALTER TABLE {leaf} VALIDATE CONSTRAINT {constraint}")
+            )
+
+    with engine.begin() as connection:
+        connection.execute(
+            text("SELECT set_config('lock_timeout', :value, true)"),
+            {"value": lock_timeout},
+        )
+        connection.execute(
+            text(f"DROP TRIGGER {partition}_divert ON {DEFAULT_PARTITION}")
+        )
+        connection.execute(
+            text(
+                f"ALTER TABLE chunks ATTACH PARTITION {partition} "
+                f"FOR VALUES IN ({workflow_literal})"
+            )
+        )
+        connection.execute(
+            text(f"ALTER TABLE {partition} DROP CONSTRAINT {partition}_workflow_check")
+        )
+        # chunks_default's partition bound now excludes the workflow
+        for leaf in leaves:
+            connection.execute(
+                text(f"ALTER TABLE {leaf} DROP CONSTRAINT {leaf}_{partition}_excluded")
+            )
+
+    # Other processes notice on their next insert (see save_chunks_to_db)
+    chunks_partition_cache.delete(workflow_id)
+    invalidate_workflow_search_cache(workflow_id)
+    logger.info(f"Moved {moved} chunks of workflow {workflow_id} to {partition}")
+    return {
+        "success": True,
+        "action": "created",
+        "partition": partition,
+        "chunks_moved": moved,
+    }
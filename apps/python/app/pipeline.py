@@ -0,0 +1,204 @@
+"""
+Stage-parallel ingestion pipeline.
+
+Stages (fetch -> extract -> chunk -> embed -> persist) are connected by
+bounded asyncio queues and each runs its own pool of workers, so the
+network-, CPU- and DB-bound work of different resources overlaps instead of
+each resource going through every step in sequence. A full queue blocks the
+stage feeding it, which bounds the memory held by downloaded documents and
+embedded batches.
+
+The pipeline only moves work between stages; leasing, completing and failing
+jobs is left to its owner (see jobs.py) through `on_complete`/`on_error`.
+A cancelled job is dropped before its next stage, and the step it is running
+is cancelled; its owner is told through `on_cancel`.
+"""
+
+import asyncio
+import logging
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+logger = logging.getLogger(__name__)
+
+StageHandler = Callable[..., Coroutine[Any, Any, Tuple[Optional[str], Any]]]
+CompleteCallback = Callable[[Dict[str, Any], Any], Awaitable[None]]
+ErrorCallback = Callable[[Dict[str, Any], Exception], Awaitable[None]]
+CancelCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class Stage:
+    """A queue of jobs waiting for one step and the workers draining it."""
+
+    def __init__(self, name: str, handler: StageHandler, workers: int, queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def free_slots(self) -> int:
+        """Jobs that can be queued without blocking."""
+        return self.queue.maxsize - self.queue.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "workers": self.workers,
+            "busy": self.busy,
+            "processed": self.processed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+
+
+class Pipeline:
+    """Runs jobs through stage handlers, each stage with its own workers."""
+
+    def __init__(
+        self,
+        handlers: Dict[str, StageHandler],
+        workers: Dict[str, int],
+        queue_size: int,
+        on_complete: CompleteCallback,
+        on_error: ErrorCallback,
+        on_cancel: CancelCallback,
+    ):
+        self.stages = {
+            name: Stage(name, handler, max(workers.get(name, 1), 1), queue_size)
+            for name, handler in handlers.items()
+        }
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self._tasks: List[asyncio.Task] = []
+        # Jobs queued or running, steps being run, and jobs to drop, by job id
+        self._jobs: Set[str] = set()
+        self._steps: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+
+    def start(self):
+        """Start the workers of every stage."""
+        for stage in self.stages.values():
+            for _ in range(stage.workers):
+                self._tasks.append(asyncio.create_task(self.run_stage(stage)))
+
+    async def stop(self):
+        """Cancel the workers; jobs still queued are dropped."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._jobs.clear()
+        self._cancelled.clear()
+
+    def free_slots(self, stage_name: str) -> int:
+        return self.stages[stage_name].free_slots()
+
+    async def submit(self, stage_name: str, job: Dict[str, Any], data: Any = None):
+        """Queue a job at a stage, waiting while the stage is full."""
+        self._jobs.add(job["id"])
+        await self.stages[stage_name].queue.put((job, data))
+
+    def take_unstarted(self) -> List[Dict[str, Any]]:
+        """
+        Remove and return the jobs still waiting for their first step. Jobs
+        past it (which always carry data from the stage before) stay queued.
+        """
+        unstarted = []
+        for stage in self.stages.values():
+            waiting = []
+            while not stage.queue.empty():
+                waiting.append(stage.queue.get_nowait())
+                stage.queue.task_done()
+            for job, data in waiting:
+                if data is None:
+                    self._forget(job["id"])
+                    unstarted.append(job)
+                else:
+                    stage.queue.put_nowait((job, data))
+        return unstarted
+
+    def cancel(self, job_id: str):
+        """
+        Cancel the running step of a job and drop it before its next stage.
+        Jobs not queued or running here are ignored.
+        """
+        if job_id not in self._jobs:
+            return
+        self._cancelled.add(job_id)
+        step = self._steps.get(job_id)
+        if step:
+            step.cancel()
+
+    def _forget(self, job_id: str):
+        """Stop tracking a job that left the pipeline."""
+        self._jobs.discard(job_id)
+        self._cancelled.discard(job_id)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-stage queue depth, capacity, workers and throughput."""
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+    async def run_stage(self, stage: Stage):
+        """Worker loop: handle a job, then pass it on or report the outcome."""
+        while True:
+            job, data = await stage.queue.get()
+            stage.busy += 1
+            try:
+                # Checked between stages: a cancelled job goes no further
+                step: Optional[asyncio.Task] = None
+                if job["id"] not in self._cancelled:
+                    step = asyncio.create_task(stage.handler(job, data))
+                    self._steps[job["id"]] = step
+                    try:
+                        await asyncio.wait([step])
+                    finally:
+                        self._steps.pop(job["id"], None)
+                        step.cancel()
+
+                if step is None or step.cancelled() or job["id"] in self._cancelled:
+                    self._forget(job["id"])
+                    stage.cancelled += 1
+                    await self.on_cancel(job)
+                    continue
+
+                error = step.exception()
+                if error:
+                    stage.failed += 1
+                    self._forget(job["id"])
+                    await self.on_error(job, error)  # type: ignore[arg-type]
+                    continue
+
+                next_stage, result = step.result()
+                stage.processed += 1
+                if next_stage is None:
+                    self._forget(job["id"])
+                    await self.on_complete(job, result)
+                else:
+                    await self.submit(next_stage, job, result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the worker alive; the job's lease expires and it is retried
+                self._forget(job["id"])
+                logger.error(
+                    f"Ingestion pipeline {stage.name} worker failed on job "
+                    f"{job.get('id')}: {str(e)}"
+                )
+            finally:
+                stage.busy -= 1
+                stage.queue.task_done()
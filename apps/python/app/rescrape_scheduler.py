@@ -0,0 +1,137 @@
+"""
+In-service rescrape scheduler, replacing the external cron that posts
+resource lists to /api/v1/rescrape.
+
+Every RESCRAPE_SCHEDULER_INTERVAL_SECONDS it leases the resources that are
+due according to their scrape_frequency and last_scraped_at (see
+CLAIM_DUE_RESCRAPES_QUERY) and rescrapes them through the same rescrape
+slots as the endpoint, so at most ADMISSION_MAX_IN_FLIGHT_RESCRAPES run at
+once per process. Any number of nodes can run it: the lease on
+last_scraped_at hands each due resource to one of them.
+
+Outcomes are summarized on Discord every RESCRAPE_SUMMARY_INTERVAL_SECONDS
+(see RescrapeReport). Plan size limits are still only checked by the
+TypeScript cron.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Set
+
+from .admission import rescrape_slots
+from .config import settings
+from .database import claim_due_rescrapes, get_resources_by_ids
+from .discord import RescrapeReport
+from .models import Resource
+from .schemas import ResourceBase
+from .services import rescrape_resource_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class RescrapeScheduler:
+    """Periodically leases due resources and rescrapes them."""
+
+    def __init__(self):
+        self._running: Set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.report = RescrapeReport("scheduler")
+
+    def start(self):
+        """Start scheduling in the background."""
+        self._task = asyncio.create_task(self.run())
+        self.report.start()
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Stop leasing and wait for the rescrapes already started."""
+        self._stopping.set()
+        if self._task:
+            await self._task
+        if self._running:
+            await asyncio.wait(self._running, timeout=timeout)
+        await self.report.close()
+
+    async def run(self):
+        """Lease due resources every interval until stopped."""
+        logger.info("Rescrape scheduler started")
+        while not self._stopping.is_set():
+            try:
+                await self.schedule_due_resources()
+            except Exception as e:
+                logger.error(f"Rescrape scheduler tick failed: {str(e)}")
+
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), settings.RESCRAPE_SCHEDULER_INTERVAL_SECONDS
+                )
+            except asyncio.TimeoutError:
+                pass
+        logger.info("Rescrape scheduler stopped")
+
+    async def schedule_due_resources(self) -> int:
+        """Lease due resources, without piling up more than a batch waiting."""
+        limit = settings.RESCRAPE_SCHEDULER_BATCH_SIZE - rescrape_slots.waiting
+        if limit <= 0:
+            return 0
+
+        resources = await asyncio.to_thread(
+            claim_due_rescrapes, limit, settings.RESCRAPE_SCHEDULER_SPREAD
+        )
+        if not resources:
+            return 0
+
+        # One query for the stored rows of the whole batch
+        resources_by_id = await asyncio.to_thread(
+            get_resources_by_ids, [resource["id"] for resource in resources]
+        )
+        for resource in resources:
+            task = asyncio.create_task(
+                self.rescrape(resource, resources_by_id.get(resource["id"]))
+            )
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+        logger.info(f"Scheduled {len(resources)} due rescrapes")
+        return len(resources)
+
+    async def rescrape(
+        self, resource: Dict[str, Any], existing_resource: Optional[Resource] = None
+    ):
+        """Rescrape one leased resource in a rescrape slot."""
+        scrape_frequency = (
+            existing_resource.scrape_frequency if existing_resource else None
+        )
+        started_at = time.monotonic()
+        try:
+            async with rescrape_slots.slot():
+                result = await rescrape_resource_embeddings(
+                    resource=ResourceBase(
+                        id=resource["id"],
+                        url=resource["url"],
+                        type=resource["type"],
+                        title=resource["title"],
+                    ),
+                    workflow_id=resource["workflow_id"],
+                    knowledge_id=resource["knowledge_id"],
+                    context_id=resource["context_id"] or "",
+                    save_to_db=True,
+                    user_id=resource["user_id"],
+                    existing_resource=existing_resource,
+                )
+            self.report.record(
+                resource["id"],
+                "cache_hit" if result.get("status") == "skipped" else "refreshed",
+                time.monotonic() - started_at,
+                scrape_frequency,
+            )
+        except Exception as e:
+            logger.error(f"Scheduled rescrape of {resource['id']} failed: {str(e)}")
+            self.report.record(
+                resource["id"],
+                "failed",
+                time.monotonic() - started_at,
+                scrape_frequency,
+                str(e),
+            )
@@ -0,0 +1,163 @@
+import logging
+from typing import Literal
+
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    status,
+)
+
+from ..auth import invalidate_token, invalidate_user_tokens
+from ..cache import CACHES
+from ..dependencies import verify_admin_secret
+from ..schemas import (
+    CacheStatsResponse,
+    InvalidateTokensRequest,
+    InvalidateTokensResponse,
+    PipelineStatusResponse,
+    VectorIndexBuildRequest,
+    VectorIndexStatusResponse,
+)
+from ..vector_index import (
+    build_chunks_embedding_index,
+    drop_chunks_embedding_index,
+    get_chunks_embedding_index_status,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/api/v1/admin",
+    tags=["admin"],
+    dependencies=[Depends(verify_admin_secret)],
+)
+
+
+def run_index_build(request: VectorIndexBuildRequest):
+    """Build the vector index, logging instead of raising (background task)."""
+    try:
+        build_chunks_embedding_index(
+            method=request.method,
+            rebuild=request.rebuild,
+            m=request.m,
+            ef_construction=request.ef_construction,
+            lists=request.lists,
+            quantization=request.quantization,
+            dimensions=request.dimensions,
+        )
+    except Exception as e:
+        logger.error(f"Failed to build vector index: {str(e)}")
+
+
+QUANTIZATION_QUERY = Query("none", pattern="^(none|halfvec|binary)$")
+DIMENSIONS_QUERY = Query(1536)
+
+
+@router.get("/search-index", response_model=VectorIndexStatusResponse)
+def get_search_index_status(
+    quantization: str = QUANTIZATION_QUERY,
+    dimensions: Literal[256, 512, 1024, 1536] = DIMENSIONS_QUERY,
+):
+    """Return the state of a chunks vector index and any build in progress."""
+    try:
+        return VectorIndexStatusResponse(
+            **get_chunks_embedding_index_status(quantization, dimensions)
+        )
+    except Exception as e:
+        logger.error(f"Error reading vector index status: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to read vector index status: {str(e)}",
+        )
+
+
+@router.post(
+    "/search-index",
+    response_model=VectorIndexStatusResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def build_search_index(
+    request: VectorIndexBuildRequest, background_tasks: BackgroundTasks
+):
+    """
+    Build or rebuild the chunks vector index concurrently. The build runs in
+    the background; poll GET /api/v1/admin/search-index for progress.
+    """
+    index_status = get_chunks_embedding_index_status(
+        request.quantization, request.dimensions
+    )
+    if index_status["build_in_progress"]:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="An index build is already in progress",
+        )
+
+    background_tasks.add_task(run_index_build, request)
+    logger.info(f"Queued vector index build: {request.model_dump()}")
+
+    return VectorIndexStatusResponse(**index_status)
+
+
+@router.delete("/search-index", response_model=VectorIndexStatusResponse)
+def drop_search_index(
+    quantization: str = QUANTIZATION_QUERY,
+    dimensions: Literal[256, 512, 1024, 1536] = DIMENSIONS_QUERY,
+):
+    """
+    Drop a chunks vector index, e.g. the full-precision index once
+    SEARCH_QUANTIZATION serves search from a quantized one.
+    """
+    try:
+        drop_chunks_embedding_index(quantization, dimensions)
+        return VectorIndexStatusResponse(
+            **get_chunks_embedding_index_status(quantization, dimensions)
+        )
+    except Exception as e:
+        logger.error(f"Error dropping vector index: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to drop vector index: {str(e)}",
+        )
+
+
+@router.get("/pipeline", response_model=PipelineStatusResponse)
+def get_pipeline_status(request: Request):
+    """
+    Return the per-stage queue depth of this process's ingestion pipeline.
+    Standalone workers log theirs every PIPELINE_STATS_INTERVAL_SECONDS.
+    """
+    consumer = getattr(request.app.state, "job_consumer", None)
+    if consumer is None:
+        return PipelineStatusResponse(enabled=False)
+    return PipelineStatusResponse(enabled=True, **consumer.stats())
+
+
+@router.get("/caches", response_model=CacheStatsResponse)
+def get_cache_stats():
+    """Return the size and hit rate of this process's in-memory caches."""
+    return CacheStatsResponse(
+        caches={name: cache.stats() for name, cache in CACHES.items()}
+    )
+
+
+@router.post("/auth/invalidate", response_model=InvalidateTokensResponse)
+def invalidate_verified_tokens(request: InvalidateTokensRequest):
+    """
+    Forget verified tokens of a user or a single token in this process, e.g.
+    after a logout or a ban, instead of waiting for them to expire.
+    """
+    if not request.user_id and not request.token:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Either userId or token is required",
+        )
+    invalidated = 0
+    if request.token:
+        invalidated += int(invalidate_token(request.token))
+    if request.user_id:
+        invalidated += invalidate_user_tokens(request.user_id)
+    return InvalidateTokensResponse(invalidated=invalidated)
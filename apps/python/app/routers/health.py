@@ -1,15 +1,32 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 
 from ..config import settings
-from ..schemas import HealthResponse
+from ..schemas import DrainStatusResponse, HealthResponse
 
 router = APIRouter(prefix="/health", tags=["health"])
 
 
 @router.get("/", response_model=HealthResponse)
-def health_check():
-    """Health check endpoint."""
+def health_check(request: Request):
+    """
+    Health check endpoint. Reports "draining" with the progress of the job
+    consumer once the process is shutting down.
+    """
     try:
+        consumer = getattr(request.app.state, "job_consumer", None)
+        drain = consumer.drain_stats() if consumer else None
+        if drain:
+            left = drain["seconds_left"]
+            return HealthResponse(
+                status="draining",
+                message=(
+                    f"Shutting down: {drain['in_flight']} jobs running, "
+                    f"{drain['requeued']} requeued"
+                    + (f", {left:.0f}s left" if left is not None else "")
+                ),
+                drain=DrainStatusResponse(**drain),
+            )
+
         missing_vars = settings.required_vars_missing
 
         if missing_vars:
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from ..metrics import get_metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics of this process. Collected on the event loop, where the
+    job consumer and the caches are updated.
+    """
+    return Response(content=get_metrics(), media_type=CONTENT_TYPE_LATEST)
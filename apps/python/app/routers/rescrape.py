@@ -1,16 +1,22 @@
 import asyncio
 import logging
-from datetime import datetime
-from typing import Any, Dict
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException, status
+from fastapi import APIRouter, HTTPException, status
 
+from ..admission import admit_ingestion, rescrape_slots
 from ..config import settings
+from ..database import get_resources_by_ids
+from ..discord import RescrapeReport
+from ..models import Resource
 from ..schemas import (
     CreateResourceResponse,
     RescrapeRequest,
 )
 from ..services import rescrape_resource_embeddings
+from ..tracing import set_span_attributes, traced
 
 logger = logging.getLogger(__name__)
 
@@ -21,40 +27,70 @@ router = APIRouter(
 
 
 async def track_rescrape_with_stats(
-    background_tasks: BackgroundTasks,
     resource,
     workflow_id: str,
     knowledge_id: str,
     context_id: str,
+    user_id: str,
+    report: RescrapeReport,
+    existing_resource: Optional[Resource] = None,
 ) -> Dict[str, Any]:
-    """Wrapper to track rescrape statistics."""
+    """Wrapper to track rescrape statistics and report them to the run's summary."""
+    scrape_frequency = existing_resource.scrape_frequency if existing_resource else None
+    started_at = time.monotonic()
     try:
-        result = await rescrape_resource_embeddings(
-            background_tasks=background_tasks,
-            resource=resource,
-            workflow_id=workflow_id,
-            knowledge_id=knowledge_id,
-            context_id=context_id,
-            save_to_db=True,
+        # Bounds the documents this process downloads and extracts at once
+        async with rescrape_slots.slot():
+            result = await rescrape_resource_embeddings(
+                resource=resource,
+                workflow_id=workflow_id,
+                knowledge_id=knowledge_id,
+                context_id=context_id,
+                save_to_db=True,
+                user_id=user_id,
+                existing_resource=existing_resource,
+            )
+        was_cache_hit = result.get("status") == "skipped"
+        report.record(
+            resource.id,
+            "cache_hit" if was_cache_hit else "refreshed",
+            time.monotonic() - started_at,
+            scrape_frequency,
         )
         return {
             "resource_id": resource.id,
-            "was_cache_hit": result.get("status") == "skipped",
+            "was_cache_hit": was_cache_hit,
             "result": result,
         }
     except Exception as e:
         logger.error(f"Error processing resource {resource.id}: {str(e)}")
+        report.record(
+            resource.id,
+            "failed",
+            time.monotonic() - started_at,
+            scrape_frequency,
+            str(e),
+        )
         return {"resource_id": resource.id, "was_cache_hit": False, "error": str(e)}
 
 
 @router.post("/rescrape", response_model=CreateResourceResponse)
-async def rescrape_resource(
-    request: RescrapeRequest, background_tasks: BackgroundTasks
-):
+@traced("rescrape")
+async def rescrape_resource(request: RescrapeRequest):
     """
     Rescrape a resource.
     Do basicaly the same as create-resource but checking for the RESCRAPE_CRON_SECRET
+
+    At most ADMISSION_MAX_IN_FLIGHT_RESCRAPES resources are rescraped at once
+    per process; answers 429 with Retry-After while overloaded. The request is
+    one trace, joined by the ingestions it queues.
     """
+    set_span_attributes(
+        {
+            "workflow.id": request.workflow_id,
+            "rescrape.resources": len(request.resources),
+        }
+    )
     try:
         if request.rescrape_secret != settings.RESCRAPE_CRON_SECRET:
             raise HTTPException(
@@ -65,23 +101,43 @@ async def rescrape_resource(
         logger.info(
             f"Processing rescrape request for {len(request.resources)} resources"
         )
-        start_time = datetime.utcnow()
+        await admit_ingestion(
+            request.workflow_id,
+            len(request.resources),
+            rescrape_count=len(request.resources),
+        )
+        start_time = datetime.now(timezone.utc)
+
+        # Load the stored rows of all requested resources in one query
+        resources_by_id = await asyncio.to_thread(
+            get_resources_by_ids,
+            [resource.id for resource in request.resources if resource.id],
+        )
 
-        # Process all resources and collect statistics
+        # Process all resources and collect statistics, summarized on Discord
+        report = RescrapeReport(f"run of workflow {request.workflow_id}")
+        report.start()
         tasks = []
         for resource in request.resources:
             logger.info(f"Processing resource {resource.id}")
             task = track_rescrape_with_stats(
-                background_tasks=background_tasks,
                 resource=resource,
                 workflow_id=request.workflow_id,
                 knowledge_id=request.knowledge_id,
                 context_id=request.context_id or "",
+                user_id=request.user_id,
+                report=report,
+                existing_resource=(
+                    resources_by_id.get(resource.id) if resource.id else None
+                ),
             )
             tasks.append(task)
 
         # Wait for all tasks to complete
-        results = await asyncio.gather(*tasks)
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            await report.close()
 
         # Calculate statistics for logging
         total_resources = len(request.resources)
@@ -91,7 +147,7 @@ async def rescrape_resource(
         )
         failed = sum(1 for r in results if "error" in r)
 
-        end_time = datetime.utcnow()
+        end_time = datetime.now(timezone.utc)
         duration = (end_time - start_time).total_seconds()
 
         logger.info(
@@ -104,6 +160,8 @@ async def rescrape_resource(
             resources=[resource.dict() for resource in request.resources],
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in rescrape task: {str(e)}")
 
@@ -1,13 +1,23 @@
+import asyncio
 import logging
+from typing import Any, Dict, Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 
+from ..admission import admit_ingestion, get_ingestion_load
+from ..database import (
+    cancel_resource_ingestion,
+    get_resource_owner,
+    get_workflow_owner,
+)
 from ..dependencies import verify_auth_token
 from ..schemas import (
+    CancelResourceResponse,
     CreateResourceRequest,
     CreateResourceResponse,
+    IngestionLoadResponse,
 )
-from ..services import process_resource_embeddings
+from ..services import enqueue_resource_processing
 
 logger = logging.getLogger(__name__)
 
@@ -17,33 +27,34 @@ router = APIRouter(
 
 
 @router.post("/create-resource", response_model=CreateResourceResponse)
-async def create_resource_task(
-    request: CreateResourceRequest, background_tasks: BackgroundTasks
-):
+async def create_resource_task(request: CreateResourceRequest):
     """
     Create and process multiple resources with chunking, embeddings, and
     database storage. Equivalent to the TypeScript createResourceTask.
+
+    Processing is queued as durable ingestion jobs, so it is picked up by
+    any worker and survives restarts of this process. Answers 429 with
+    Retry-After while the queue is overloaded (see admission.py).
     """
     try:
         logger.info(
             f"Processing create-resource request for {len(request.resources)} resources"
         )
 
-        # Queue background tasks for embedding generation
-        for resource in request.resources:
-            logger.info(f"Queuing embedding generation for resource {resource.id}")
-            background_tasks.add_task(
-                process_resource_embeddings,
-                background_tasks=background_tasks,
-                resource=resource,
-                knowledge_id=request.knowledge_id or "",
-                workflow_id=request.workflow_id,
-                context_id=request.context_id or "",
-                save_to_db=True,
-            )
+        await admit_ingestion(request.workflow_id, len(request.resources))
+
+        # Queue ingestion jobs for embedding generation
+        enqueue_resource_processing(
+            request.resources,
+            workflow_id=request.workflow_id,
+            knowledge_id=request.knowledge_id,
+            context_id=request.context_id,
+            save_to_db=True,
+            user_id=request.user_id,
+        )
 
         logger.info(
-            f"Queued {len(request.resources)} embedding tasks for background processing"
+            f"Queued {len(request.resources)} resources for background processing"
         )
 
         return CreateResourceResponse(
@@ -51,9 +62,78 @@ async def create_resource_task(
             resources=[resource.dict() for resource in request.resources],
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in create-resource task: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process resources: {str(e)}",
         )
+
+
+@router.post("/resources/{resource_id}/cancel", response_model=CancelResourceResponse)
+async def cancel_resource(
+    resource_id: str,
+    request: Request,
+    claims: Dict[str, Any] = Depends(verify_auth_token),
+):
+    """
+    Cancel the ingestion of a resource, e.g. before deleting it. Its queued
+    jobs never run and its running ones are stopped, killing their document
+    conversion: at once in this process, and within
+    JOB_CANCEL_POLL_INTERVAL_SECONDS on other workers. The chunks it stored
+    are deleted, and the resource is marked FAILED if it was still PENDING.
+    Resources of another user's workflow are reported as not found.
+    """
+    try:
+        owner_id = await asyncio.to_thread(get_resource_owner, resource_id)
+        if owner_id is None or owner_id != claims.get("sub"):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Resource {resource_id} not found",
+            )
+
+        cancelled_jobs = await asyncio.to_thread(cancel_resource_ingestion, resource_id)
+        if cancelled_jobs is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Resource {resource_id} not found",
+            )
+
+        consumer = getattr(request.app.state, "job_consumer", None)
+        if consumer:
+            consumer.cancel_resource(resource_id)
+
+        return CancelResourceResponse(
+            success=True, resource_id=resource_id, cancelled_jobs=cancelled_jobs
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error cancelling resource {resource_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to cancel resource: {str(e)}",
+        )
+
+
+@router.get("/ingestion-load", response_model=IngestionLoadResponse)
+async def get_ingestion_load_status(
+    workflow_id: Optional[str] = Query(None, alias="workflowId"),
+    claims: Dict[str, Any] = Depends(verify_auth_token),
+):
+    """
+    Return the ingestion load create-resource and rescrape are admitted
+    against, so callers can back off before being refused. The load of
+    another user's workflow is reported as not found.
+    """
+    if workflow_id is not None:
+        owner_id = await asyncio.to_thread(get_workflow_owner, workflow_id)
+        if owner_id is None or owner_id != claims.get("sub"):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Workflow {workflow_id} not found",
+            )
+    return IngestionLoadResponse(**await get_ingestion_load(workflow_id))
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from ..database import get_workflow_owner
+from ..dependencies import verify_auth_token
+from ..schemas import SearchRequest, SearchResponse, SearchResult
+from ..services import search_similar_chunks
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/api/v1", tags=["search"], dependencies=[Depends(verify_auth_token)]
+)
+
+
+@router.post("/search", response_model=SearchResponse)
+async def search(
+    request: SearchRequest, claims: Dict[str, Any] = Depends(verify_auth_token)
+):
+    """
+    Return the chunks most similar to a query within a workflow, optionally
+    restricted to a knowledge base and/or contexts. Only the owner of the
+    workflow may search it; other callers get 404, as for a missing workflow.
+    """
+    try:
+        owner_id = await asyncio.to_thread(get_workflow_owner, request.workflow_id)
+        if owner_id is None or owner_id != claims.get("sub"):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Workflow {request.workflow_id} not found",
+            )
+
+        results = await search_similar_chunks(
+            query=request.query,
+            workflow_id=request.workflow_id,
+            knowledge_id=request.knowledge_id,
+            context_ids=request.context_ids,
+            limit=request.limit,
+            min_similarity=request.min_similarity,
+            ef_search=request.ef_search,
+        )
+
+        # Resource ids in ranking order, without duplicates
+        resource_ids = list(dict.fromkeys(result["resource_id"] for result in results))
+
+        return SearchResponse(
+            results=[SearchResult(**result) for result in results],
+            resource_ids=resource_ids,
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching workflow {request.workflow_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to search chunks: {str(e)}",
+        )
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Literal, Optional, Union
 
 from pydantic import BaseModel, Field, HttpUrl
 
@@ -61,9 +61,123 @@ class CreateResourceResponse(BaseModel):
     resources: List[Dict[str, Any]]
 
 
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1)
+    workflow_id: str = Field(..., alias="workflowId")
+    knowledge_id: Optional[str] = Field(None, alias="knowledgeId")
+    context_ids: List[str] = Field(default_factory=list, alias="contextIds")
+    limit: Optional[int] = Field(None, ge=1)
+    min_similarity: float = Field(0.0, alias="minSimilarity", ge=-1.0, le=1.0)
+    ef_search: Optional[int] = Field(None, alias="efSearch", ge=1, le=1000)
+
+
+class SearchResult(BaseModel):
+    id: str
+    content: str
+    resource_id: str = Field(..., serialization_alias="resourceId")
+    similarity: float
+
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+    resource_ids: List[str] = Field(..., serialization_alias="resourceIds")
+
+
+class VectorIndexBuildRequest(BaseModel):
+    method: Optional[str] = Field(None, pattern="^(hnsw|ivfflat)$")
+    rebuild: bool = False
+    m: Optional[int] = Field(None, ge=2, le=100)
+    ef_construction: Optional[int] = Field(None, alias="efConstruction", ge=4, le=1000)
+    lists: Optional[int] = Field(None, ge=1)
+    quantization: str = Field("none", pattern="^(none|halfvec|binary)$")
+    dimensions: Literal[256, 512, 1024, 1536] = 1536
+
+
+class VectorIndexStatusResponse(BaseModel):
+    index_name: str
+    quantization: str = "none"
+    dimensions: int = 1536
+    exists: bool
+    is_valid: bool
+    definition: Optional[str] = None
+    size_bytes: int = 0
+    build_in_progress: bool = False
+    progress: Optional[Dict[str, Any]] = None
+
+
+class PipelineStageStats(BaseModel):
+    queued: int
+    capacity: int
+    workers: int
+    busy: int
+    processed: int
+    failed: int
+    cancelled: int = 0
+
+
+class PipelineStatusResponse(BaseModel):
+    enabled: bool
+    worker_id: Optional[str] = None
+    job_types: List[str] = []
+    in_flight: int = 0
+    stages: Dict[str, PipelineStageStats] = {}
+
+
+class CacheStats(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+class CacheStatsResponse(BaseModel):
+    caches: Dict[str, CacheStats]
+
+
+class InvalidateTokensRequest(BaseModel):
+    user_id: Optional[str] = Field(None, alias="userId")
+    token: Optional[str] = None
+
+
+class InvalidateTokensResponse(BaseModel):
+    invalidated: int
+
+
+class IngestionLoadResponse(BaseModel):
+    pending_jobs: Optional[int] = Field(None, serialization_alias="pendingJobs")
+    max_pending_jobs: int = Field(..., serialization_alias="maxPendingJobs")
+    workflow_pending_jobs: Optional[int] = Field(
+        None, serialization_alias="workflowPendingJobs"
+    )
+    max_workflow_pending_jobs: int = Field(
+        ..., serialization_alias="maxWorkflowPendingJobs"
+    )
+    rescrapes_in_flight: int = Field(..., serialization_alias="rescrapesInFlight")
+    rescrapes_waiting: int = Field(..., serialization_alias="rescrapesWaiting")
+    max_in_flight_rescrapes: int = Field(
+        ..., serialization_alias="maxInFlightRescrapes"
+    )
+    max_queued_rescrapes: int = Field(..., serialization_alias="maxQueuedRescrapes")
+
+
+class CancelResourceResponse(BaseModel):
+    success: bool
+    resource_id: str = Field(..., serialization_alias="resourceId")
+    cancelled_jobs: int = Field(..., serialization_alias="cancelledJobs")
+
+
+class DrainStatusResponse(BaseModel):
+    in_flight: int = Field(..., serialization_alias="inFlight")
+    requeued: int
+    seconds_left: Optional[float] = Field(None, serialization_alias="secondsLeft")
+    done: bool
+
+
 class HealthResponse(BaseModel):
     status: str
     message: str
+    drain: Optional[DrainStatusResponse] = None
 
 
 class UpdatePayload(BaseModel):
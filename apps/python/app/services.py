@@ -1,133 +1,109 @@
+import asyncio
+import codecs
 import json
 import logging
-from typing import Any, Dict, List, Optional
+import time
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
 
 import aiohttp
+import pypdfium2 as pdfium  # type: ignore
 import tiktoken
 import xxhash
-from chonkie import Chunk, OpenAIEmbeddings, TokenChunker  # type: ignore
-from fastapi import BackgroundTasks, HTTPException, status
-from docling.document_converter import DocumentConverter, PdfFormatOption  # type: ignore
-from docling.datamodel.base_models import InputFormat  # type: ignore
-from docling.datamodel.pipeline_options import PdfPipelineOptions, VlmPipelineOptions  # type: ignore
-from docling_core.types.doc import ImageRefMode  # type: ignore
-
+from chonkie import Chunk, TokenChunker  # type: ignore
+from fastapi import HTTPException, status
+
+from .cache import (
+    get_query_hash,
+    get_search_cache_key,
+    query_embedding_cache,
+    search_result_cache,
+    title_cache,
+)
+from .chunking import ChunkBatcher, StreamingTokenChunker
 from .config import settings
 from .database import (
+    claim_stalled_resources,
+    complete_resource_batch,
     delete_chunks_for_resource,
+    enqueue_jobs,
+    enqueue_stream_batch_job,
+    get_resource_batch,
     get_resource_by_id,
+    get_stream_batch_job_id,
+    get_workflow_embedding_dimensions,
+    get_workflow_search_generation,
     increment_processed_batches,
     save_chunks_to_db,
+    save_resource_batches,
+    search_chunks,
+    start_resource_batch_stream,
     update_resource_status,
-    update_resource_total_batches,
+    update_resource_title,
+)
+from .embeddings import embed_text, embed_texts
+from .extraction import convert_document
+from .metrics import (
+    CHUNKS,
+    EMBEDDED_TOKENS,
+    INGESTED_BYTES,
+    STEP_SECONDS,
+    observe_iteration,
+    observe_step,
+    timed,
 )
-from .discord import send_discord_notification
 from .models import Resource
 from .schemas import ResourceBase
-from .supabase import send_update, send_usage_update
+from .supabase import send_update
+from .tracing import (
+    set_span_attributes,
+    start_ingestion_trace,
+    traced,
+    traced_stage,
+    tracer,
+)
+from .usage import usage_meter
 
 logger = logging.getLogger(__name__)
 
 
-async def get_text_from_tika(
-    url: str, tika_url: Optional[str] = None
-) -> tuple[str, int]:
-    """Extract text from a file URL using Tika asynchronously."""
-    if tika_url is None:
-        tika_url = settings.TIKA_URL
-
-    # Headers to mimic a real browser request
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
-            "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        ),
-        "Accept": (
-            "text/html,application/xhtml+xml,application/xml;q=0.9,"
-            "image/webp,image/apng,*/*;q=0.8"
-        ),
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
-        "DNT": "1",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1",
-    }
+# Headers to mimic a real browser request
+BROWSER_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Accept": (
+        "text/html,application/xhtml+xml,application/xml;q=0.9,"
+        "image/webp,image/apng,*/*;q=0.8"
+    ),
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "DNT": "1",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+ACCESS_DENIED_DETAIL = (
+    "Access denied by the website. This URL may not allow "
+    "automated access (common with LinkedIn, social media "
+    "sites, etc.)"
+)
 
-    # Try docling first with VLM for image description instead of base64
-    try:
-        # Configure VLM pipeline for image analysis and description
-        # SmolDocling will analyze images and generate text descriptions instead of base64 data
-        # Examples: "A bar chart showing quarterly sales", "Diagram of system architecture"
-        vlm_options = VlmPipelineOptions(
-            do_vlm=True,
-            vlm_model="ds4sd/SmolDocling-256M-preview",
-        )
-        
-        # Configure PDF pipeline options for proper document handling
-        pdf_pipeline_options = PdfPipelineOptions()
-        pdf_pipeline_options.do_ocr = False  # Keep OCR disabled to avoid EasyOCR dependency issues
-        # Note: Set to True if you need to extract text from images, but requires EasyOCR dependencies
-        pdf_pipeline_options.do_table_structure = True  # Keep table structure detection
-        pdf_pipeline_options.table_structure_options = {
-            "do_cell_matching": True,
-        }
-        # Enable image processing with VLM descriptions
-        pdf_pipeline_options.generate_picture_images = True  # Generate images for picture elements
-        pdf_pipeline_options.do_picture_classification = True  # Classify picture types
-        pdf_pipeline_options.images_scale = 2.0  # Higher resolution images
-        
-        # Create format options with both pipeline options
-        format_options = PdfFormatOption(
-            pipeline_options=pdf_pipeline_options,
-            vlm_options=vlm_options
-        )
-        
-        converter = DocumentConverter(
-            format_options={
-                InputFormat.PDF: format_options,
-            }
-        )
-        
-        result = converter.convert(url)
-        doc = result.document
-        
-        # Export to markdown - VLM will provide image descriptions instead of base64
-        try:
-            # Export with VLM-generated image descriptions
-            text_content = doc.export_to_markdown()
-        except Exception as e:
-            logger.warning(f"Failed to export with VLM descriptions: {str(e)}")
-            # This shouldn't fail, but just in case
-            text_content = doc.export_to_markdown()
-
-        print("--------------------------------")   
-        print(text_content)
-        print("--------------------------------")
-        
-        # Calculate file size from the extracted text
-        file_size = len(text_content.encode('utf-8'))
-        
-        logger.info(f"Successfully extracted text using docling with VLM image descriptions: {len(text_content)} characters")
-        return text_content, file_size
-        
-    except Exception as e:
-        logger.error(f"Docling conversion failed: {str(e)}")
-        logger.info("Falling back to Tika approach")
-        # Fall back to the original Tika approach below
 
+@traced("download_resource")
+@timed("download")
+async def download_resource(url: str) -> bytes:
+    """Download the file behind a resource URL asynchronously."""
     try:
         async with aiohttp.ClientSession() as session:
             # Download the file from the URL with browser-like headers
-            async with session.get(str(url), headers=headers) as file_response:
+            async with session.get(str(url), headers=BROWSER_HEADERS) as file_response:
                 # Handle specific error cases
                 if file_response.status == 999:
                     raise HTTPException(
                         status_code=status.HTTP_403_FORBIDDEN,
-                        detail=(
-                            "Access denied by the website. This URL may not allow "
-                            "automated access (common with LinkedIn, social media "
-                            "sites, etc.)"
-                        ),
+                        detail=ACCESS_DENIED_DETAIL,
                     )
                 elif file_response.status == 403:
                     raise HTTPException(
@@ -141,18 +117,7 @@ async def get_text_from_tika(
                     )
 
                 file_response.raise_for_status()
-                file_content = await file_response.read()
-                file_size = len(file_content)
-
-            # Send the file to Tika for text extraction
-            async with session.put(
-                tika_url,
-                headers={"Accept": "text/plain"},
-                data=file_content,
-            ) as tika_response:
-                tika_response.raise_for_status()
-                text_content = await tika_response.text()
-                return text_content, file_size
+                return await file_response.read()
     except HTTPException:
         # Re-raise HTTPExceptions as-is
         raise
@@ -162,16 +127,59 @@ async def get_text_from_tika(
         if "999" in error_message:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
-                detail=(
-                    "Access denied by the website. This URL may not allow "
-                    "automated access (common with LinkedIn, social media "
-                    "sites, etc.)"
-                ),
+                detail=ACCESS_DENIED_DETAIL,
             )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Failed to extract text from URL: {error_message}",
         )
+
+
+@traced("extract_text")
+async def extract_text(
+    content: bytes, url: str, tika_url: Optional[str] = None
+) -> tuple[str, int]:
+    """Extract text from downloaded file content with docling, falling back to Tika."""
+    if tika_url is None:
+        tika_url = settings.TIKA_URL
+
+    # Try docling first with VLM for image description instead of base64
+    try:
+        # Conversion is CPU-bound; it runs in a child process (see
+        # extraction.py), which is killed if the ingestion is cancelled
+        with observe_step("docling"):
+            text_content = "".join(
+                [text async for text in convert_document(content, url, [None])]
+            )
+
+        # Calculate file size from the extracted text
+        file_size = len(text_content.encode('utf-8'))
+        
+        logger.info(f"Successfully extracted text using docling with VLM image descriptions: {len(text_content)} characters")
+        return text_content, file_size
+        
+    except Exception as e:
+        logger.error(f"Docling conversion failed: {str(e)}")
+        logger.info("Falling back to Tika approach")
+        # Fall back to the original Tika approach below
+
+    try:
+        with observe_step("tika"):
+            async with aiohttp.ClientSession() as session:
+                # Send the file to Tika for text extraction
+                async with session.put(
+                    tika_url,
+                    headers={"Accept": "text/plain"},
+                    data=content,
+                ) as tika_response:
+                    tika_response.raise_for_status()
+                    text_content = await tika_response.text()
+                    return text_content, len(content)
+    except aiohttp.ClientError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to extract text from URL: {str(e)}",
+        )
     except Exception as e:
         # Handle any other unexpected errors
         raise HTTPException(
@@ -180,48 +188,116 @@ async def get_text_from_tika(
         )
 
 
-async def generate_file_title(text: str, original_filename: str) -> str:
-    """Generate a title using Itzam API or fallback to simple generation."""
-    if not text.strip():
-        return original_filename
+@traced("get_text_from_tika")
+async def get_text_from_tika(
+    url: str, tika_url: Optional[str] = None
+) -> tuple[str, int]:
+    """Download a file URL and extract its text asynchronously."""
+    content = await download_resource(url)
+    extracted: tuple[str, int] = await extract_text(content, url, tika_url)
+    return extracted
+
 
-    # Try to generate title using Itzam API if available
-    if settings.ITZAM_API_KEY:
+def get_pdf_page_count(content: bytes) -> Optional[int]:
+    """Return the page count of a PDF, or None for other formats."""
+    if not content.startswith(b"%PDF"):
+        return None
+    try:
+        pdf = pdfium.PdfDocument(content)
         try:
-            # Limit text to 1000 characters for API efficiency
-            limited_text = text[:1000]
-
-            payload = {
-                "input": (
-                    f"Original file name: {original_filename}\n"
-                    f"File content: {limited_text}"
-                ),
-                "workflowSlug": "file-title-generator",
-            }
+            return len(pdf)
+        finally:
+            pdf.close()
+    except Exception as e:
+        logger.warning(f"Failed to count PDF pages: {str(e)}")
+        return None
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{settings.ITZAM_API_URL}/generate/text",
-                    headers={
-                        "Api-Key": settings.ITZAM_API_KEY,
-                        "Content-Type": "application/json",
-                    },
-                    data=json.dumps(payload),
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        generated_title: str = result.get("text", "").strip()
-                        if generated_title:
-                            logger.info(
-                                f"Generated title using Itzam API: {generated_title}"
-                            )
-                            return generated_title
-                    else:
-                        logger.warning(f"Itzam API returned status {response.status}")
-        except Exception as e:
-            logger.error(f"Error calling Itzam API for title generation: {str(e)}")
-
-    # Fallback to simple title generation
+
+async def convert_with_docling_stream(content: bytes, url: str) -> AsyncIterator[str]:
+    """
+    Convert a document with docling, yielding the markdown of each window of
+    PDF pages as soon as it is converted. Other formats are yielded whole.
+    """
+    page_count = get_pdf_page_count(content)
+
+    if page_count is None:
+        async for text_content in convert_document(content, url, [None]):
+            yield text_content
+        return
+
+    window = settings.INGESTION_STREAMING_PAGES_PER_WINDOW
+    page_ranges = [
+        (first_page, min(first_page + window - 1, page_count))
+        for first_page in range(1, page_count + 1, window)
+    ]
+    index = 0
+    async for text_content in convert_document(content, url, page_ranges):
+        first_page, last_page = page_ranges[index]
+        index += 1
+        logger.info(f"Converted pages {first_page}-{last_page} of {page_count}")
+        yield text_content + "\n\n"
+
+
+async def extract_text_stream(
+    content: bytes, url: str, tika_url: Optional[str] = None
+) -> AsyncIterator[str]:
+    """
+    Like extract_text, but yield the text as it is produced: PDF page windows
+    as docling converts them, or Tika's response as it arrives. Tika is only
+    used when docling fails before producing any text.
+    """
+    if tika_url is None:
+        tika_url = settings.TIKA_URL
+
+    produced_text = False
+    try:
+        async for text_content in observe_iteration(
+            "docling", convert_with_docling_stream(content, url)
+        ):
+            produced_text = True
+            yield text_content
+        return
+    except Exception as e:
+        if produced_text:
+            raise
+        logger.error(f"Docling conversion failed: {str(e)}")
+        logger.info("Falling back to Tika approach")
+
+    async for text_content in observe_iteration(
+        "tika", stream_text_from_tika(content, tika_url)
+    ):
+        yield text_content
+
+
+async def stream_text_from_tika(content: bytes, tika_url: str) -> AsyncIterator[str]:
+    """Yield the text Tika extracts from a file as its response arrives."""
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.put(
+                tika_url,
+                headers={"Accept": "text/plain"},
+                data=content,
+            ) as tika_response:
+                tika_response.raise_for_status()
+                decoder = codecs.getincrementaldecoder(
+                    tika_response.charset or "utf-8"
+                )(errors="replace")
+                async for block in tika_response.content.iter_chunked(65536):
+                    text_content = decoder.decode(block)
+                    if text_content:
+                        yield text_content
+                text_content = decoder.decode(b"", final=True)
+                if text_content:
+                    yield text_content
+    except aiohttp.ClientError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to extract text from URL: {str(e)}",
+        )
+
+
+def get_fallback_title(text: str, original_filename: str) -> str:
+    """Title a resource after its first line, without calling the Itzam API."""
     lines = text.strip().split("\n")
     first_line = lines[0].strip() if lines else ""
 
@@ -233,142 +309,539 @@ async def generate_file_title(text: str, original_filename: str) -> str:
         return text.strip() or original_filename
 
 
-async def generate_chunks(
-    resource: ResourceBase,
-    chunk_size: int,
-    tokenizer: tiktoken.Encoding,
-    knowledge_id: Optional[str],
-    workflow_id: str,
-    context_id: Optional[str],
-):
-    """Extract text from resource and generate chunks."""
-    try:
-        logger.info(f"Starting chunk generation for resource {resource.id}")
+@traced("generate_file_title")
+async def generate_file_title(text: str, original_filename: str) -> Optional[str]:
+    """Generate a title using Itzam API; None if it is unavailable or fails."""
+    if not text.strip() or not settings.ITZAM_API_KEY:
+        return None
 
-        # Extract text content
-        text_content, file_size = await get_text_from_tika(str(resource.url))
+    try:
+        # Limit text to 1000 characters for API efficiency
+        limited_text = text[:1000]
 
-        logger.info(f"Text content: {text_content}")
+        payload = {
+            "input": (
+                f"Original file name: {original_filename}\n"
+                f"File content: {limited_text}"
+            ),
+            "workflowSlug": "file-title-generator",
+        }
 
-        if not text_content.strip():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No text content extracted from the provided URL",
+        async with aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(
+                total=settings.TITLE_GENERATION_TIMEOUT_SECONDS
             )
+        ) as session:
+            async with session.post(
+                f"{settings.ITZAM_API_URL}/generate/text",
+                headers={
+                    "Api-Key": settings.ITZAM_API_KEY,
+                    "Content-Type": "application/json",
+                },
+                data=json.dumps(payload),
+            ) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    generated_title: str = result.get("text", "").strip()
+                    if generated_title:
+                        logger.info(
+                            f"Generated title using Itzam API: {generated_title}"
+                        )
+                        return generated_title
+                else:
+                    logger.warning(f"Itzam API returned status {response.status}")
+    except asyncio.TimeoutError:
+        logger.warning(
+            "Itzam API title generation timed out after "
+            f"{settings.TITLE_GENERATION_TIMEOUT_SECONDS}s"
+        )
+    except Exception as e:
+        logger.error(f"Error calling Itzam API for title generation: {str(e)}")
+    return None
 
-        # Compute content hash using xxhash
-        content_hash = xxhash.xxh64(text_content.encode("utf-8")).hexdigest()
 
-        # Send initial update with file size
-        await send_update(
-            resource.dict(),
-            {
-                "status": "PENDING",
-                "title": "",
-                "fileSize": file_size,
-                "totalChunks": 0,
-                "resourceId": resource.id,
-                "knowledgeId": knowledge_id,
-                "contextId": context_id,
-            },
+# Title generations still running, referenced until they finish
+_title_tasks: Set[asyncio.Task] = set()
+
+
+def get_initial_title(
+    resource: ResourceBase, text: str, content_hash: Optional[str]
+) -> Tuple[str, bool]:
+    """
+    Return the title to ingest a resource with, and whether a better one
+    should be generated for it in the background (see start_title_generation).
+    """
+    if resource.title:
+        return resource.title, False
+    cached = title_cache.get(content_hash) if content_hash else None
+    if cached:
+        return cached, False
+    return get_fallback_title(text, str(resource.url)), True
+
+
+def start_title_generation(
+    resource: ResourceBase,
+    text: str,
+    content_hash: str,
+    fallback_title: str,
+    knowledge_id: Optional[str],
+    context_id: Optional[str],
+):
+    """
+    Generate a resource's title without holding up its ingestion. Call it
+    after the fallback title is stored: the generated one replaces it.
+    """
+    task = asyncio.create_task(
+        title_resource(
+            resource, text, content_hash, fallback_title, knowledge_id, context_id
         )
+    )
+    _title_tasks.add(task)
+    task.add_done_callback(_title_tasks.discard)
 
-        # Send usage update
-        await send_usage_update(workflow_id, file_size)
 
-        if hasattr(resource, "title") and resource.title:
-            title = resource.title
-            logger.info(f"Using existing title for resource {resource.id}: {title}")
-        else:
-            original_filename = str(resource.url)
-            title = await generate_file_title(text_content, original_filename)
-            logger.info(f"Generated new title for resource {resource.id}: {title}")
+async def title_resource(
+    resource: ResourceBase,
+    text: str,
+    content_hash: str,
+    fallback_title: str,
+    knowledge_id: Optional[str],
+    context_id: Optional[str],
+):
+    """Replace a resource's fallback title with a generated one, if any."""
+    try:
+        title = await generate_file_title(text, str(resource.url))
+        if not title:
+            return
+        title_cache.set(content_hash, title)
+        if title == fallback_title or not resource.id:
+            return
 
-        # Send update with title
+        await asyncio.to_thread(update_resource_title, resource.id, title)
         await send_update(
             resource.dict(),
             {
-                "status": "PENDING",
                 "title": title,
-                "fileSize": file_size,
-                "totalChunks": 0,
                 "resourceId": resource.id,
                 "knowledgeId": knowledge_id,
                 "contextId": context_id,
             },
         )
+        logger.info(f"Generated new title for resource {resource.id}: {title}")
+    except Exception as e:
+        logger.error(f"Failed to title resource {resource.id}: {str(e)}")
 
-        # Update resource with title, file size and content hash
-        if resource.id:
-            update_resource_status(
-                resource.id, "PENDING", title, file_size, content_hash=content_hash
-            )
 
-        # Initialize tokenizer and chunker
-        chunker = TokenChunker(tokenizer, chunk_size=chunk_size)
+CHUNK_SIZE = 512
+EMBEDDINGS_TOKEN_LIMIT_PER_REQUEST = 300000
+# Checkpoint index of a stream's own pseudo-batch (see stream_resource)
+STREAM_BATCH_INDEX = -1
 
-        # Chunk the text
-        chunks = chunker(text_content)
-        chunk_length = len(chunks)
 
-        # Update resource with total chunks
-        if resource.id:
-            update_resource_status(
-                resource.id, "PENDING", title, file_size, chunk_length, content_hash
-            )
+async def mark_resource_failed(
+    resource: ResourceBase,
+    knowledge_id: Optional[str],
+    context_id: Optional[str],
+    title: Optional[str] = None,
+):
+    """Set a resource to FAILED and notify the client."""
+    if resource.id:
+        update_resource_status(resource.id, "FAILED")
+
+    await send_update(
+        resource.dict(),
+        {
+            "status": "FAILED",
+            "title": title or str(resource.url),
+            "totalChunks": 0,
+            "fileSize": 0,
+            "resourceId": resource.id,
+            "knowledgeId": knowledge_id,
+            "contextId": context_id,
+        },
+    )
+
+
+async def extract_resource(
+    resource: ResourceBase,
+    content: bytes,
+    knowledge_id: Optional[str],
+    context_id: Optional[str],
+) -> Dict[str, Any]:
+    """
+    Extract the text of a downloaded resource, record its size and hash, and
+    title it.
+    """
+    logger.info(f"Starting text extraction for resource {resource.id}")
 
-        # Send update with total chunks
-        await send_update(
-            resource.dict(),
-            {
-                "status": "PENDING",
-                "title": title,
-                "fileSize": file_size,
-                "totalChunks": chunk_length,
-                "resourceId": resource.id,
-                "knowledgeId": knowledge_id,
-                "contextId": context_id,
-            },
-        )
+    # Extract text content
+    text_content, file_size = await extract_text(content, str(resource.url))
+
+    logger.info(f"Text content: {text_content}")
 
-        logger.info(f"Generated {chunk_length} chunks for resource {resource.id}")
+    if not text_content.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No text content extracted from the provided URL",
+        )
 
-        return {
-            "chunks": chunks,
+    # Compute content hash using xxhash
+    content_hash = xxhash.xxh64(text_content.encode("utf-8")).hexdigest()
+
+    # Send initial update with file size
+    await send_update(
+        resource.dict(),
+        {
+            "status": "PENDING",
+            "title": "",
+            "fileSize": file_size,
+            "totalChunks": 0,
+            "resourceId": resource.id,
+            "knowledgeId": knowledge_id,
+            "contextId": context_id,
+        },
+    )
+
+    INGESTED_BYTES.inc(file_size)
+    set_span_attributes({"resource.file_size": file_size})
+
+    # Ingest with the existing, cached or fallback title; a generated title
+    # replaces the fallback once ready, while the resource is chunked
+    title, generate_title = get_initial_title(resource, text_content, content_hash)
+    logger.info(f"Using title for resource {resource.id}: {title}")
+
+    # Send update with title
+    await send_update(
+        resource.dict(),
+        {
+            "status": "PENDING",
             "title": title,
-            "file_size": file_size,
-            "text_content": text_content,
-            "content_hash": content_hash,
+            "fileSize": file_size,
+            "totalChunks": 0,
+            "resourceId": resource.id,
+            "knowledgeId": knowledge_id,
+            "contextId": context_id,
+        },
+    )
+
+    # Update resource with title, file size and content hash
+    if resource.id:
+        update_resource_status(
+            resource.id, "PENDING", title, file_size, content_hash=content_hash
+        )
+    if generate_title:
+        start_title_generation(
+            resource, text_content, content_hash, title, knowledge_id, context_id
+        )
+
+    return {
+        "text_content": text_content,
+        "title": title,
+        "file_size": file_size,
+        "content_hash": content_hash,
+    }
+
+
+def batch_chunks(
+    chunks: List[Chunk], token_limit: int = EMBEDDINGS_TOKEN_LIMIT_PER_REQUEST
+) -> List[List[Chunk]]:
+    """Batch chunks so that each batch does not exceed token_limit."""
+    batches = []
+    current_batch: List[Chunk] = []
+    current_tokens = 0
+
+    for chunk in chunks:
+        if chunk.token_count > token_limit:
+            # If a single chunk exceeds the limit, process it alone
+            if current_batch:
+                batches.append(current_batch)
+                current_batch = []
+                current_tokens = 0
+            batches.append([chunk])
+            continue
+
+        if current_tokens + chunk.token_count > token_limit:
+            if current_batch:
+                batches.append(current_batch)
+            current_batch = [chunk]
+            current_tokens = chunk.token_count
+        else:
+            current_batch.append(chunk)
+            current_tokens += chunk.token_count
+
+    if current_batch:
+        batches.append(current_batch)
+
+    return batches
+
+
+def get_chunk_data(chunks: List[Chunk]) -> List[Dict[str, Any]]:
+    """Return chunks as the JSON stored in batch checkpoints."""
+    return [
+        {
+            "text": chunk.text,
+            "start_index": chunk.start_index,
+            "end_index": chunk.end_index,
+            "token_count": chunk.token_count,
         }
+        for chunk in chunks
+    ]
 
-    except Exception as e:
-        logger.error(f"Error generating chunks for resource {resource.id}: {str(e)}")
 
-        # Update resource status to failed
-        if resource.id:
-            update_resource_status(resource.id, "FAILED")
+async def chunk_resource(
+    resource: ResourceBase,
+    text_content: str,
+    title: str,
+    file_size: int,
+    knowledge_id: Optional[str],
+    context_id: Optional[str],
+    job_id: Optional[str] = None,
+    replace_chunks_before: Optional[datetime] = None,
+) -> List[List[Chunk]]:
+    """
+    Chunk extracted text, split the chunks into embedding batches and
+    checkpoint the batches, so they can be embedded again after a crash
+    without extracting and chunking the resource again. Nothing is
+    checkpointed once the ingestion of `job_id` was cancelled.
+    """
+    # Initialize tokenizer and chunker
+    tokenizer = tiktoken.get_encoding("cl100k_base")
+    chunker = TokenChunker(tokenizer, chunk_size=CHUNK_SIZE)
+
+    # Chunk the text; tokenizing is CPU-bound, keep it off the event loop
+    with tracer.start_as_current_span("chunking"), observe_step("chunking"):
+        chunks = await asyncio.to_thread(chunker, text_content)
+        set_span_attributes({"resource.chunks": len(chunks)})
+    chunk_length = len(chunks)
+    CHUNKS.inc(chunk_length)
+
+    # Update resource with total chunks; its title was stored on extraction
+    # and may since have been replaced by a generated one
+    if resource.id:
+        update_resource_status(resource.id, "PENDING", None, file_size, chunk_length)
+
+    # Send update with total chunks
+    await send_update(
+        resource.dict(),
+        {
+            "status": "PENDING",
+            "fileSize": file_size,
+            "totalChunks": chunk_length,
+            "resourceId": resource.id,
+            "knowledgeId": knowledge_id,
+            "contextId": context_id,
+        },
+    )
+
+    logger.info(f"Generated {chunk_length} chunks for resource {resource.id}")
+
+    batches = batch_chunks(chunks)
+
+    # Checkpoint the batches and set total_batches in the database
+    if resource.id:
+        await asyncio.to_thread(
+            save_resource_batches,
+            resource.id,
+            [get_chunk_data(batch) for batch in batches],
+            job_id,
+            replace_chunks_before,
+        )
+        logger.info(f"Set total_batches to {len(batches)} for resource {resource.id}")
 
-        # Send failure update
-        fallback_title = str(resource.url)
+    return batches
 
-        await send_update(
-            resource.dict(),
-            {
-                "status": "FAILED",
-                "title": fallback_title,
-                "totalChunks": 0,
-                "fileSize": 0,
-                "resourceId": resource.id,
-                "knowledgeId": knowledge_id,
-                "contextId": context_id,
-            },
+
+async def stream_resource(job: Dict[str, Any], content: bytes) -> List[Dict[str, Any]]:
+    """
+    Streaming ingestion of an EXTRACT job: chunk the text while it is being
+    extracted and queue each embedding batch as soon as it is full, instead
+    of waiting for the whole document. Returns the FINALIZE job if every
+    batch was already stored when the stream ended.
+    """
+    payload = job["payload"]
+    resource = ResourceBase(**payload["resource"])
+    knowledge_id = payload["knowledge_id"]
+    context_id = payload["context_id"]
+    if not resource.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Resource ID is required for streaming ingestion",
         )
 
-        raise
+    logger.info(f"Starting streaming extraction for resource {resource.id}")
+    await asyncio.to_thread(
+        start_resource_batch_stream,
+        resource.id,
+        job["id"],
+        STREAM_BATCH_INDEX,
+        get_replace_chunks_before(payload),
+    )
+
+    tokenizer = tiktoken.get_encoding("cl100k_base")
+    chunker = StreamingTokenChunker(tokenizer, chunk_size=CHUNK_SIZE)
+    batcher = ChunkBatcher(settings.INGESTION_STREAMING_BATCH_TOKENS)
+    hasher = xxhash.xxh64()
+    file_size = 0
+    batch_count = 0
+    has_text = False
+    title = resource.title or None
+    title_text = ""
+    chunking_seconds = 0.0
+
+    async def run_chunker(step: Callable[..., List[Chunk]], *args) -> List[Chunk]:
+        # Tokenizing is CPU-bound, keep it off the event loop
+        nonlocal chunking_seconds
+        start = time.perf_counter()
+        try:
+            return await asyncio.to_thread(step, *args)
+        finally:
+            chunking_seconds += time.perf_counter() - start
+
+    async def ensure_title() -> str:
+        nonlocal title
+        if not title:
+            # Generated, if need be, once the content hash is known
+            title = get_fallback_title(title_text, str(resource.url))
+            await send_update(
+                resource.dict(),
+                {
+                    "status": "PENDING",
+                    "title": title,
+                    "fileSize": file_size,
+                    "totalChunks": 0,
+                    "resourceId": resource.id,
+                    "knowledgeId": knowledge_id,
+                    "contextId": context_id,
+                },
+            )
+        return title
+
+    async def dispatch(batch: List[Chunk]):
+        nonlocal batch_count
+        batch_job = get_follow_up_job(
+            job,
+            "EMBED_BATCH",
+            title=await ensure_title(),
+            file_size=file_size,
+            batch_index=batch_count,
+        )
+        batch_job["id"] = get_stream_batch_job_id(job["id"], batch_count)
+        batch_count += 1
+        await asyncio.to_thread(
+            enqueue_stream_batch_job, batch_job, get_chunk_data(batch), job["id"]
+        )
 
+    async for text_content in extract_text_stream(content, str(resource.url)):
+        encoded = text_content.encode("utf-8")
+        hasher.update(encoded)
+        file_size += len(encoded)
+        has_text = has_text or bool(text_content.strip())
+        if len(title_text) < 1000:
+            title_text += text_content[: 1000 - len(title_text)]
+            if len(title_text) >= 1000:
+                await ensure_title()
+
+        for chunk in await run_chunker(chunker.feed, text_content):
+            full_batch = batcher.add(chunk)
+            if full_batch:
+                await dispatch(full_batch)
+
+    if not has_text:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No text content extracted from the provided URL",
+        )
 
+    for chunk in await run_chunker(chunker.flush):
+        full_batch = batcher.add(chunk)
+        if full_batch:
+            await dispatch(full_batch)
+    last_batch = batcher.flush()
+    if last_batch:
+        await dispatch(last_batch)
+
+    STEP_SECONDS.labels("chunking").observe(chunking_seconds)
+    CHUNKS.inc(chunker.chunk_count)
+
+    content_hash = hasher.hexdigest()
+    title, generate_title = get_initial_title(resource, title_text, content_hash)
+    update_resource_status(
+        resource.id,
+        "PENDING",
+        title,
+        file_size,
+        chunker.chunk_count,
+        content_hash=content_hash,
+    )
+    if generate_title:
+        start_title_generation(
+            resource, title_text, content_hash, title, knowledge_id, context_id
+        )
+    await send_update(
+        resource.dict(),
+        {
+            "status": "PENDING",
+            "title": title,
+            "fileSize": file_size,
+            "totalChunks": chunker.chunk_count,
+            "resourceId": resource.id,
+            "knowledgeId": knowledge_id,
+            "contextId": context_id,
+        },
+    )
+    INGESTED_BYTES.inc(file_size)
+    set_span_attributes(
+        {"resource.file_size": file_size, "resource.chunks": chunker.chunk_count}
+    )
+    logger.info(
+        f"Streamed {chunker.chunk_count} chunks in {batch_count} batches for "
+        f"resource {resource.id}"
+    )
+
+    # The stream counts as the last batch: whoever finishes last finalizes
+    completed = await asyncio.to_thread(
+        complete_resource_batch, resource.id, STREAM_BATCH_INDEX, job["id"]
+    )
+    if completed["already_stored"]:
+        return await get_finalize_jobs_if_complete(job, title, file_size)
+    if not completed["all_batches_completed"]:
+        return []
+    return [get_follow_up_job(job, "FINALIZE", title=title, file_size=file_size)]
+
+
+@traced("generate_embeddings")
+@timed("embedding")
 async def generate_embeddings(
-    chunks: List[Chunk],
+    chunks: List[Chunk], workflow_id: str
+) -> Dict[str, Any]:
+    """Embed a batch of chunks at the workflow's embedding size."""
+    if not settings.OPENAI_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="OpenAI API key not configured",
+        )
+
+    # Off the event loop, which may also be serving API requests
+    dimensions = await asyncio.to_thread(get_workflow_embedding_dimensions, workflow_id)
+    embeddings = await asyncio.to_thread(
+        embed_texts, [chunk.text for chunk in chunks], dimensions
+    )
+    token_count = sum(chunk.token_count for chunk in chunks)
+    EMBEDDED_TOKENS.inc(token_count)
+    set_span_attributes({"batch.chunks": len(chunks), "batch.tokens": token_count})
+
+    return {
+        "dimensions": dimensions,
+        "embeddings_data": [
+            {"content": chunk.text, "embedding": embeddings[idx]}
+            for idx, chunk in enumerate(chunks)
+        ],
+    }
+
+
+async def store_embeddings(
+    embeddings_data: List[Dict[str, Any]],
+    dimensions: int,
     resource: ResourceBase,
     workflow_id: str,
     knowledge_id: str,
@@ -376,222 +849,532 @@ async def generate_embeddings(
     file_size: int,
     title: Optional[str] = None,
     save_to_db: bool = False,
+    batch_index: Optional[int] = None,
+    replace_chunks_before: Optional[datetime] = None,
+    job_id: Optional[str] = None,
 ) -> Dict[str, Any]:
-    """Generate embeddings for chunks and optionally save to database."""
-    try:
-        # Use provided title or generate a fallback
-        if not title:
-            original_filename = str(resource.url)
-            title = original_filename
-
-        # Generate embeddings if OpenAI API key is available
-        embeddings_data = None
-        if settings.OPENAI_API_KEY:
-            try:
-                client = OpenAIEmbeddings(
-                    api_key=settings.OPENAI_API_KEY, model="text-embedding-3-small"
-                )
-
-                # Generate embeddings for all chunks asynchronously
-                embeddings = client.embed_batch([chunk.text for chunk in chunks])
+    """
+    Optionally save an embedded batch to the database and count it as
+    processed. Raises on failure so the batch can be retried; a batch that an
+    earlier attempt already stored is reported as `already_stored`. With
+    `replace_chunks_before` (a rescrape), older chunks of the resource are
+    deleted in the same transaction. Raises JobCancelledError, saving
+    nothing, once the ingestion of `job_id` was cancelled.
+    """
+    # Use provided title or generate a fallback
+    if not title:
+        original_filename = str(resource.url)
+        title = original_filename
+
+    result: Dict[str, Any] = {
+        "title": title,
+        "file_size": file_size,
+        "embeddings_count": len(embeddings_data),
+    }
 
-                embeddings_data = [
-                    {"content": chunk.text, "embedding": embeddings[idx].tolist()}
-                    for idx, chunk in enumerate(chunks)
-                ]
+    # Save to database if requested
+    all_batches_completed = False
+    counted = False
+    if save_to_db and resource.id:
+        save_result = await asyncio.to_thread(
+            save_chunks_to_db,
+            embeddings_data,
+            resource.id,
+            workflow_id,
+            dimensions,
+            batch_index,
+            replace_chunks_before,
+            job_id,
+        )
+        if not save_result["success"]:
+            raise RuntimeError(f"Failed to save chunks: {save_result['error']}")
+        result["chunks_saved"] = save_result["chunks_saved"]
+        result["chunk_ids"] = save_result["chunk_ids"]
+        result["already_stored"] = save_result["already_stored"]
+        if save_result["already_stored"]:
+            return result
+        # A batch saved with its index was counted in the same transaction
+        counted = batch_index is not None
+        all_batches_completed = save_result["all_batches_completed"]
+    else:
+        result["embeddings"] = embeddings_data
 
-            except Exception:
-                raise
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="OpenAI API key not configured",
-            )
+    # Increment processed batches and check if all batches are completed
+    if resource.id and not counted:
+        all_batches_completed = await asyncio.to_thread(
+            increment_processed_batches, resource.id, 1
+        )
+    result["all_batches_completed"] = all_batches_completed
 
-        result = {
-            "chunks": chunks,
+    logger.info(
+        {
             "title": title,
-            "file_size": file_size,
-            "embeddings_count": len(embeddings_data) if embeddings_data else 0,
+            "processedChunks": len(embeddings_data),
+            "fileSize": file_size,
+            "resourceId": resource.id,
+            "knowledgeId": knowledge_id,
+            "allBatchesCompleted": all_batches_completed,
         }
+    )
+
+    # Send real-time update, without the title: a generated one may have
+    # replaced the one this batch was queued with
+    await send_update(
+        resource.dict(),
+        {
+            "status": "PENDING",
+            "processedChunks": len(embeddings_data),
+            "fileSize": file_size,
+            "resourceId": resource.id,
+            "knowledgeId": knowledge_id,
+            "contextId": context_id,
+        },
+    )
+
+    return result
+
+
+async def finalize_resource(
+    resource: ResourceBase,
+    knowledge_id: Optional[str],
+    context_id: Optional[str],
+    title: str,
+    file_size: int,
+):
+    """Mark a resource whose batches are all embedded as PROCESSED."""
+    if resource.id:
+        update_resource_status(resource.id, "PROCESSED")
 
-        # Save to database if requested
-        if save_to_db and embeddings_data and resource.id:
-            save_result = save_chunks_to_db(embeddings_data, resource.id, workflow_id)
-            result["save_result"] = save_result
-
-            if save_result["success"]:
-                result["chunks_saved"] = save_result["chunks_saved"]
-                result["chunk_ids"] = save_result["chunk_ids"]
-                status_to_set = "PROCESSED"
-            else:
-                result["save_error"] = save_result["error"]
-                status_to_set = "FAILED"
-        else:
-            result["embeddings"] = embeddings_data
-            status_to_set = "PROCESSED"
+    stored_resource = get_resource_by_id(resource.id) if resource.id else None
 
-        # Increment processed batches and check if all batches are completed
-        all_batches_completed = False
-        if resource.id:
-            all_batches_completed = increment_processed_batches(resource.id, 1)
+    logger.info(
+        f"All embedding batches completed for resource {resource.id}. "
+        "Resource fully processed."
+    )
 
-        if all_batches_completed:
-            logger.info(
-                f"All embedding batches completed for resource {resource.id}. "
-                "Resource fully processed."
+    await send_update(
+        resource.dict(),
+        {
+            "status": "PROCESSED",
+            "title": (stored_resource and stored_resource.title) or title,
+            "fileSize": file_size,
+            "totalChunks": stored_resource.total_chunks if stored_resource else 0,
+            "resourceId": resource.id,
+            "knowledgeId": knowledge_id,
+            "contextId": context_id,
+        },
+    )
+
+
+# Scheduling lanes of ingestion jobs: lower runs first (see CLAIM_JOBS_QUERY)
+INTERACTIVE_PRIORITY = 0
+RESCRAPE_PRIORITY = 1
+
+
+def get_resource_ingestion_job(
+    resource: ResourceBase,
+    workflow_id: str,
+    knowledge_id: Optional[str],
+    context_id: Optional[str],
+    save_to_db: bool = False,
+    user_id: Optional[str] = None,
+    priority: int = INTERACTIVE_PRIORITY,
+    replace_chunks_before: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """
+    Return the EXTRACT job that starts the ingestion of a resource. With
+    `replace_chunks_before`, its chunks created before then are replaced as
+    the new ones are stored (see store_embeddings).
+    """
+    return {
+        "type": "EXTRACT",
+        "resource_id": resource.id,
+        "workflow_id": workflow_id,
+        "user_id": user_id,
+        "priority": priority,
+        "payload": {
+            "resource": resource.model_dump(mode="json"),
+            "knowledge_id": knowledge_id or "",
+            "context_id": context_id or "",
+            "save_to_db": save_to_db,
+            "streaming": settings.INGESTION_STREAMING_ENABLED,
+            "trace_context": start_ingestion_trace(resource.id, workflow_id),
+            "replace_chunks_before": (
+                replace_chunks_before.isoformat() if replace_chunks_before else None
+            ),
+        },
+    }
+
+
+def enqueue_resource_processing(
+    resources: List[ResourceBase],
+    workflow_id: str,
+    knowledge_id: Optional[str],
+    context_id: Optional[str],
+    save_to_db: bool = False,
+    user_id: Optional[str] = None,
+    priority: int = INTERACTIVE_PRIORITY,
+    replace_chunks_before: Optional[datetime] = None,
+) -> List[str]:
+    """
+    Queue the ingestion of resources. Any worker process picks the jobs up
+    (see jobs.py), and they survive restarts of the process that queued them.
+    Jobs are scheduled fairly per user and workflow, in `priority` lanes.
+    """
+    job_ids = enqueue_jobs(
+        [
+            get_resource_ingestion_job(
+                resource,
+                workflow_id,
+                knowledge_id,
+                context_id,
+                save_to_db,
+                user_id,
+                priority,
+                replace_chunks_before,
             )
-            # The last_scraped_at was already updated in increment_processed_batches
+            for resource in resources
+        ]
+    )
+    logger.info(f"Queued ingestion of {len(job_ids)} resources")
+    return job_ids
 
-        # Update resource status
-        if resource.id:
-            update_resource_status(resource.id, status_to_set)
 
-        logger.warn(
-            {
-                "status": status_to_set,
-                "title": title,
-                "processedChunks": len(chunks),
-                "fileSize": file_size,
-                "resourceId": resource.id,
-                "knowledgeId": knowledge_id,
-                "allBatchesCompleted": all_batches_completed,
-            }
-        )
+def get_follow_up_job(
+    job: Dict[str, Any], job_type: str, **payload: Any
+) -> Dict[str, Any]:
+    """Return the next job for the same resource, carrying its context."""
+    return {
+        "type": job_type,
+        "resource_id": job["resource_id"],
+        "workflow_id": job["workflow_id"],
+        "user_id": job.get("user_id"),
+        "priority": job.get("priority", INTERACTIVE_PRIORITY),
+        "payload": {
+            "resource": job["payload"]["resource"],
+            "knowledge_id": job["payload"]["knowledge_id"],
+            "context_id": job["payload"]["context_id"],
+            "save_to_db": job["payload"]["save_to_db"],
+            "trace_context": job["payload"].get("trace_context"),
+            "replace_chunks_before": job["payload"].get("replace_chunks_before"),
+            **payload,
+        },
+    }
 
-        # Send real-time update
-        await send_update(
-            resource.dict(),
-            {
-                "status": status_to_set,
-                "title": title,
-                "processedChunks": len(chunks),
-                "fileSize": file_size,
-                "resourceId": resource.id,
-                "knowledgeId": knowledge_id,
-                "contextId": context_id,
-            },
+
+async def get_finalize_jobs_if_complete(
+    job: Dict[str, Any], title: Optional[str], file_size: int
+) -> List[Dict[str, Any]]:
+    """
+    FINALIZE for a resource whose batches are all stored, for a retried job
+    whose earlier attempt stored its batch but died before queueing it.
+    """
+    stored_resource = await asyncio.to_thread(get_resource_by_id, job["resource_id"])
+    if (
+        not stored_resource
+        or stored_resource.status != "PENDING"
+        or stored_resource.processed_batches < stored_resource.total_batches
+    ):
+        return []
+    return [get_follow_up_job(job, "FINALIZE", title=title, file_size=file_size)]
+
+
+def recover_stalled_ingestions(limit: int) -> int:
+    """
+    Re-enqueue the ingestion of resources that stalled with checkpointed
+    batches (see CLAIM_STALLED_RESOURCES_QUERY): only their missing batches
+    are embedded again, or FINALIZE is queued if none is missing. A resource
+    whose stream never finished extracting is ingested from the start. A
+    rescrape keeps the cutoff stored with its checkpoints, so its old chunks
+    are still replaced. Returns the number of resources recovered.
+    """
+    stalled_resources = claim_stalled_resources(
+        settings.INGESTION_RECOVERY_MIN_AGE_SECONDS, limit
+    )
+    jobs = []
+    for stalled in stalled_resources:
+        resource = ResourceBase(
+            id=stalled["id"],
+            url=stalled["url"],
+            type=stalled["type"],
+            title=stalled["title"],
+        )
+        ingestion_job = get_resource_ingestion_job(
+            resource,
+            stalled["workflow_id"],
+            stalled["knowledge_id"],
+            stalled["context_id"],
+            save_to_db=True,
+            user_id=stalled["user_id"],
+            replace_chunks_before=stalled["replace_chunks_before"],
+        )
+        if stalled["stream_unfinished"]:
+            jobs.append(ingestion_job)
+            continue
+
+        title = stalled["title"] or str(resource.url)
+        file_size = stalled["file_size"] or 0
+        jobs.extend(
+            get_follow_up_job(
+                ingestion_job,
+                "EMBED_BATCH",
+                title=title,
+                file_size=file_size,
+                batch_index=batch_index,
+            )
+            for batch_index in stalled["missing_batches"]
+        )
+        if not stalled["missing_batches"]:
+            jobs.append(
+                get_follow_up_job(
+                    ingestion_job, "FINALIZE", title=title, file_size=file_size
+                )
+            )
+        logger.info(
+            f"Recovering stalled resource {resource.id}: "
+            f"{len(stalled['missing_batches'])} missing batches"
         )
 
-        return result
+    if jobs:
+        enqueue_jobs(jobs)
+    return len(stalled_resources)
 
-    except Exception as e:
-        logger.error(
-            "Error generating embeddings for resource %s: %s", resource.id, str(e)
+
+# Each job runs through the ingestion pipeline (see pipeline.py) from the
+# stage its type enters at. A stage handler takes the job and the previous
+# stage's output and returns either the next stage and its input, or None
+# and the follow-up jobs once the job is done.
+
+
+@traced_stage("fetch")
+async def run_fetch_stage(job: Dict[str, Any], data: Any) -> Tuple[Optional[str], Any]:
+    """fetch (EXTRACT): download the resource."""
+    resource = ResourceBase(**job["payload"]["resource"])
+    logger.info(f"Downloading resource {resource.id}")
+    return "extract", await download_resource(str(resource.url))
+
+
+@traced_stage("extract")
+async def run_extract_stage(
+    job: Dict[str, Any], content: bytes
+) -> Tuple[Optional[str], Any]:
+    """
+    extract (EXTRACT): extract and title the resource, then queue CHUNK. In
+    streaming mode, queue its embedding batches while extracting instead.
+    """
+    payload = job["payload"]
+    if payload.get("streaming"):
+        return None, await stream_resource(job, content)
+
+    extracted = await extract_resource(
+        ResourceBase(**payload["resource"]),
+        content,
+        payload["knowledge_id"],
+        payload["context_id"],
+    )
+    return None, [
+        get_follow_up_job(
+            job,
+            "CHUNK",
+            text_content=extracted["text_content"],
+            title=extracted["title"],
+            file_size=extracted["file_size"],
         )
+    ]
 
-        # Update resource status to failed
-        if resource.id:
-            update_resource_status(resource.id, "FAILED")
 
-        # Send failure update
-        await send_update(
-            resource.dict(),
-            {
-                "status": "FAILED",
-                "title": title,
-                "fileSize": 0,
-                "resourceId": resource.id,
-                "knowledgeId": knowledge_id,
-                "contextId": context_id,
-            },
+@traced_stage("chunk")
+async def run_chunk_stage(job: Dict[str, Any], data: Any) -> Tuple[Optional[str], Any]:
+    """
+    chunk (CHUNK): chunk and checkpoint the text, and queue one EMBED_BATCH
+    per batch.
+    """
+    payload = job["payload"]
+    resource = ResourceBase(**payload["resource"])
+    if not resource.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Resource ID is required to checkpoint its batches",
         )
 
-        raise
+    batches = await chunk_resource(
+        resource,
+        payload["text_content"],
+        payload["title"],
+        payload["file_size"],
+        payload["knowledge_id"],
+        payload["context_id"],
+        job["id"],
+        get_replace_chunks_before(payload),
+    )
+    return None, [
+        get_follow_up_job(
+            job,
+            "EMBED_BATCH",
+            title=payload["title"],
+            file_size=payload["file_size"],
+            batch_index=index,
+        )
+        for index in range(len(batches))
+    ]
 
 
-async def process_resource_embeddings(
-    background_tasks: BackgroundTasks,
-    resource: ResourceBase,
-    workflow_id: str,
-    knowledge_id: str,
-    context_id: str,
-    save_to_db: bool = False,
-) -> Dict[str, Any]:
-    """Complete pipeline: generate chunks and embeddings for a resource,
-    batching by embedding token limits.
+@traced_stage("embed")
+async def run_embed_stage(job: Dict[str, Any], data: Any) -> Tuple[Optional[str], Any]:
     """
-    try:
-        chunk_size = 512
-        embeddings_limit_per_request = 300000
-
-        tokenizer = tiktoken.get_encoding("cl100k_base")
-        # First generate chunks
-        chunks_data = await generate_chunks(
-            resource, chunk_size, tokenizer, knowledge_id, workflow_id, context_id
-        )
-
-        chunks: List[Chunk] = chunks_data["chunks"]
-        file_size = chunks_data["file_size"]
-
-        # Batch chunks so that each batch does not exceed embeddings_limit_per_request
-        batches = []
-        current_batch: List[Chunk] = []
-        current_tokens = 0
-
-        for chunk in chunks:
-            if chunk.token_count > embeddings_limit_per_request:
-                # If a single chunk exceeds the limit, process it alone
-                if current_batch:
-                    batches.append(current_batch)
-                    current_batch = []
-                    current_tokens = 0
-                batches.append([chunk])
-                continue
-
-            if current_tokens + chunk.token_count > embeddings_limit_per_request:
-                if current_batch:
-                    batches.append(current_batch)
-                current_batch = [chunk]
-                current_tokens = chunk.token_count
-            else:
-                current_batch.append(chunk)
-                current_tokens += chunk.token_count
-
-        if current_batch:
-            batches.append(current_batch)
-
-        # Update total_batches in the database
-        if resource.id:
-            update_resource_total_batches(resource.id, len(batches))
+    embed (EMBED_BATCH): embed a batch of chunks, read from its checkpoint.
+    A batch an earlier attempt already stored is not embedded again.
+    """
+    payload = job["payload"]
+    # Jobs queued before batch checkpoints carry their chunks
+    chunks = payload.get("chunks")
+    if chunks is None:
+        batch = await asyncio.to_thread(
+            get_resource_batch, job["resource_id"], payload["batch_index"]
+        )
+        if batch is None:
+            # The resource was chunked again into fewer batches since
+            logger.warning(
+                f"Batch {payload['batch_index']} of resource {job['resource_id']} "
+                "is no longer checkpointed, skipping it"
+            )
+            return None, []
+        if batch["completed"]:
             logger.info(
-                f"Set total_batches to {len(batches)} for resource {resource.id}"
+                f"Batch {payload['batch_index']} of resource {job['resource_id']} "
+                "already stored"
             )
-
-        # Add a background task for each batch
-        for batch in batches:
-            logger.info("Generating embeddings for %s chunk batches", len(batch))
-            background_tasks.add_task(
-                generate_embeddings,
-                chunks=batch,
-                resource=resource,
-                workflow_id=workflow_id,
-                knowledge_id=knowledge_id,
-                file_size=file_size,
-                title=chunks_data["title"],
-                save_to_db=save_to_db,
-                context_id=context_id,
+            return None, await get_finalize_jobs_if_complete(
+                job, payload["title"], payload["file_size"]
             )
+        chunks = batch["chunks"]
 
-        return {"success": True, "batches": len(batches)}
+    embedded = await generate_embeddings(
+        [Chunk(**chunk) for chunk in chunks], job["workflow_id"]
+    )
+    return "persist", embedded
 
-    except Exception as e:
-        logger.error(
-            f"Error processing resource embeddings for {resource.id}: {str(e)}"
-        )
-        raise
 
+def get_replace_chunks_before(payload: Dict[str, Any]) -> Optional[datetime]:
+    """Return the time before which a rescrape replaces a resource's chunks."""
+    replace_chunks_before = payload.get("replace_chunks_before")
+    if not replace_chunks_before:
+        return None
+    return datetime.fromisoformat(replace_chunks_before)
 
+
+@traced_stage("persist")
+async def run_persist_stage(
+    job: Dict[str, Any], data: Any
+) -> Tuple[Optional[str], Any]:
+    """
+    persist (EMBED_BATCH): store an embedded batch; the last one queues
+    FINALIZE. persist (FINALIZE): mark the resource as processed.
+    """
+    payload = job["payload"]
+    resource = ResourceBase(**payload["resource"])
+    replace_chunks_before = get_replace_chunks_before(payload)
+
+    if job["type"] == "FINALIZE":
+        # Old chunks of a rescrape whose new text has no chunks to store
+        if replace_chunks_before and resource.id:
+            deleted = await asyncio.to_thread(
+                delete_chunks_for_resource,
+                resource.id,
+                job["workflow_id"],
+                replace_chunks_before,
+            )
+            if not deleted:
+                raise RuntimeError(f"Failed to delete old chunks of {resource.id}")
+        await finalize_resource(
+            resource,
+            payload["knowledge_id"],
+            payload["context_id"],
+            payload["title"],
+            payload["file_size"],
+        )
+        # Once per ingested resource, rather than per extraction attempt;
+        # flushed and broadcast periodically
+        usage_meter.record(job["workflow_id"], payload["file_size"])
+        return None, []
+
+    result = await store_embeddings(
+        embeddings_data=data["embeddings_data"],
+        dimensions=data["dimensions"],
+        resource=resource,
+        workflow_id=job["workflow_id"],
+        knowledge_id=payload["knowledge_id"],
+        context_id=payload["context_id"],
+        file_size=payload["file_size"],
+        title=payload["title"],
+        save_to_db=payload["save_to_db"],
+        batch_index=payload.get("batch_index"),
+        replace_chunks_before=replace_chunks_before,
+        job_id=job["id"],
+    )
+    if result.get("already_stored"):
+        return None, await get_finalize_jobs_if_complete(
+            job, payload["title"], payload["file_size"]
+        )
+    if not result["all_batches_completed"]:
+        return None, []
+    return None, [
+        get_follow_up_job(
+            job, "FINALIZE", title=payload["title"], file_size=payload["file_size"]
+        )
+    ]
+
+
+async def handle_failed_job(job: Dict[str, Any], error: str):
+    """Called once a job has failed for good: the resource failed too."""
+    payload = job["payload"]
+    logger.error(
+        f"{job['type']} job {job['id']} for resource {job['resource_id']} "
+        f"failed permanently: {error}"
+    )
+    await mark_resource_failed(
+        ResourceBase(**payload["resource"]),
+        payload["knowledge_id"],
+        payload["context_id"],
+        payload.get("title"),
+    )
+
+
+# Network-, CPU- and DB-bound stages, in pipeline order
+STAGE_HANDLERS = {
+    "fetch": run_fetch_stage,
+    "extract": run_extract_stage,
+    "chunk": run_chunk_stage,
+    "embed": run_embed_stage,
+    "persist": run_persist_stage,
+}
+
+# The stage each job type enters the pipeline at
+JOB_ENTRY_STAGES = {
+    "EXTRACT": "fetch",
+    "CHUNK": "chunk",
+    "EMBED_BATCH": "embed",
+    "FINALIZE": "persist",
+}
+
+
+@traced("rescrape resource")
 async def rescrape_resource_embeddings(
-    background_tasks: BackgroundTasks,
     resource: ResourceBase,
     workflow_id: str,
     knowledge_id: Optional[str],
     context_id: Optional[str],
     save_to_db: bool = False,
+    user_id: Optional[str] = None,
+    existing_resource: Optional[Resource] = None,
 ) -> Dict[str, Any]:
-    """Rescrape pipeline: check if content has changed before processing."""
-    existing_resource: Optional[Resource] = None
+    """
+    Rescrape pipeline: check if content has changed before processing.
+
+    `existing_resource` is the stored row when the caller already loaded it
+    (see get_resources_by_ids); otherwise it is read here.
+    """
+    set_span_attributes({"resource.id": resource.id, "workflow.id": workflow_id})
     try:
         if not resource.id:
             raise HTTPException(
@@ -599,8 +1382,9 @@ async def rescrape_resource_embeddings(
                 detail="Resource ID is required",
             )
 
-        # Get existing resource from database
-        existing_resource = get_resource_by_id(resource.id)
+        # Get existing resource from database unless it was prefetched
+        if existing_resource is None:
+            existing_resource = await asyncio.to_thread(get_resource_by_id, resource.id)
         if not existing_resource:
             logger.error(f"Resource {resource.id} not found in database")
             raise HTTPException(
@@ -629,6 +1413,8 @@ async def rescrape_resource_embeddings(
         # Extract text content to check hash
         text_content, file_size = await get_text_from_tika(str(resource.url))
 
+        set_span_attributes({"resource.file_size": file_size})
+
         # Compute new content hash
         new_content_hash = xxhash.xxh64(text_content.encode("utf-8")).hexdigest()
 
@@ -658,15 +1444,6 @@ async def rescrape_resource_embeddings(
                 },
             )
 
-            # Send Discord notification for cache hit
-            await send_discord_notification(
-                content=(
-                f"🎯 - cache hit for {resource.id}, with rescrape set to "
-                f"{existing_resource.scrape_frequency}"
-            ),
-                username="Itzam Rescrape Bot",
-            )
-
             return {
                 "status": "skipped",
                 "reason": "content_unchanged",
@@ -677,42 +1454,89 @@ async def rescrape_resource_embeddings(
             f"Content hash changed for resource {resource.id}, processing rescrape"
         )
 
-        delete_chunks_for_resource(resource.id)
-        logger.info(f"Deleted old chunks for resource {resource.id}")
-
-        # If content has changed, process normally
-        result = await process_resource_embeddings(
-            background_tasks,
-            resource,
+        # If content has changed, process normally. The old chunks stay
+        # searchable until the persist stage replaces them with the new ones.
+        # Queued behind interactive uploads (see RESCRAPE_PRIORITY)
+        job_ids = enqueue_resource_processing(
+            [resource],
             workflow_id,
-            knowledge_id or "",
-            context_id or "",
+            knowledge_id,
+            context_id,
             save_to_db,
+            user_id=user_id,
+            priority=RESCRAPE_PRIORITY,
+            replace_chunks_before=datetime.now(timezone.utc),
         )
+        return {"status": "queued", "job_ids": job_ids}
 
-        # Send Discord notification for content refresh
-        await send_discord_notification(
-            content=(
-                f"🔄 - refreshed for {resource.id}, with rescrape set to "
-                f"{existing_resource.scrape_frequency}"
-            ),
-            username="Itzam Rescrape Bot",
+    except Exception as e:
+        # Reported in the run's Discord summary by the caller (RescrapeReport)
+        logger.error(f"Error rescraping resource {resource.id}: {str(e)}")
+        raise
+
+
+def get_query_embedding(query: str, dimensions: int) -> List[float]:
+    """Embed a search query with the same model and size used for chunks."""
+    cache_key = f"{get_query_hash(query)}:{dimensions}"
+    cached_embedding = query_embedding_cache.get(cache_key)
+    if cached_embedding is not None:
+        return cached_embedding
+
+    if not settings.OPENAI_API_KEY:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="OpenAI API key not configured",
         )
 
-        return result
+    embedding = embed_text(query, dimensions)
+    query_embedding_cache.set(cache_key, embedding)
+    return embedding
 
-    except Exception as e:
-        logger.error(f"Error rescraping resource {resource.id}: {str(e)}")
 
-        # Send Discord notification for failure
-        scrape_freq = (
-            existing_resource.scrape_frequency if existing_resource else "UNKNOWN"
+async def search_similar_chunks(
+    query: str,
+    workflow_id: str,
+    knowledge_id: Optional[str] = None,
+    context_ids: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    min_similarity: float = 0.0,
+    ef_search: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Return the top-k chunks for a query within a workflow."""
+    limit = min(limit or settings.SEARCH_DEFAULT_LIMIT, settings.SEARCH_MAX_LIMIT)
+
+    generation = await asyncio.to_thread(get_workflow_search_generation, workflow_id)
+    cache_key = None
+    results = None
+    if generation is not None:
+        cache_key = get_search_cache_key(
+            workflow_id,
+            generation,
+            get_query_hash(query),
+            limit,
+            knowledge_id,
+            context_ids,
+            ef_search,
         )
-        await send_discord_notification(
-            content=(
-                f"❌ - failed for {resource.id}, with rescrape set to {scrape_freq}"
-            ),
-            username="Itzam Rescrape Bot",
+        results = search_result_cache.get(cache_key)
+
+    if results is None:
+        # These calls block on network I/O, keep them off the event loop
+        dimensions = await asyncio.to_thread(
+            get_workflow_embedding_dimensions, workflow_id
         )
+        embedding = await asyncio.to_thread(get_query_embedding, query, dimensions)
+        results = await asyncio.to_thread(
+            search_chunks,
+            embedding,
+            workflow_id,
+            knowledge_id,
+            context_ids,
+            limit,
+            ef_search,
+            dimensions=dimensions,
+        )
+        if cache_key is not None:
+            search_result_cache.set(cache_key, results)
 
-        raise
+    return [result for result in results if result["similarity"] >= min_similarity]
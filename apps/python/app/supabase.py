@@ -1,22 +1,39 @@
+import asyncio
 import logging
-from typing import Any, Dict
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
+from opentelemetry import trace
+from realtime import AsyncRealtimeChannel  # type: ignore[import-untyped]
 from supabase import AsyncClient, Client, create_async_client, create_client
 
 from .config import settings
+from .tracing import tracer
 
 logger = logging.getLogger(__name__)
 
 
+_supabase_client: Optional[Client] = None
+_supabase_client_lock = threading.Lock()
+
+
 def get_supabase_client() -> Client:
-    """Initialize Supabase client."""
+    """Return the process-wide Supabase client, created on first use."""
+    global _supabase_client
     if not settings.NEXT_PUBLIC_SUPABASE_URL or not settings.SUPABASE_ANON_KEY:
         raise ValueError(
             "NEXT_PUBLIC_SUPABASE_URL and SUPABASE_ANON_KEY environment "
             "variables are required"
         )
 
-    return create_client(settings.NEXT_PUBLIC_SUPABASE_URL, settings.SUPABASE_ANON_KEY)
+    with _supabase_client_lock:
+        if _supabase_client is None:
+            _supabase_client = create_client(
+                settings.NEXT_PUBLIC_SUPABASE_URL, settings.SUPABASE_ANON_KEY
+            )
+        return _supabase_client
 
 
 async def get_supabase_async_client() -> AsyncClient:
@@ -44,60 +61,263 @@ def get_channel_id(resource: Dict[str, Any], knowledge_id: str, context_id: str)
         raise ValueError("Either knowledge_id or context_id must be provided")
 
 
-async def send_update(
-    resource: Dict[str, Any], payload: Dict[str, Any], event_type: str = "update"
-):
-    """Send real-time update via Supabase channel."""
-    try:
-        supabase = await get_supabase_async_client()
-        channel_id = get_channel_id(
-            resource, payload["knowledgeId"], payload["contextId"]
-        )
+class RealtimePublisher:
+    """
+    Broadcasts realtime updates over one long-lived Supabase connection.
 
-        # Create channel and subscribe
-        channel = supabase.channel(channel_id)
-        await channel.subscribe()
+    Joined channels are kept and reused for later broadcasts, instead of
+    connecting, joining and leaving for every message. Channels unused for
+    REALTIME_CHANNEL_IDLE_SECONDS are left, as are the least recently used
+    ones beyond REALTIME_MAX_CHANNELS. The realtime client reconnects and
+    rejoins the channels when the socket closes; a failed broadcast drops the
+    connection and is retried once on a new one.
+    """
 
-        logger.info(
-            f"Sending {event_type} to channel {channel_id}: "
-            f"{payload.get('status', 'unknown')}"
+    def __init__(self, idle_seconds: float, max_channels: int):
+        self.idle_seconds = idle_seconds
+        self.max_channels = max_channels
+        self._client: Optional[AsyncClient] = None
+        # Channel id -> (joined channel, time of its last broadcast)
+        self._channels: "OrderedDict[str, Tuple[AsyncRealtimeChannel, float]]" = (
+            OrderedDict()
         )
+        self._lock = asyncio.Lock()
+        self._sweeper: Optional[asyncio.Task] = None
 
-        # Send the broadcast update
-        await channel.send_broadcast(event_type, payload)
+    def start(self):
+        """Leave idle channels in the background."""
+        if self._sweeper is None and self.idle_seconds > 0:
+            self._sweeper = asyncio.create_task(self.sweep())
 
-        # Unsubscribe from channel
-        await channel.unsubscribe()
+    async def close(self):
+        """Leave every channel and close the connection."""
+        if self._sweeper:
+            self._sweeper.cancel()
+            self._sweeper = None
+        async with self._lock:
+            await self._disconnect()
 
-        logger.info(f"Successfully sent {event_type} to channel {channel_id}")
+    async def publish(self, channel_id: str, event_type: str, payload: Dict[str, Any]):
+        """Broadcast a message on a channel, joining it first if needed."""
+        try:
+            channel = await self._get_channel(channel_id)
+            await channel.send_broadcast(event_type, payload)
+        except Exception as e:
+            logger.warning(
+                f"Broadcast to channel {channel_id} failed, reconnecting: {str(e)}"
+            )
+            async with self._lock:
+                await self._disconnect()
+            channel = await self._get_channel(channel_id)
+            await channel.send_broadcast(event_type, payload)
 
-    except Exception as e:
-        logger.error(f"Failed to send {event_type} to channel: {str(e)}")
-        # Don't raise the exception to avoid breaking the main flow
-        pass
+    async def sweep(self):
+        """Leave the channels idle for longer than idle_seconds."""
+        while True:
+            await asyncio.sleep(self.idle_seconds / 2)
+            try:
+                async with self._lock:
+                    await self._evict(time.monotonic() - self.idle_seconds)
+            except Exception as e:
+                logger.error(f"Failed to leave idle realtime channels: {str(e)}")
 
+    async def _get_channel(self, channel_id: str) -> AsyncRealtimeChannel:
+        async with self._lock:
+            cached = self._channels.get(channel_id)
+            if cached and not (cached[0].is_closed or cached[0].is_leaving):
+                self._channels[channel_id] = (cached[0], time.monotonic())
+                self._channels.move_to_end(channel_id)
+                return cached[0]
+
+            if self._client is None:
+                self._client = await get_supabase_async_client()
+            if not self._client.realtime.is_connected:
+                await self._client.realtime.connect()
+
+            channel = self._client.channel(channel_id)
+            await channel.subscribe()
+            self._channels[channel_id] = (channel, time.monotonic())
+            logger.info(f"Joined realtime channel {channel_id}")
+
+            if len(self._channels) > self.max_channels:
+                await self._evict(max_channels=self.max_channels)
+            return channel
+
+    async def _evict(
+        self, idle_since: Optional[float] = None, max_channels: Optional[int] = None
+    ):
+        """Leave channels unused since `idle_since` or beyond `max_channels`."""
+        for channel_id, (channel, last_used) in list(self._channels.items()):
+            over_limit = max_channels is not None and len(self._channels) > max_channels
+            idle = idle_since is not None and last_used < idle_since
+            # Least recently used first: the rest are more recent
+            if not (over_limit or idle):
+                break
+            del self._channels[channel_id]
+            try:
+                await channel.unsubscribe()
+            except Exception as e:
+                logger.warning(f"Failed to leave channel {channel_id}: {str(e)}")
+
+    async def _disconnect(self):
+        self._channels.clear()
+        client, self._client = self._client, None
+        if client:
+            try:
+                await client.realtime.close()
+            except Exception as e:
+                logger.warning(f"Failed to close the realtime connection: {str(e)}")
+
+
+realtime_publisher = RealtimePublisher(
+    settings.REALTIME_CHANNEL_IDLE_SECONDS, settings.REALTIME_MAX_CHANNELS
+)
 
-async def send_usage_update(
-    workflow_id: str, file_size: int, event_type: str = "update"
-):
-    """Send real-time usage (orange chart) update via Supabase channel."""
-    try:
-        supabase = await get_supabase_async_client()
-        channel_id = f"{workflow_id}-usage"
 
-        # Create channel and subscribe
-        channel = supabase.channel(channel_id)
-        await channel.subscribe()
+# Final statuses of a resource: always broadcast without waiting
+TERMINAL_STATUSES = ("PROCESSED", "FAILED", "SKIPPED")
+# Fields the clients add up across messages, so coalescing sums them
+ADDITIVE_FIELDS = ("processedChunks", "newFileSize")
+# Spans of the coalesced updates a broadcast span links to, at most
+MAX_BROADCAST_LINKS = 32
 
-        logger.info(f"Sending {event_type} to channel {channel_id}: {file_size}")
 
-        # Send the broadcast update
-        await channel.send_broadcast(event_type, {"newFileSize": file_size})
+class ProgressBroadcaster:
+    """
+    Queues realtime updates and broadcasts them in the background, off the
+    ingestion pipeline's path.
 
-        # Unsubscribe from channel
-        await channel.unsubscribe()
+    Updates are coalesced per (channel, event, resourceId): fields of a newer
+    update replace those of the pending one, except ADDITIVE_FIELDS, which
+    are summed. Each key is broadcast at most once per `interval`; updates
+    with a TERMINAL_STATUSES status are broadcast at once. A broadcast runs
+    in a span linked to the spans that posted its updates.
+    """
 
-        logger.info(f"Successfully sent {event_type} to channel {channel_id}")
+    def __init__(self, publisher: RealtimePublisher, interval: float):
+        self.publisher = publisher
+        self.interval = interval
+        # Key -> (channel id, event type, merged payload, terminal, links)
+        self._pending: Dict[
+            Tuple[str, str, Any], Tuple[str, str, Dict, bool, List[trace.Link]]
+        ] = {}
+        self._sent_at: Dict[Tuple[str, str, Any], float] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def post(self, channel_id: str, event_type: str, payload: Dict[str, Any]):
+        """Queue an update; returns without waiting for the broadcast."""
+        key = (channel_id, event_type, payload.get("resourceId"))
+        terminal = payload.get("status") in TERMINAL_STATUSES
+        span_context = trace.get_current_span().get_span_context()
+        links = [trace.Link(span_context)] if span_context.is_valid else []
+        pending = self._pending.get(key)
+        if pending:
+            merged = {**pending[2], **payload}
+            for field in ADDITIVE_FIELDS:
+                if field in pending[2] and field in payload:
+                    merged[field] = pending[2][field] + payload[field]
+            payload, terminal = merged, terminal or pending[3]
+            links = (pending[4] + links)[:MAX_BROADCAST_LINKS]
+        self._pending[key] = (channel_id, event_type, payload, terminal, links)
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        self._wake.set()
+
+    async def close(self):
+        """Broadcast every pending update and stop."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for key in list(self._pending):
+            await self.emit(key)
+
+    async def run(self):
+        """Broadcast the pending updates as their interval allows."""
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._pending:
+                now = time.monotonic()
+                for key, (_, _, _, terminal, _) in list(self._pending.items()):
+                    if terminal or now >= self._sent_at.get(key, 0) + self.interval:
+                        await self.emit(key)
+
+                if self._pending:
+                    next_at = min(
+                        self._sent_at.get(key, 0) + self.interval
+                        for key in self._pending
+                    )
+                    try:
+                        await asyncio.wait_for(
+                            self._wake.wait(), max(next_at - time.monotonic(), 0)
+                        )
+                        self._wake.clear()
+                    except asyncio.TimeoutError:
+                        pass
+
+            # Forget keys that could be broadcast right away again
+            now = time.monotonic()
+            for key, sent_at in list(self._sent_at.items()):
+                if sent_at + self.interval <= now:
+                    del self._sent_at[key]
+
+    async def emit(self, key: Tuple[str, str, Any]):
+        channel_id, event_type, payload, terminal, links = self._pending.pop(key)
+        if terminal:
+            self._sent_at.pop(key, None)
+        else:
+            self._sent_at[key] = time.monotonic()
+        try:
+            logger.info(
+                f"Sending {event_type} to channel {channel_id}: "
+                f"{payload.get('status', payload)}"
+            )
+            # A new trace: the broadcast may carry updates of several spans
+            with tracer.start_as_current_span(
+                "broadcast update",
+                context=trace.set_span_in_context(trace.INVALID_SPAN),
+                links=links,
+                attributes={"itzam.realtime.channel": channel_id},
+            ):
+                await self.publisher.publish(channel_id, event_type, payload)
+        except Exception as e:
+            logger.error(f"Failed to send {event_type} to channel: {str(e)}")
+            # Don't raise the exception to avoid breaking the main flow
+
+
+progress_broadcaster = ProgressBroadcaster(
+    realtime_publisher, settings.REALTIME_PROGRESS_INTERVAL_SECONDS
+)
+
+
+async def send_update(
+    resource: Dict[str, Any], payload: Dict[str, Any], event_type: str = "update"
+):
+    """Queue a real-time update via Supabase channel (see ProgressBroadcaster)."""
+    with tracer.start_as_current_span(
+        "send_update", attributes={"itzam.resource.id": payload.get("resourceId") or ""}
+    ):
+        try:
+            channel_id = get_channel_id(
+                resource, payload["knowledgeId"], payload["contextId"]
+            )
+            progress_broadcaster.post(channel_id, event_type, payload)
+
+        except Exception as e:
+            logger.error(f"Failed to send {event_type} to channel: {str(e)}")
+            # Don't raise the exception to avoid breaking the main flow
+            pass
+
+
+async def send_usage_update(
+    workflow_id: str, file_size: int, event_type: str = "update"
+):
+    """Queue a real-time usage (orange chart) update via Supabase channel."""
+    try:
+        channel_id = f"{workflow_id}-usage"
+        progress_broadcaster.post(channel_id, event_type, {"newFileSize": file_size})
 
     except Exception as e:
         logger.error(f"Failed to send {event_type} to channel: {str(e)}")
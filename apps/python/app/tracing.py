@@ -0,0 +1,162 @@
+"""
+OpenTelemetry tracing of resource ingestion.
+
+Every resource ingestion is one trace: enqueueing its EXTRACT job starts an
+`ingest resource` span, and its trace context travels in the payload of the
+job and of every follow-up job (CHUNK, EMBED_BATCH, FINALIZE), so the spans of
+each pipeline stage join the trace in whichever process runs them. A rescrape
+request is one trace too, which the ingestions it queues join.
+
+Within a stage, downloading, extraction, title generation, chunking, each
+embedding batch, saving chunks and every realtime update get child spans.
+Spans started in background tasks keep their parent: asyncio tasks and
+asyncio.to_thread copy the current context, and coalesced realtime updates
+are broadcast in a span linked to the spans that posted them.
+
+Spans are exported over OTLP/HTTP to TRACING_OTLP_ENDPOINT when
+TRACING_ENABLED; otherwise the tracer is a no-op.
+"""
+
+import functools
+import inspect
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from opentelemetry import propagate, trace
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import Span, SpanKind
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+tracer = trace.get_tracer("itzam.ingestion")
+
+_provider: Optional[TracerProvider] = None
+
+
+def setup_tracing(component: str):
+    """Export spans to the collector, if enabled. Call once per process."""
+    global _provider
+    if not settings.TRACING_ENABLED or _provider is not None:
+        return
+
+    _provider = TracerProvider(
+        resource=Resource.create(
+            {
+                SERVICE_NAME: settings.TRACING_SERVICE_NAME,
+                "itzam.component": component,
+            }
+        ),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATIO)),
+    )
+    _provider.add_span_processor(
+        BatchSpanProcessor(OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT))
+    )
+    trace.set_tracer_provider(_provider)
+    logger.info(f"Exporting traces to {settings.TRACING_OTLP_ENDPOINT}")
+
+
+def shutdown_tracing():
+    """Export the spans still buffered."""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def start_ingestion_trace(
+    resource_id: Optional[str], workflow_id: str
+) -> Dict[str, str]:
+    """
+    Start the trace of a resource ingestion, within the current one if any
+    (e.g. a rescrape request), and return its context to carry in the jobs.
+    """
+    with tracer.start_as_current_span(
+        "ingest resource",
+        kind=SpanKind.PRODUCER,
+        attributes={
+            "itzam.resource.id": resource_id or "",
+            "itzam.workflow.id": workflow_id,
+        },
+    ):
+        carrier: Dict[str, str] = {}
+        propagate.inject(carrier)
+        return carrier
+
+
+def traced(name: str):
+    """Decorate a function (sync or async) to run it in a child span."""
+
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(name):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def get_job_attributes(job: Dict[str, Any]) -> Dict[str, Any]:
+    payload = job["payload"]
+    attributes = {
+        "itzam.job.id": job.get("id") or "",
+        "itzam.job.type": job["type"],
+        "itzam.job.attempts": job.get("attempts") or 0,
+        "itzam.resource.id": job["resource_id"] or "",
+        "itzam.workflow.id": job["workflow_id"],
+    }
+    if payload.get("file_size") is not None:
+        attributes["itzam.resource.file_size"] = payload["file_size"]
+    if payload.get("batch_index") is not None:
+        attributes["itzam.batch.index"] = payload["batch_index"]
+    return attributes
+
+
+@contextmanager
+def job_span(job: Dict[str, Any], stage: str) -> Iterator[Span]:
+    """Run a pipeline stage of a job in the trace of its resource."""
+    context = propagate.extract(job["payload"].get("trace_context") or {})
+    with tracer.start_as_current_span(
+        f"{stage} {job['type']}",
+        context=context,
+        kind=SpanKind.CONSUMER,
+        attributes=get_job_attributes(job),
+    ) as span:
+        yield span
+
+
+def traced_stage(stage: str):
+    """Decorate a pipeline stage handler to run it in a job_span."""
+
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(job: Dict[str, Any], data: Any):
+            with job_span(job, stage):
+                return await handler(job, data)
+
+        return wrapper
+
+    return decorate
+
+
+def set_span_attributes(attributes: Dict[str, Any]):
+    """Add attributes (e.g. sizes learned midway) to the current span."""
+    span = trace.get_current_span()
+    for key, value in attributes.items():
+        if value is not None:
+            span.set_attribute(f"itzam.{key}", value)
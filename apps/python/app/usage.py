@@ -0,0 +1,95 @@
+"""
+Aggregated usage metering of ingested content.
+
+Every ingested resource adds its extracted size to the usage of its
+workflow once, when its FINALIZE job runs, rather than on every extraction
+attempt. Instead of a usage broadcast per resource, UsageMeter adds the
+sizes up per workflow in memory and flushes them every
+USAGE_FLUSH_INTERVAL_SECONDS, or as soon as a workflow has
+USAGE_FLUSH_THRESHOLD_BYTES pending. A flush adds the totals
+to the durable workflow_usage table and then sends one {workflow}-usage
+update per workflow with the size ingested in the window.
+
+Totals that could not be written are kept and flushed with the next window,
+so the usage chart never counts bytes that were not recorded.
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from .config import settings
+from .database import add_workflow_usage
+from .supabase import send_usage_update
+
+logger = logging.getLogger(__name__)
+
+
+class UsageMeter:
+    """Adds up ingested bytes per workflow and flushes them periodically."""
+
+    def __init__(self, interval: float, threshold_bytes: int):
+        self.interval = interval
+        self.threshold_bytes = threshold_bytes
+        # Workflow id -> {"bytes": ..., "resources": ...} since the last flush
+        self._pending: Dict[str, Dict[str, int]] = {}
+        self._flush_now = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, workflow_id: str, file_size: int):
+        """Add the size of an ingested resource to its workflow's usage."""
+        totals = self._pending.setdefault(workflow_id, {"bytes": 0, "resources": 0})
+        totals["bytes"] += file_size
+        totals["resources"] += 1
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        if self.threshold_bytes and totals["bytes"] >= self.threshold_bytes:
+            self._flush_now.set()
+
+    async def close(self):
+        """Stop flushing periodically and flush what is pending."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def run(self):
+        """Flush every interval, or earlier once a threshold is reached."""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Usage flush failed: {str(e)}")
+
+    async def flush(self):
+        """Write the pending usage, then broadcast it per workflow."""
+        async with self._lock:
+            usage, self._pending = self._pending, {}
+            if not usage:
+                return
+
+            if not await asyncio.to_thread(add_workflow_usage, usage):
+                # Keep it for the next window, with what was recorded meanwhile
+                for workflow_id, totals in usage.items():
+                    pending = self._pending.setdefault(
+                        workflow_id, {"bytes": 0, "resources": 0}
+                    )
+                    pending["bytes"] += totals["bytes"]
+                    pending["resources"] += totals["resources"]
+                return
+
+        for workflow_id, totals in usage.items():
+            await send_usage_update(workflow_id, totals["bytes"])
+        logger.info(f"Flushed the ingestion usage of {len(usage)} workflows")
+
+
+usage_meter = UsageMeter(
+    settings.USAGE_FLUSH_INTERVAL_SECONDS, settings.USAGE_FLUSH_THRESHOLD_BYTES
+)
@@ -0,0 +1,67 @@
+"""
+SQL expressions shared by the vector indexes and the search queries.
+
+An index is only used when the query's ORDER BY repeats the indexed
+expression and operator exactly, so both sides are built from here.
+"""
+
+EMBEDDING_DIMENSIONS = 1536
+
+# Shortened text-embedding-3 outputs a workflow can opt into, each stored in
+# its own chunks column (see workflow.embedding_dimensions)
+SUPPORTED_EMBEDDING_DIMENSIONS = (256, 512, 1024, EMBEDDING_DIMENSIONS)
+
+# "none" searches the full-precision vectors. "halfvec" and "binary" run a
+# first pass over a quantized copy of the vectors (stored only in the index)
+# and re-rank the candidates with the full-precision column.
+SEARCH_QUANTIZATIONS = ("none", "halfvec", "binary")
+
+
+def get_embedding_column(dimensions: int = EMBEDDING_DIMENSIONS) -> str:
+    """Return the chunks column holding embeddings of a given size."""
+    if dimensions not in SUPPORTED_EMBEDDING_DIMENSIONS:
+        raise ValueError(f"Unsupported embedding dimensions: {dimensions}")
+    if dimensions == EMBEDDING_DIMENSIONS:
+        return "embedding"
+    return f"embedding_{dimensions}"
+
+
+def get_indexed_expression(
+    quantization: str, dimensions: int = EMBEDDING_DIMENSIONS
+) -> str:
+    """Return the expression a vector index is built on."""
+    column = get_embedding_column(dimensions)
+    if quantization == "halfvec":
+        return f"({column}::halfvec({dimensions}))"
+    if quantization == "binary":
+        return f"(binary_quantize({column})::bit({dimensions}))"
+    return column
+
+
+def get_operator_class(quantization: str) -> str:
+    """Return the operator class of the index for a quantization."""
+    if quantization == "halfvec":
+        return "halfvec_cosine_ops"
+    if quantization == "binary":
+        return "bit_hamming_ops"
+    return "vector_cosine_ops"
+
+
+def get_distance_expression(
+    quantization: str,
+    embedding: str,
+    dimensions: int = EMBEDDING_DIMENSIONS,
+    table_alias: str = "c",
+) -> str:
+    """Return the ORDER BY expression that can be served by the index."""
+    column = f"{table_alias}.{get_embedding_column(dimensions)}"
+    if quantization == "halfvec":
+        return (
+            f"{column}::halfvec({dimensions}) <=> ({embedding})::halfvec({dimensions})"
+        )
+    if quantization == "binary":
+        return (
+            f"binary_quantize({column})::bit({dimensions}) "
+            f"<~> binary_quantize({embedding})"
+        )
+    return f"{column} <=> {embedding}"
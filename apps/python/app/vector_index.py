@@ -0,0 +1,345 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from .config import settings
+from .database import engine
+from .vector_expressions import (
+    EMBEDDING_DIMENSIONS,
+    SEARCH_QUANTIZATIONS,
+    get_embedding_column,
+    get_indexed_expression,
+    get_operator_class,
+)
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_INDEX_SUFFIXES = {"none": "", "halfvec": "_halfvec", "binary": "_bit"}
+VECTOR_INDEX_METHODS = ("hnsw", "ivfflat")
+
+# size_bytes sums the per-partition indexes of a partitioned index
+INDEX_DEFINITION_QUERY = """
+    SELECT pg_get_indexdef(i.indexrelid) AS definition,
+           i.indisvalid AS is_valid,
+           (
+               SELECT coalesce(sum(pg_relation_size(t.relid)), 0)
+               FROM pg_partition_tree(i.indexrelid) t
+           )::bigint AS size_bytes
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = :index_name
+"""
+
+INDEX_BUILD_PROGRESS_QUERY = """
+    SELECT p.relid::regclass::text AS partition,
+           p.phase, p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total
+    FROM pg_stat_progress_create_index p
+    WHERE p.relid IN (
+        SELECT t.relid FROM pg_partition_tree(CAST(:table_name AS regclass)) t
+    )
+"""
+
+# Deepest partitions first, so child indexes exist before parents attach them
+PARTITION_TREE_QUERY = """
+    SELECT c.relname AS name, p.relname AS parent, t.isleaf AS is_leaf
+    FROM pg_partition_tree(CAST(:table_name AS regclass)) t
+    JOIN pg_class c ON c.oid = t.relid
+    LEFT JOIN pg_class p ON p.oid = t.parentrelid
+    ORDER BY t.level DESC, c.relname
+"""
+
+
+def get_index_options(
+    method: str,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    lists: Optional[int] = None,
+) -> str:
+    """Return the WITH (...) storage parameters for a vector index."""
+    if method == "hnsw":
+        return (
+            f"m = {int(m or settings.VECTOR_INDEX_HNSW_M)}, "
+            f"ef_construction = "
+            f"{int(ef_construction or settings.VECTOR_INDEX_HNSW_EF_CONSTRUCTION)}"
+        )
+    if method == "ivfflat":
+        return f"lists = {int(lists or settings.VECTOR_INDEX_IVFFLAT_LISTS)}"
+    raise ValueError(f"Unsupported vector index method: {method}")
+
+
+def get_index_definition(index_name: str) -> Optional[Dict[str, Any]]:
+    """Return the definition and validity of an index, or None if missing."""
+    with engine.connect() as connection:
+        row = (
+            connection.execute(text(INDEX_DEFINITION_QUERY), {"index_name": index_name})
+            .mappings()
+            .first()
+        )
+
+    return dict(row) if row else None
+
+
+def get_partition_tree(table_name: str = "chunks") -> List[Dict[str, Any]]:
+    """
+    Return the tables of a partition tree, deepest first. A table that is not
+    partitioned is returned alone as a leaf.
+    """
+    with engine.connect() as connection:
+        rows = connection.execute(
+            text(PARTITION_TREE_QUERY), {"table_name": table_name}
+        ).mappings()
+        return [dict(row) for row in rows]
+
+
+def get_chunks_embedding_index_name(
+    quantization: str,
+    dimensions: int = EMBEDDING_DIMENSIONS,
+    table_name: str = "chunks",
+) -> str:
+    """
+    Return the name of the chunks vector index for a quantization mode and
+    embedding size, e.g. chunks_embedding_idx or chunks_embedding_512_bit_idx.
+    Partitions name their own index after themselves, e.g.
+    chunks_h03_embedding_idx.
+    """
+    if quantization not in SEARCH_QUANTIZATIONS:
+        raise ValueError(f"Unsupported search quantization: {quantization}")
+    column = get_embedding_column(dimensions)
+    return f"{table_name}_{column}{QUANTIZATION_INDEX_SUFFIXES[quantization]}_idx"
+
+
+def get_chunks_embedding_index_status(
+    quantization: str = "none",
+    dimensions: int = EMBEDDING_DIMENSIONS,
+    table_name: str = "chunks",
+) -> Dict[str, Any]:
+    """Return the state of a chunks vector index and any running build."""
+    index_name = get_chunks_embedding_index_name(quantization, dimensions, table_name)
+    index = get_index_definition(index_name)
+
+    with engine.connect() as connection:
+        progress = (
+            connection.execute(
+                text(INDEX_BUILD_PROGRESS_QUERY), {"table_name": table_name}
+            )
+            .mappings()
+            .first()
+        )
+
+    return {
+        "index_name": index_name,
+        "quantization": quantization,
+        "dimensions": dimensions,
+        "exists": index is not None,
+        "is_valid": bool(index and index["is_valid"]),
+        "definition": index["definition"] if index else None,
+        "size_bytes": index["size_bytes"] if index else 0,
+        "build_in_progress": progress is not None,
+        "progress": dict(progress) if progress else None,
+    }
+
+
+def build_chunks_embedding_index(
+    method: Optional[str] = None,
+    rebuild: bool = False,
+    m: Optional[int] = None,
+    ef_construction: Optional[int] = None,
+    lists: Optional[int] = None,
+    quantization: str = "none",
+    dimensions: int = EMBEDDING_DIMENSIONS,
+    table_name: str = "chunks",
+) -> Dict[str, Any]:
+    """
+    Build (or rebuild) a vector index on the chunks embedding column for
+    `dimensions`. Rows whose column is NULL (other workflow sizes) are not
+    indexed.
+
+    Quantized indexes are expression indexes over a halfvec or binary copy of
+    the embedding, so the quantized vectors live only in the index while the
+    full-precision column stays available for re-ranking.
+
+    All DDL runs with CONCURRENTLY so inserts from the ingestion pipeline
+    keep working while the index is built. A rebuild creates the new index
+    under a temporary name and swaps it in, so search never runs without one.
+
+    On a partitioned table every partition gets its own index, see
+    build_partitioned_embedding_index.
+    """
+    method = method or settings.VECTOR_INDEX_METHOD
+    if method not in VECTOR_INDEX_METHODS:
+        raise ValueError(f"Unsupported vector index method: {method}")
+
+    index_name = get_chunks_embedding_index_name(quantization, dimensions, table_name)
+    options = get_index_options(method, m, ef_construction, lists)
+    expression = get_indexed_expression(quantization, dimensions)
+    operator_class = get_operator_class(quantization)
+    existing = get_index_definition(index_name)
+
+    if existing and existing["is_valid"] and not rebuild:
+        logger.info(f"Index {index_name} already exists, skipping")
+        return {"success": True, "action": "skipped", "index": existing}
+
+    partitions = get_partition_tree(table_name)
+    if len(partitions) > 1:
+        # An invalid parent index is an interrupted build, which is resumed
+        rebuild = bool(existing and existing["is_valid"])
+        build_partitioned_embedding_index(
+            partitions,
+            method,
+            f"{expression} {operator_class}",
+            options,
+            quantization,
+            dimensions,
+            rebuild=rebuild,
+        )
+        logger.info(f"Index {index_name} is ready on {len(partitions)} tables")
+        return {
+            "success": True,
+            "action": "rebuilt" if rebuild else "created",
+            "index": get_index_definition(index_name),
+        }
+
+    temp_index = f"{index_name}_new"
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(
+            text("SELECT set_config('maintenance_work_mem', :value, false)"),
+            {"value": settings.VECTOR_INDEX_MAINTENANCE_WORK_MEM},
+        )
+
+        # Leftovers of an interrupted concurrent build are invalid indexes
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {temp_index}"))
+        if existing and not existing["is_valid"]:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+            existing = None
+
+        target = temp_index if existing else index_name
+        logger.info(f"Building {method} index {target} on {table_name} ({options})")
+        connection.execute(
+            text(
+                f"CREATE INDEX CONCURRENTLY {target} ON {table_name} "
+                f"USING {method} ({expression} {operator_class}) WITH ({options})"
+            )
+        )
+
+        if existing:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+            connection.execute(text(f"ALTER INDEX {temp_index} RENAME TO {index_name}"))
+
+    logger.info(f"Index {index_name} is ready")
+    return {
+        "success": True,
+        "action": "rebuilt" if existing else "created",
+        "index": get_index_definition(index_name),
+    }
+
+
+def build_partitioned_embedding_index(
+    partitions: List[Dict[str, Any]],
+    method: str,
+    column_definition: str,
+    options: str,
+    quantization: str,
+    dimensions: int,
+    rebuild: bool = False,
+) -> None:
+    """
+    Build a vector index on every leaf partition concurrently, then tie them
+    together under an index on each partitioned table. Each partition's
+    graph only holds its own workflows, so it stays small enough to fit in
+    memory and a search pruned to one partition only walks that graph.
+
+    Partitioned indexes cannot be created or dropped concurrently, so the
+    parents are created ON ONLY (catalog-only) and attach the built leaves.
+    A rebuild builds the whole tree under `_new` names, then drops the old
+    tree and renames the new one in a single short transaction.
+    """
+    suffix = "_new" if rebuild else ""
+
+    def index_name(table_name: str) -> str:
+        return (
+            get_chunks_embedding_index_name(quantization, dimensions, table_name)
+            + suffix
+        )
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(
+            text("SELECT set_config('maintenance_work_mem', :value, false)"),
+            {"value": settings.VECTOR_INDEX_MAINTENANCE_WORK_MEM},
+        )
+
+        for partition in partitions:
+            if not partition["is_leaf"]:
+                continue
+            leaf_index = index_name(partition["name"])
+            existing = get_index_definition(leaf_index)
+            if existing and existing["is_valid"]:
+                continue
+            # Invalid leftovers of an interrupted build were never attached
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {leaf_index}"))
+            logger.info(f"Building {method} index {leaf_index} ({options})")
+            connection.execute(
+                text(
+                    f"CREATE INDEX CONCURRENTLY {leaf_index} ON {partition['name']} "
+                    f"USING {method} ({column_definition}) WITH ({options})"
+                )
+            )
+
+        for partition in partitions:
+            if partition["is_leaf"]:
+                continue
+            parent_index = index_name(partition["name"])
+            connection.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS {parent_index} "
+                    f"ON ONLY {partition['name']} "
+                    f"USING {method} ({column_definition}) WITH ({options})"
+                )
+            )
+            for child in partitions:
+                if child["parent"] == partition["name"]:
+                    connection.execute(
+                        text(
+                            f"ALTER INDEX {parent_index} "
+                            f"ATTACH PARTITION {index_name(child['name'])}"
+                        )
+                    )
+
+    if rebuild:
+        root = partitions[-1]["name"]
+        with engine.begin() as connection:
+            connection.execute(
+                text(
+                    "DROP INDEX IF EXISTS "
+                    + get_chunks_embedding_index_name(quantization, dimensions, root)
+                )
+            )
+            for partition in partitions:
+                final_name = get_chunks_embedding_index_name(
+                    quantization, dimensions, partition["name"]
+                )
+                connection.execute(
+                    text(
+                        f"ALTER INDEX IF EXISTS {final_name}_new RENAME TO {final_name}"
+                    )
+                )
+
+
+def drop_chunks_embedding_index(
+    quantization: str, dimensions: int = EMBEDDING_DIMENSIONS
+) -> Dict[str, Any]:
+    """
+    Drop a chunks vector index, e.g. the full-precision one once search runs
+    on a quantized index, to free the memory it holds.
+    """
+    index_name = get_chunks_embedding_index_name(quantization, dimensions)
+
+    # Indexes of a partitioned table cannot be dropped concurrently
+    concurrently = "" if len(get_partition_tree()) > 1 else "CONCURRENTLY "
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"DROP INDEX {concurrently}IF EXISTS {index_name}"))
+
+    logger.info(f"Dropped index {index_name}")
+    return {"success": True, "action": "dropped", "index_name": index_name}
@@ -0,0 +1,145 @@
+"""
+Standalone ingestion worker: consumes the job queue without serving the API.
+
+Jobs run through the stage-parallel ingestion pipeline, where each stage
+(fetch, extract, chunk, embed, persist) has its own workers, so slow
+CPU-bound extraction cannot starve embedding batches and the other way
+round. Run any number of workers next to API processes started with
+JOB_CONSUMER_ENABLED=false. With RESCRAPE_SCHEDULER_ENABLED a worker also
+schedules due rescrapes. Prometheus metrics are served on WORKER_METRICS_PORT,
+next to a /health readiness check that fails while the worker drains.
+
+Run from apps/python:
+    python -m app.worker
+    python -m app.worker --workers extract=1 --workers embed=16
+    python -m app.worker --job-type EMBED_BATCH --job-type FINALIZE
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import signal
+from typing import Dict, List
+
+from .config import settings
+from .extraction import converter_pool
+from .jobs import JOB_TYPES, STAGES, JobConsumer, get_default_stage_workers
+from .metrics import serve_metrics
+from .rescrape_scheduler import RescrapeScheduler
+from .supabase import progress_broadcaster, realtime_publisher
+from .tracing import setup_tracing, shutdown_tracing
+from .usage import usage_meter
+
+logger = logging.getLogger(__name__)
+
+
+def parse_stage_workers(overrides: List[str]) -> Dict[str, int]:
+    """Apply STAGE=N overrides to the configured workers per stage."""
+    stage_workers = get_default_stage_workers()
+    for override in overrides:
+        stage, _, value = override.partition("=")
+        stage = stage.strip().lower()
+        if stage not in STAGES or not value.strip().isdigit() or int(value) < 1:
+            raise ValueError(
+                f"Invalid workers {override!r}, expected STAGE=N with N >= 1 and "
+                f"STAGE one of {', '.join(STAGES)}"
+            )
+        stage_workers[stage] = int(value)
+    return stage_workers
+
+
+def parse_job_types(job_types: List[str]) -> List[str]:
+    """Validate the job types to consume; all of them by default."""
+    job_types = [job_type.strip().upper() for job_type in job_types]
+    for job_type in job_types:
+        if job_type not in JOB_TYPES:
+            raise ValueError(
+                f"Invalid job type {job_type!r}, expected one of {', '.join(JOB_TYPES)}"
+            )
+    return job_types or list(JOB_TYPES)
+
+
+async def log_stats(consumer: JobConsumer, interval: float):
+    """Periodically log the per-stage queue depth of the pipeline."""
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(f"Ingestion pipeline: {json.dumps(consumer.stats())}")
+
+
+async def run_worker(job_types: List[str], stage_workers: Dict[str, int]):
+    """Consume jobs until SIGINT or SIGTERM, then drain the pipeline."""
+    consumer = JobConsumer(job_types, stage_workers)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    setup_tracing("worker")
+    realtime_publisher.start()
+    metrics_runner = None
+    if settings.WORKER_METRICS_PORT > 0:
+        metrics_runner = await serve_metrics(settings.WORKER_METRICS_PORT, consumer)
+    consumer.start()
+    scheduler = None
+    if settings.RESCRAPE_SCHEDULER_ENABLED:
+        scheduler = RescrapeScheduler()
+        scheduler.start()
+    stats_task = None
+    if settings.PIPELINE_STATS_INTERVAL_SECONDS > 0:
+        stats_task = asyncio.create_task(
+            log_stats(consumer, settings.PIPELINE_STATS_INTERVAL_SECONDS)
+        )
+
+    await stop.wait()
+    logger.info("Worker shutting down, draining running jobs")
+    consumer.drain(settings.JOB_SHUTDOWN_TIMEOUT_SECONDS)
+    if scheduler:
+        await scheduler.stop(timeout=settings.JOB_SHUTDOWN_TIMEOUT_SECONDS)
+    await consumer.stop(timeout=settings.JOB_SHUTDOWN_TIMEOUT_SECONDS)
+    # Kept logging during the drain, which shows its progress
+    if stats_task:
+        stats_task.cancel()
+    await asyncio.to_thread(converter_pool.close)
+    await usage_meter.close()
+    await progress_broadcaster.close()
+    await realtime_publisher.close()
+    if metrics_runner:
+        await metrics_runner.cleanup()
+    shutdown_tracing()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--workers",
+        action="append",
+        default=[],
+        metavar="STAGE=N",
+        help="Workers of a pipeline stage, e.g. embed=16",
+    )
+    parser.add_argument(
+        "--job-type",
+        action="append",
+        default=[],
+        help="Only consume jobs of this type (repeatable; all types by default)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+    job_types = parse_job_types(args.job_type)
+    stage_workers = parse_stage_workers(args.workers)
+    logger.info(
+        f"Starting ingestion worker for {', '.join(job_types)}: "
+        + ", ".join(f"{stage}={n}" for stage, n in stage_workers.items())
+    )
+    asyncio.run(run_worker(job_types, stage_workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark recall and latency of the vector search quantization modes.
+
+Samples chunk embeddings of a workflow as queries, computes the exact top-k
+with index scans disabled, then runs each mode against its index and reports
+recall@k, latency percentiles and index size.
+
+Run from apps/python:
+    python -m scripts.benchmark_search --workflow-id <id> --queries 100 --limit 10
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from app.database import get_db_session, search_chunks
+from app.vector_expressions import (
+    SEARCH_QUANTIZATIONS,
+    SUPPORTED_EMBEDDING_DIMENSIONS,
+    get_embedding_column,
+)
+from app.vector_index import get_chunks_embedding_index_status
+
+
+def sample_query_embeddings(
+    workflow_id: str, count: int, dimensions: int
+) -> List[List[float]]:
+    """Return embeddings of random chunks of a workflow to use as queries."""
+    column = get_embedding_column(dimensions)
+    session = get_db_session()
+    try:
+        rows = session.execute(
+            text(
+                f"SELECT {column}::text FROM chunks "
+                f"WHERE workflow_id = :workflow_id AND {column} IS NOT NULL "
+                "ORDER BY random() LIMIT :count"
+            ),
+            {"workflow_id": workflow_id, "count": count},
+        ).scalars()
+        return [[float(value) for value in row.strip("[]").split(",")] for row in rows]
+    finally:
+        session.close()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Return the value at a fraction (0-1) of the sorted values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def benchmark_mode(
+    quantization: str,
+    queries: List[List[float]],
+    ground_truth: List[set],
+    workflow_id: str,
+    limit: int,
+    ef_search: int | None,
+    dimensions: int,
+) -> Dict[str, float]:
+    """Run every query in one mode and return recall and latency stats."""
+    latencies = []
+    recalls = []
+
+    for query, expected in zip(queries, ground_truth):
+        start = time.perf_counter()
+        results = search_chunks(
+            query,
+            workflow_id,
+            limit=limit,
+            ef_search=ef_search,
+            quantization=quantization,
+            dimensions=dimensions,
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        found = {result["id"] for result in results}
+        recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+
+    return {
+        "recall": statistics.mean(recalls),
+        "p50_ms": percentile(latencies, 0.5),
+        "p95_ms": percentile(latencies, 0.95),
+        "mean_ms": statistics.mean(latencies),
+    }
+
+
+def main() -> bool:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workflow-id", required=True)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, default=None)
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        default=1536,
+        choices=SUPPORTED_EMBEDDING_DIMENSIONS,
+    )
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        default=list(SEARCH_QUANTIZATIONS),
+        choices=SEARCH_QUANTIZATIONS,
+    )
+    args = parser.parse_args()
+
+    queries = sample_query_embeddings(args.workflow_id, args.queries, args.dimensions)
+    if not queries:
+        print(f"❌ No chunks found for workflow {args.workflow_id}")
+        return False
+
+    print(f"🔍 Computing exact top-{args.limit} for {len(queries)} queries...")
+    ground_truth = [
+        {
+            result["id"]
+            for result in search_chunks(
+                query,
+                args.workflow_id,
+                limit=args.limit,
+                quantization="none",
+                exact=True,
+                dimensions=args.dimensions,
+            )
+        }
+        for query in queries
+    ]
+
+    print()
+    print(f"{'mode':<10}{'index size':>14}{'recall':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for quantization in args.modes:
+        index_status = get_chunks_embedding_index_status(quantization, args.dimensions)
+        if not index_status["is_valid"]:
+            print(f"{quantization:<10}{'missing':>14}  (build it first, skipping)")
+            continue
+
+        stats = benchmark_mode(
+            quantization,
+            queries,
+            ground_truth,
+            args.workflow_id,
+            args.limit,
+            args.ef_search,
+            args.dimensions,
+        )
+        size_mb = index_status["size_bytes"] / (1024 * 1024)
+        print(
+            f"{quantization:<10}{size_mb:>11.1f} MB{stats['recall']:>10.3f}"
+            f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+        )
+
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
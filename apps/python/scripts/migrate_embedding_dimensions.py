@@ -0,0 +1,104 @@
+"""
+Move a workflow to a smaller embedding size without re-embedding its chunks.
+
+Steps, all safe to run while the service is live and to re-run if interrupted:
+  1. Backfill the target column by truncating and re-normalizing the current
+     embeddings (equivalent to requesting fewer dimensions from the model).
+  2. Build the vector index for the target column if it is missing.
+  3. Switch workflow.embedding_dimensions, so ingestion and search use it.
+  4. Wait for other processes to drop their cached workflow settings, then
+     backfill chunks they wrote in the meantime.
+  5. Optionally (--clear-other-columns) null out the other embedding columns
+     to reclaim storage. Going back to a larger size then needs re-ingestion.
+
+Run from apps/python:
+    python -m scripts.migrate_embedding_dimensions --workflow-id <id> --dimensions 512
+"""
+
+import argparse
+import sys
+import time
+
+from app.config import settings
+from app.database import (
+    backfill_reduced_embeddings,
+    clear_unused_embeddings,
+    get_workflow_embedding_dimensions,
+    set_workflow_embedding_dimensions,
+)
+from app.vector_expressions import SUPPORTED_EMBEDDING_DIMENSIONS
+from app.vector_index import build_chunks_embedding_index
+
+
+def backfill(workflow_id: str, source: int, target: int, batch_size: int) -> int:
+    """Backfill the target column in batches and return the rows updated."""
+    total = 0
+    while True:
+        updated = backfill_reduced_embeddings(workflow_id, source, target, batch_size)
+        if not updated:
+            return total
+        total += updated
+        print(f"   backfilled {total} chunks")
+
+
+def main() -> bool:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workflow-id", required=True)
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        required=True,
+        choices=SUPPORTED_EMBEDDING_DIMENSIONS,
+    )
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--clear-other-columns", action="store_true")
+    parser.add_argument("--skip-index", action="store_true")
+    args = parser.parse_args()
+
+    source = get_workflow_embedding_dimensions(args.workflow_id)
+    target = args.dimensions
+
+    if target > source:
+        print(
+            f"❌ Workflow uses {source} dimensions; larger embeddings cannot be "
+            "derived from smaller ones. Re-ingest the workflow's resources instead."
+        )
+        return False
+
+    if target < source:
+        print(f"🔄 Backfilling {target}-dimension embeddings from {source}...")
+        backfill(args.workflow_id, source, target, args.batch_size)
+
+    if not args.skip_index:
+        print(f"🔍 Ensuring the vector index for {target} dimensions exists...")
+        build_chunks_embedding_index(
+            quantization=settings.SEARCH_QUANTIZATION, dimensions=target
+        )
+
+    if target != source:
+        if not set_workflow_embedding_dimensions(args.workflow_id, target):
+            print("❌ Failed to switch the workflow's embedding dimensions")
+            return False
+        print(f"✅ Workflow now ingests and searches {target}-dimension embeddings")
+
+        wait = settings.WORKFLOW_SETTINGS_CACHE_TTL_SECONDS
+        print(f"⏳ Waiting {wait}s for other processes to pick up the change...")
+        time.sleep(wait)
+        backfill(args.workflow_id, source, target, args.batch_size)
+
+    if args.clear_other_columns:
+        print("🧹 Clearing embeddings in other columns...")
+        total = 0
+        while updated := clear_unused_embeddings(
+            args.workflow_id, target, args.batch_size
+        ):
+            total += updated
+            print(f"   cleared {total} chunks")
+
+    print("🎉 Migration complete")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
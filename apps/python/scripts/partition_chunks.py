@@ -0,0 +1,178 @@
+"""
+Partition the chunks table by workflow, online.
+
+Commands, all safe to run while the service is live:
+  migrate   Create chunks_partitioned (hash partitions by workflow, plus
+            --dedicated-workflow list partitions), mirror writes to chunks
+            into it with a trigger, copy the existing rows in batches, build
+            the per-partition vector indexes chunks already has, then swap
+            the tables (skip with --no-swap and run `swap` later). Re-running
+            after an interruption resumes where it can.
+  swap      Swap chunks for chunks_partitioned once the copy is done. Restart
+            the API afterwards: its prepared search statements are bound to
+            the old table.
+  dedicate  Move a very large workflow into its own list partition.
+  status    List the partitions with their sizes.
+  cleanup   Drop chunks_unpartitioned, the old table kept for rollback.
+
+Run from apps/python:
+    python -m scripts.partition_chunks migrate --hash-partitions 16
+    python -m scripts.partition_chunks dedicate --workflow-id <id>
+"""
+
+import argparse
+import sys
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import engine
+from app.partitioning import (
+    PARTITIONED_TABLE,
+    UNPARTITIONED_TABLE,
+    copy_chunks_batch,
+    create_partitioned_chunks_table,
+    dedicate_workflow_partition,
+    get_chunks_partitions,
+    install_mirror_trigger,
+    is_chunks_partitioned,
+    swap_partitioned_chunks_table,
+    table_exists,
+)
+from app.vector_expressions import SEARCH_QUANTIZATIONS, SUPPORTED_EMBEDDING_DIMENSIONS
+from app.vector_index import (
+    build_chunks_embedding_index,
+    get_chunks_embedding_index_name,
+    get_index_definition,
+)
+
+
+def migrate(args: argparse.Namespace) -> bool:
+    if is_chunks_partitioned():
+        print("✅ chunks is already partitioned")
+        return True
+
+    if table_exists(PARTITIONED_TABLE):
+        print(f"♻️  Resuming with the existing {PARTITIONED_TABLE}")
+    else:
+        print(f"🏗️  Creating {PARTITIONED_TABLE}...")
+        create_partitioned_chunks_table(args.hash_partitions, args.dedicated_workflow)
+    install_mirror_trigger()
+
+    print("🔄 Copying chunks...")
+    copied = 0
+    after_id = ""
+    while True:
+        last_id, row_count = copy_chunks_batch(after_id, args.batch_size)
+        if last_id is None:
+            break
+        copied += row_count
+        after_id = last_id
+        print(f"   copied {copied} chunks")
+
+    for quantization in SEARCH_QUANTIZATIONS:
+        for dimensions in SUPPORTED_EMBEDDING_DIMENSIONS:
+            index = get_index_definition(
+                get_chunks_embedding_index_name(quantization, dimensions)
+            )
+            if not index or not index["is_valid"]:
+                continue
+            print(f"🔍 Building {quantization} {dimensions}-dimension indexes...")
+            build_chunks_embedding_index(
+                quantization=quantization,
+                dimensions=dimensions,
+                table_name=PARTITIONED_TABLE,
+            )
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text(f"ANALYZE {PARTITIONED_TABLE}"))
+
+    if args.no_swap:
+        print("⏸️  Copy complete; writes are mirrored until `swap` is run")
+        return True
+    return swap(args)
+
+
+def swap(args: argparse.Namespace) -> bool:
+    if not table_exists(PARTITIONED_TABLE):
+        print(f"❌ {PARTITIONED_TABLE} does not exist, run `migrate` first")
+        return False
+
+    print("🔀 Swapping tables...")
+    swap_partitioned_chunks_table(args.lock_timeout)
+    print(
+        f"✅ chunks is partitioned; the old table is kept as {UNPARTITIONED_TABLE}. "
+        "Restart the API processes now."
+    )
+    return True
+
+
+def dedicate(args: argparse.Namespace) -> bool:
+    print(f"🔄 Moving workflow {args.workflow_id} to its own partition...")
+    result = dedicate_workflow_partition(
+        args.workflow_id, args.batch_size, args.lock_timeout
+    )
+    if result["action"] == "skipped":
+        print(f"✅ Workflow already has partition {result['partition']}")
+    else:
+        print(f"✅ Moved {result['chunks_moved']} chunks to {result['partition']}")
+    return True
+
+
+def status(args: argparse.Namespace) -> bool:
+    if not is_chunks_partitioned():
+        print("chunks is not partitioned")
+        return True
+
+    print(f"{'partition':<28}{'bound':<44}{'rows':>12}{'size':>12}")
+    for partition in get_chunks_partitions():
+        size_mb = partition["total_bytes"] / (1024 * 1024)
+        print(
+            f"{partition['name']:<28}{(partition['bound'] or '')[:42]:<44}"
+            f"{partition['estimated_rows']:>12}{size_mb:>9.1f} MB"
+        )
+    return True
+
+
+def cleanup(args: argparse.Namespace) -> bool:
+    if not is_chunks_partitioned():
+        print("❌ chunks is not partitioned, refusing to drop the old table")
+        return False
+
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {UNPARTITIONED_TABLE}"))
+    print(f"🧹 Dropped {UNPARTITIONED_TABLE}")
+    return True
+
+
+def main() -> bool:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--lock-timeout", default="10s")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate")
+    migrate_parser.add_argument(
+        "--hash-partitions", type=int, default=settings.CHUNKS_HASH_PARTITIONS
+    )
+    migrate_parser.add_argument("--dedicated-workflow", action="append", default=[])
+    migrate_parser.add_argument("--no-swap", action="store_true")
+    migrate_parser.set_defaults(handler=migrate)
+
+    commands.add_parser("swap").set_defaults(handler=swap)
+
+    dedicate_parser = commands.add_parser("dedicate")
+    dedicate_parser.add_argument("--workflow-id", required=True)
+    dedicate_parser.set_defaults(handler=dedicate)
+
+    commands.add_parser("status").set_defaults(handler=status)
+    commands.add_parser("cleanup").set_defaults(handler=cleanup)
+
+    args = parser.parse_args()
+    success: bool = args.handler(args)
+    return success
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -20,10 +20,25 @@ def test_imports():
         ("app.config", "Configuration module"),
         ("app.schemas", "Pydantic schemas"),
         ("app.supabase", "Supabase client"),
+        ("app.cache_listener", "Search cache invalidation listener"),
+        ("app.auth", "Access token verification"),
         ("app.dependencies", "FastAPI dependencies"),
         ("app.services", "Service functions"),
+        ("app.chunking", "Streaming chunker"),
+        ("app.extraction", "Document conversion"),
+        ("app.usage", "Usage metering"),
+        ("app.metrics", "Prometheus metrics"),
+        ("app.tracing", "Ingestion tracing"),
+        ("app.pipeline", "Ingestion pipeline"),
+        ("app.admission", "Admission control"),
+        ("app.jobs", "Ingestion job consumer"),
+        ("app.rescrape_scheduler", "Rescrape scheduler"),
+        ("app.worker", "Ingestion worker entry point"),
         ("app.routers.health", "Health router"),
         ("app.routers.resources", "Resources router"),
+        ("app.routers.search", "Search router"),
+        ("app.routers.admin", "Admin router"),
+        ("app.routers.metrics", "Metrics router"),
     ]
 
     all_passed = True
@@ -0,0 +1,66 @@
+import pytest
+
+from app.admission import exceeds_limit, get_overload_reason
+
+
+@pytest.mark.parametrize(
+    ("current", "requested", "limit", "expected"),
+    [
+        (0, 500, 100, False),  # Idle: admitted however large
+        (50, 50, 100, False),
+        (50, 51, 100, True),
+        (100, 1, 100, True),
+        (1000, 1, 0, False),  # No limit
+    ],
+)
+def test_exceeds_limit(current, requested, limit, expected):
+    assert exceeds_limit(current, requested, limit) is expected
+
+
+def make_load(**overrides):
+    return {
+        "pending_jobs": 0,
+        "max_pending_jobs": 1000,
+        "workflow_pending_jobs": 0,
+        "max_workflow_pending_jobs": 100,
+        "rescrapes_in_flight": 0,
+        "rescrapes_waiting": 0,
+        "max_in_flight_rescrapes": 4,
+        "max_queued_rescrapes": 10,
+        **overrides,
+    }
+
+
+def test_admits_within_limits():
+    load = make_load(pending_jobs=500, workflow_pending_jobs=50, rescrapes_waiting=5)
+    assert get_overload_reason(load, job_count=10, rescrape_count=5) is None
+
+
+def test_refuses_over_the_workflow_limit_first():
+    load = make_load(pending_jobs=995, workflow_pending_jobs=95)
+    assert (
+        get_overload_reason(load, job_count=10, rescrape_count=0)
+        == "Too many pending ingestion jobs for this workflow"
+    )
+
+
+def test_refuses_over_the_queue_limit():
+    load = make_load(pending_jobs=995, workflow_pending_jobs=5)
+    assert (
+        get_overload_reason(load, job_count=10, rescrape_count=0)
+        == "Too many pending ingestion jobs"
+    )
+
+
+def test_refuses_rescrapes_over_the_waiting_limit():
+    load = make_load(rescrapes_waiting=8)
+    assert get_overload_reason(load, job_count=3, rescrape_count=0) is None
+    assert (
+        get_overload_reason(load, job_count=3, rescrape_count=3)
+        == "Too many resources being rescraped"
+    )
+
+
+def test_unknown_counts_admit_the_request():
+    load = make_load(pending_jobs=None, workflow_pending_jobs=None)
+    assert get_overload_reason(load, job_count=10_000, rescrape_count=0) is None
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+
+from app import auth
+from app.auth import (
+    get_issuer,
+    get_token_ttl,
+    invalidate_user_tokens,
+    verify_access_token,
+    verify_token_locally,
+)
+from app.cache import verified_token_cache
+
+SECRET = "test-jwt-secret-at-least-32-bytes-long"
+
+
+@pytest.fixture(autouse=True)
+def jwt_secret(monkeypatch):
+    monkeypatch.setattr(auth.settings, "SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(auth.settings, "AUTH_LOCAL_VERIFICATION_ENABLED", True)
+    verified_token_cache.clear()
+    yield
+    verified_token_cache.clear()
+
+
+def make_token(secret=SECRET, expires_in=3600, **claims):
+    payload = {
+        "sub": "user-1",
+        "aud": auth.settings.AUTH_JWT_AUDIENCE,
+        "iss": get_issuer(),
+        "exp": int(time.time()) + expires_in,
+        **claims,
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def test_valid_token_is_verified_locally():
+    claims = asyncio.run(verify_token_locally(make_token(role="authenticated")))
+    assert claims is not None
+    assert claims["sub"] == "user-1"
+    assert claims["role"] == "authenticated"
+
+
+def test_expired_token_is_rejected():
+    leeway = auth.settings.AUTH_JWT_LEEWAY_SECONDS
+    with pytest.raises(jwt.ExpiredSignatureError):
+        asyncio.run(verify_token_locally(make_token(expires_in=-leeway - 10)))
+
+
+def test_token_expired_within_the_leeway_is_accepted():
+    token = make_token(expires_in=-1)
+    assert asyncio.run(verify_token_locally(token)) is not None
+
+
+@pytest.mark.parametrize(
+    ("token", "error"),
+    [
+        (
+            make_token(secret="another-secret-at-least-32-bytes"),
+            jwt.InvalidSignatureError,
+        ),
+        (make_token(aud="someone-else"), jwt.InvalidAudienceError),
+        (make_token(iss="https://example.com/auth/v1"), jwt.InvalidIssuerError),
+        (make_token(exp=None), jwt.MissingRequiredClaimError),
+    ],
+)
+def test_invalid_token_is_rejected(token, error):
+    with pytest.raises(error):
+        asyncio.run(verify_token_locally(token))
+
+
+def test_token_without_a_configured_secret_is_left_to_supabase(monkeypatch):
+    monkeypatch.setattr(auth.settings, "SUPABASE_JWT_SECRET", None)
+    assert asyncio.run(verify_token_locally(make_token())) is None
+
+
+def test_verified_token_is_cached_until_invalidated(monkeypatch):
+    async def fail_remotely(token):
+        raise AssertionError("Verified remotely")
+
+    monkeypatch.setattr(auth, "verify_token_remotely", fail_remotely)
+    token = make_token()
+    assert asyncio.run(verify_access_token(token))["sub"] == "user-1"
+
+    # A cached token is not verified again
+    monkeypatch.setattr(auth.settings, "SUPABASE_JWT_SECRET", "rotated-secret")
+    assert asyncio.run(verify_access_token(token))["sub"] == "user-1"
+
+    assert invalidate_user_tokens("user-1") == 1
+    with pytest.raises(jwt.InvalidSignatureError):
+        asyncio.run(verify_access_token(token))
+
+
+def test_token_is_cached_until_it_expires_at_most():
+    max_ttl = auth.settings.AUTH_TOKEN_CACHE_TTL_SECONDS
+    assert get_token_ttl(make_token(expires_in=max_ttl * 10)) == max_ttl
+    assert 50 < get_token_ttl(make_token(expires_in=60)) <= 60
+    assert get_token_ttl(make_token(expires_in=-10)) < 0
@@ -0,0 +1,97 @@
+from app import cache
+from app.cache import TTLCache, get_query_hash, get_search_cache_key
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_cache(monkeypatch, max_size=3, ttl_seconds=10.0):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return TTLCache(max_size, ttl_seconds), clock
+
+
+def test_get_returns_value_until_it_expires(monkeypatch):
+    entries, clock = make_cache(monkeypatch)
+    entries.set("a", 1)
+
+    clock.now += 9.9
+    assert entries.get("a") == 1
+
+    clock.now += 0.1
+    assert entries.get("a") is None
+    assert len(entries) == 0
+
+
+def test_set_with_ttl_overrides_default(monkeypatch):
+    entries, clock = make_cache(monkeypatch)
+    entries.set("short", 1, ttl_seconds=1.0)
+    entries.set("long", 2)
+
+    clock.now += 5
+    assert entries.get("short") is None
+    assert entries.get("long") == 2
+
+
+def test_evicts_least_recently_used(monkeypatch):
+    entries, _ = make_cache(monkeypatch)
+    for key in "abc":
+        entries.set(key, key)
+    # Reading "a" makes "b" the least recently used
+    assert entries.get("a") == "a"
+
+    entries.set("d", "d")
+    assert entries.get("b") is None
+    assert [entries.get(key) for key in "acd"] == ["a", "c", "d"]
+
+
+def test_zero_size_caches_nothing(monkeypatch):
+    entries, _ = make_cache(monkeypatch, max_size=0)
+    entries.set("a", 1)
+    assert entries.get("a") is None
+    assert len(entries) == 0
+
+
+def test_delete_and_delete_where(monkeypatch):
+    entries, _ = make_cache(monkeypatch, max_size=10)
+    for i in range(5):
+        entries.set(i, {"sub": "user-1" if i % 2 else "user-2"})
+
+    assert entries.delete(0) is True
+    assert entries.delete(0) is False
+    assert entries.delete_where(lambda _, claims: claims["sub"] == "user-1") == 2
+    assert sorted(key for key in range(5) if entries.get(key)) == [2, 4]
+
+    entries.clear()
+    assert len(entries) == 0
+
+
+def test_stats_count_hits_and_misses(monkeypatch):
+    entries, _ = make_cache(monkeypatch)
+    entries.set("a", 1)
+    entries.get("a")
+    entries.get("a")
+    entries.get("b")
+
+    stats = entries.stats()
+    assert stats["size"] == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["hit_rate"] == 2 / 3
+
+
+def test_query_hash_ignores_whitespace():
+    assert get_query_hash("what is  itzam?\n") == get_query_hash(" what is itzam? ")
+    assert get_query_hash("what is itzam?") != get_query_hash("what is Itzam?")
+
+
+def test_search_cache_key_ignores_context_order():
+    first = get_search_cache_key("wf", 1, "hash", 10, None, ["b", "a"], None)
+    second = get_search_cache_key("wf", 1, "hash", 10, None, ["a", "b"], None)
+    assert first == second
+    assert first != get_search_cache_key("wf", 2, "hash", 10, None, ["a", "b"], None)
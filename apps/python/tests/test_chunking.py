@@ -0,0 +1,82 @@
+from chonkie import Chunk  # type: ignore
+
+from app.chunking import ChunkBatcher, StreamingTokenChunker
+
+
+class CharTokenizer:
+    """One token per character, so windows are easy to predict."""
+
+    def encode(self, text):
+        return [ord(char) for char in text]
+
+    def decode(self, tokens):
+        return "".join(chr(token) for token in tokens)
+
+
+def stream(pieces, chunk_size):
+    chunker = StreamingTokenChunker(CharTokenizer(), chunk_size=chunk_size)
+    chunks = []
+    for piece in pieces:
+        chunks.extend(chunker.feed(piece))
+    return chunks, chunker.flush(), chunker
+
+
+def test_streamed_chunks_match_fixed_windows_of_the_whole_text():
+    text = "the quick brown fox jumps over the lazy dog"
+    pieces = [text[i : i + 7] for i in range(0, len(text), 7)]
+
+    streamed, flushed, chunker = stream(pieces, chunk_size=10)
+    chunks = streamed + flushed
+
+    assert [chunk.text for chunk in chunks] == [
+        text[i : i + 10] for i in range(0, len(text), 10)
+    ]
+    assert [chunk.start_index for chunk in chunks] == list(range(0, len(text), 10))
+    assert chunks[-1].end_index == len(text)
+    assert [chunk.token_count for chunk in chunks] == [10, 10, 10, 10, 3]
+    assert chunker.chunk_count == len(chunks)
+
+
+def test_last_full_window_waits_for_more_text():
+    chunks, flushed, _ = stream(["a" * 10], chunk_size=10)
+    # Its last tokens could still merge with the next piece
+    assert chunks == []
+    assert [chunk.text for chunk in flushed] == ["a" * 10]
+
+
+def test_feed_returns_chunks_as_soon_as_windows_fill():
+    chunker = StreamingTokenChunker(CharTokenizer(), chunk_size=4)
+    assert chunker.feed("abc") == []
+    assert [chunk.text for chunk in chunker.feed("defghij")] == ["abcd", "efgh"]
+    assert chunker.feed("k") == []
+    assert [chunk.text for chunk in chunker.flush()] == ["ijk"]
+    assert chunker.flush() == []
+
+
+def make_chunk(token_count):
+    return Chunk(
+        text="x" * token_count,
+        start_index=0,
+        end_index=token_count,
+        token_count=token_count,
+    )
+
+
+def test_batcher_returns_a_batch_when_the_next_chunk_overflows_it():
+    batcher = ChunkBatcher(token_limit=10)
+    chunks = [make_chunk(4), make_chunk(4), make_chunk(4)]
+
+    assert batcher.add(chunks[0]) is None
+    assert batcher.add(chunks[1]) is None
+    assert batcher.add(chunks[2]) == chunks[:2]
+    assert batcher.flush() == chunks[2:]
+    assert batcher.flush() is None
+
+
+def test_batcher_keeps_an_oversized_chunk_in_its_own_batch():
+    batcher = ChunkBatcher(token_limit=10)
+    small, large = make_chunk(2), make_chunk(25)
+
+    assert batcher.add(large) is None
+    assert batcher.add(small) == [large]
+    assert batcher.flush() == [small]
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+# app.jobs imports the ingestion services, and with them Docling
+pytest.importorskip("docling")
+
+from app import jobs  # noqa: E402
+from app.database import JobCancelledError  # noqa: E402
+from app.jobs import JobConsumer, get_retry_delay, is_retryable  # noqa: E402
+
+
+def make_job(job_id="job-1", attempts=1):
+    return {
+        "id": job_id,
+        "type": "EXTRACT",
+        "attempts": attempts,
+        "resource_id": "resource-1",
+        "workflow_id": "workflow-1",
+        "payload": {},
+    }
+
+
+def test_retry_delay_backs_off_exponentially_up_to_the_maximum(monkeypatch):
+    monkeypatch.setattr(jobs.settings, "JOB_RETRY_BASE_DELAY_SECONDS", 10.0)
+    monkeypatch.setattr(jobs.settings, "JOB_RETRY_MAX_DELAY_SECONDS", 60.0)
+    assert [get_retry_delay(attempts) for attempts in range(6)] == [
+        10.0,
+        10.0,
+        20.0,
+        40.0,
+        60.0,
+        60.0,
+    ]
+
+
+def test_client_errors_are_not_retried():
+    assert is_retryable(RuntimeError("connection reset"))
+    assert is_retryable(HTTPException(status_code=503))
+    assert not is_retryable(HTTPException(status_code=400))
+
+
+@pytest.fixture
+def failures(monkeypatch):
+    calls = {"fail_job": [], "handle_failed_job": []}
+
+    def fail_job(job_id, worker_id, error, delay, retry):
+        calls["fail_job"].append((job_id, error, delay, retry))
+        return "QUEUED" if retry else "FAILED"
+
+    async def handle_failed_job(job, error):
+        calls["handle_failed_job"].append((job["id"], error))
+
+    monkeypatch.setattr(jobs, "fail_job", fail_job)
+    monkeypatch.setattr(jobs, "handle_failed_job", handle_failed_job)
+    return calls
+
+
+def test_failed_attempt_is_retried_with_backoff(failures):
+    async def scenario():
+        consumer = JobConsumer(worker_id="worker-1")
+        job = make_job(attempts=2)
+        consumer.track(job)
+        await consumer.fail_attempt(job, RuntimeError("timeout"))
+        return consumer
+
+    consumer = asyncio.run(scenario())
+
+    assert failures["fail_job"] == [("job-1", "timeout", get_retry_delay(2), True)]
+    assert failures["handle_failed_job"] == []
+    assert consumer.stats()["in_flight"] == 0
+
+
+def test_client_error_fails_the_resource_at_once(failures):
+    async def scenario():
+        consumer = JobConsumer(worker_id="worker-1")
+        await consumer.fail_attempt(make_job(), HTTPException(400, "No text"))
+
+    asyncio.run(scenario())
+
+    assert [call[3] for call in failures["fail_job"]] == [False]
+    assert [job_id for job_id, _ in failures["handle_failed_job"]] == ["job-1"]
+
+
+def test_cancelled_attempt_is_not_recorded_as_a_failure(failures):
+    async def scenario():
+        consumer = JobConsumer(worker_id="worker-1")
+        job = make_job()
+        consumer.track(job)
+        await consumer.fail_attempt(job, JobCancelledError("job-1"))
+        return consumer
+
+    consumer = asyncio.run(scenario())
+
+    assert failures["fail_job"] == []
+    assert consumer.stats()["in_flight"] == 0
+
+
+def test_jobs_whose_lease_was_lost_are_cancelled(monkeypatch):
+    extended_jobs = []
+
+    def extend_job_leases(job_ids, worker_id, visibility_timeout):
+        extended_jobs.append(sorted(job_ids))
+        # job-2 expired and was claimed by another worker
+        return [job_id for job_id in job_ids if job_id != "job-2"]
+
+    monkeypatch.setattr(jobs, "extend_job_leases", extend_job_leases)
+
+    async def scenario():
+        consumer = JobConsumer(worker_id="worker-1")
+        consumer.visibility_timeout = 0.03
+        cancelled = []
+        monkeypatch.setattr(consumer.pipeline, "cancel", cancelled.append)
+        consumer.track(make_job("job-1"))
+        consumer.track(make_job("job-2"))
+
+        heartbeat = asyncio.create_task(consumer.keep_leases())
+        while not extended_jobs:
+            await asyncio.sleep(0.01)
+        heartbeat.cancel()
+        return cancelled
+
+    assert asyncio.run(scenario()) == ["job-2"]
+    assert extended_jobs[0] == ["job-1", "job-2"]
@@ -0,0 +1,90 @@
+import asyncio
+
+from app.supabase import ProgressBroadcaster
+
+
+class FakePublisher:
+    def __init__(self):
+        self.sent = []
+
+    async def publish(self, channel_id, event_type, payload):
+        self.sent.append((channel_id, event_type, payload))
+
+
+def progress(processed_chunks, **fields):
+    return {"resourceId": "resource-1", "processedChunks": processed_chunks, **fields}
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_updates_within_the_interval_are_coalesced():
+    async def scenario():
+        publisher = FakePublisher()
+        broadcaster = ProgressBroadcaster(publisher, interval=60)
+
+        broadcaster.post("channel", "update", progress(1, status="PENDING"))
+        await settle()
+        broadcaster.post("channel", "update", progress(2))
+        broadcaster.post("channel", "update", progress(3, title="Title"))
+        await settle()
+        sent_before_close = list(publisher.sent)
+
+        await broadcaster.close()
+        return sent_before_close, publisher.sent
+
+    sent_before_close, sent = asyncio.run(scenario())
+
+    # The first update goes out at once, the next ones wait for the interval
+    assert sent_before_close == [("channel", "update", progress(1, status="PENDING"))]
+    # close() flushes them as one update, their chunk counts summed
+    assert sent[1:] == [("channel", "update", progress(5, title="Title"))]
+
+
+def test_terminal_update_is_flushed_at_once_with_the_pending_ones():
+    async def scenario():
+        publisher = FakePublisher()
+        broadcaster = ProgressBroadcaster(publisher, interval=60)
+
+        broadcaster.post("channel", "update", progress(1))
+        await settle()
+        broadcaster.post("channel", "update", progress(2))
+        broadcaster.post("channel", "update", progress(3, status="PROCESSED"))
+        await settle()
+        sent = list(publisher.sent)
+
+        await broadcaster.close()
+        return sent, publisher.sent
+
+    sent, sent_after_close = asyncio.run(scenario())
+
+    assert sent == [
+        ("channel", "update", progress(1)),
+        ("channel", "update", progress(5, status="PROCESSED")),
+    ]
+    assert sent_after_close == sent
+
+
+def test_updates_of_different_resources_are_not_coalesced():
+    async def scenario():
+        publisher = FakePublisher()
+        broadcaster = ProgressBroadcaster(publisher, interval=60)
+
+        broadcaster.post("channel", "update", {"resourceId": "a", "processedChunks": 1})
+        broadcaster.post("channel", "update", {"resourceId": "b", "processedChunks": 1})
+        broadcaster.post("usage", "update", {"newFileSize": 10})
+        await settle()
+        broadcaster.post("usage", "update", {"newFileSize": 5})
+        await broadcaster.close()
+        return publisher.sent
+
+    sent = asyncio.run(scenario())
+
+    assert sent == [
+        ("channel", "update", {"resourceId": "a", "processedChunks": 1}),
+        ("channel", "update", {"resourceId": "b", "processedChunks": 1}),
+        ("usage", "update", {"newFileSize": 10}),
+        ("usage", "update", {"newFileSize": 5}),
+    ]
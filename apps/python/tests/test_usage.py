@@ -0,0 +1,92 @@
+import asyncio
+
+from app import usage
+from app.usage import UsageMeter
+
+
+class FakeUsageStore:
+    def __init__(self, succeeds=True):
+        self.succeeds = succeeds
+        self.writes = []
+        self.updates = []
+
+    def add_workflow_usage(self, totals):
+        self.writes.append(totals)
+        return self.succeeds
+
+    async def send_usage_update(self, workflow_id, file_size):
+        self.updates.append((workflow_id, file_size))
+
+
+def patch_store(monkeypatch, succeeds=True):
+    store = FakeUsageStore(succeeds)
+    monkeypatch.setattr(usage, "add_workflow_usage", store.add_workflow_usage)
+    monkeypatch.setattr(usage, "send_usage_update", store.send_usage_update)
+    return store
+
+
+def test_flush_writes_totals_and_sends_one_update_per_workflow(monkeypatch):
+    store = patch_store(monkeypatch)
+
+    async def scenario():
+        meter = UsageMeter(interval=60, threshold_bytes=0)
+        meter.record("workflow-1", 100)
+        meter.record("workflow-1", 50)
+        meter.record("workflow-2", 10)
+        await meter.close()
+        # Nothing left to write
+        await meter.flush()
+
+    asyncio.run(scenario())
+
+    assert store.writes == [
+        {
+            "workflow-1": {"bytes": 150, "resources": 2},
+            "workflow-2": {"bytes": 10, "resources": 1},
+        }
+    ]
+    assert sorted(store.updates) == [("workflow-1", 150), ("workflow-2", 10)]
+
+
+def test_totals_that_failed_to_write_are_kept_for_the_next_flush(monkeypatch):
+    store = patch_store(monkeypatch, succeeds=False)
+
+    async def scenario():
+        meter = UsageMeter(interval=60, threshold_bytes=0)
+        meter.record("workflow-1", 100)
+        await meter.flush()
+
+        store.succeeds = True
+        meter.record("workflow-1", 20)
+        await meter.close()
+
+    asyncio.run(scenario())
+
+    assert store.writes == [
+        {"workflow-1": {"bytes": 100, "resources": 1}},
+        {"workflow-1": {"bytes": 120, "resources": 2}},
+    ]
+    # Only what was recorded is broadcast
+    assert store.updates == [("workflow-1", 120)]
+
+
+def test_threshold_flushes_before_the_interval(monkeypatch):
+    store = patch_store(monkeypatch)
+
+    async def scenario():
+        meter = UsageMeter(interval=60, threshold_bytes=1000)
+        meter.record("workflow-1", 400)
+        await asyncio.sleep(0.05)
+        writes_below_threshold = len(store.writes)
+
+        meter.record("workflow-1", 600)
+        for _ in range(100):
+            if store.updates:
+                break
+            await asyncio.sleep(0.01)
+        await meter.close()
+        return writes_below_threshold
+
+    assert asyncio.run(scenario()) == 0
+    assert store.writes == [{"workflow-1": {"bytes": 1000, "resources": 2}}]
+    assert store.updates == [("workflow-1", 1000)]
@@ -11,24 +11,54 @@ import {
   sql,
 } from "drizzle-orm";
 import { db } from "../db";
-import { chunks, contexts, resources } from "../db/schema";
+import { chunks, contexts, resources, workflows } from "../db/schema";
 
-const EMBEDDING_MODEL = openai.embedding("text-embedding-3-small");
+const EMBEDDING_MODEL_ID = "text-embedding-3-small";
+const EMBEDDING_DIMENSIONS = 1536;
 const CHUNKS_RETRIEVE_LIMIT = 4;
 const SIMILARITY_THRESHOLD = 0.4;
 
+// Chunks column holding the embeddings of each size, see
+// workflows.embeddingDimensions
+const EMBEDDING_COLUMNS = {
+  1536: chunks.embedding,
+  1024: chunks.embedding1024,
+  512: chunks.embedding512,
+  256: chunks.embedding256,
+} as const;
+
+type EmbeddingDimensions = keyof typeof EMBEDDING_COLUMNS;
+
 export type Chunk = typeof chunks.$inferSelect;
 
 // SINGLE EMBEDDING (for user prompt)
-export const generateEmbedding = async (value: string): Promise<number[]> => {
+export const generateEmbedding = async (
+  value: string,
+  dimensions: number = EMBEDDING_DIMENSIONS
+): Promise<number[]> => {
   const input = value.replaceAll("\\n", " ");
   const { embedding } = await embed({
-    model: EMBEDDING_MODEL,
+    model: openai.embedding(EMBEDDING_MODEL_ID, { dimensions }),
     value: input,
   });
   return embedding;
 };
 
+// Embedding size the workflow's chunks are stored (and must be searched) with
+const getWorkflowEmbeddingDimensions = async (
+  workflowId: string
+): Promise<EmbeddingDimensions> => {
+  const [workflow] = await db
+    .select({ embeddingDimensions: workflows.embeddingDimensions })
+    .from(workflows)
+    .where(eq(workflows.id, workflowId));
+
+  const dimensions = workflow?.embeddingDimensions ?? EMBEDDING_DIMENSIONS;
+  return dimensions in EMBEDDING_COLUMNS
+    ? (dimensions as EmbeddingDimensions)
+    : EMBEDDING_DIMENSIONS;
+};
+
 // FIND RELEVANT CONTENT FOR USER QUERY
 export const findRelevantContent = async (
   userQuery: string,
@@ -36,12 +66,13 @@ export const findRelevantContent = async (
   contextSlugs: string[],
   workflowId: string
 ) => {
-  // Generating embedding for user query
-  const userQueryEmbedded = await generateEmbedding(userQuery);
+  // Generating embedding for user query, in the size of the workflow's chunks
+  const dimensions = await getWorkflowEmbeddingDimensions(workflowId);
+  const userQueryEmbedded = await generateEmbedding(userQuery, dimensions);
 
   // Calculating similarity between user query and chunks
   const similarity = sql<number>`1 - (${cosineDistance(
-    chunks.embedding,
+    EMBEDDING_COLUMNS[dimensions],
     userQueryEmbedded
   )})`;
 
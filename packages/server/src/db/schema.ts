@@ -1,5 +1,6 @@
 import { relations, sql } from "drizzle-orm";
 import {
+  bigint,
   boolean,
   decimal,
   index,
@@ -8,6 +9,7 @@ import {
   pgEnum,
   pgSchema,
   pgTableCreator,
+  primaryKey,
   text,
   timestamp,
   uuid,
@@ -167,6 +169,12 @@ export const workflows = createTable(
     userId: uuid("user_id")
       .notNull()
       .references(() => users.id),
+    // Dimensions requested from the embedding model for this workflow's
+    // chunks (256, 512, 1024 or 1536), see chunks.embedding*
+    embeddingDimensions: integer("embedding_dimensions").notNull().default(1536),
+    // Bumped whenever the workflow's chunks change, to drop the search results
+    // the Python service processes have cached for it
+    searchGeneration: integer("search_generation").notNull().default(0),
     createdAt: timestamp("created_at", { withTimezone: true })
       .default(sql`CURRENT_TIMESTAMP`)
       .notNull(),
@@ -318,6 +326,11 @@ export const resources = createTable(
     type: resourceTypeEnum("type").notNull(),
     mimeType: varchar("mime_type", { length: 256 }).notNull(),
     contentHash: varchar("content_hash", { length: 256 }),
+    // Cutoff of a rescrape whose batches are checkpointed: its chunks
+    // created before then are replaced, also when the ingestion is recovered
+    replaceChunksBefore: timestamp("replace_chunks_before", {
+      withTimezone: true,
+    }),
     createdAt: timestamp("created_at", { withTimezone: true })
       .default(sql`CURRENT_TIMESTAMP`)
       .notNull(),
@@ -342,9 +355,13 @@ export const resources = createTable(
 export const chunks = createTable(
   "chunks",
   {
-    id: varchar("id", { length: 256 }).primaryKey().notNull(),
+    id: varchar("id", { length: 256 }).notNull(),
     content: text("content").notNull(),
-    embedding: vector("embedding", { dimensions: 1536 }).notNull(),
+    // Only the column matching workflow.embeddingDimensions is set
+    embedding: vector("embedding", { dimensions: 1536 }),
+    embedding1024: vector("embedding_1024", { dimensions: 1024 }),
+    embedding512: vector("embedding_512", { dimensions: 512 }),
+    embedding256: vector("embedding_256", { dimensions: 256 }),
     active: boolean("active").notNull().default(true),
     createdAt: timestamp("created_at", { withTimezone: true })
       .default(sql`CURRENT_TIMESTAMP`)
@@ -360,11 +377,146 @@ export const chunks = createTable(
       .references(() => workflows.id),
   },
   (table) => ({
+    // The primary key includes workflow_id so chunks can be partitioned by
+    // workflow (apps/python/scripts/partition_chunks.py)
+    pk: primaryKey({
+      name: "chunks_pkey",
+      columns: [table.id, table.workflowId],
+    }),
     resourceIdIndex: index("chunks_resource_id_idx").on(table.resourceId),
     workflowIdIndex: index("chunks_workflow_id_idx").on(table.workflowId),
+    // Default vector index, built and rebuilt CONCURRENTLY by the Python
+    // service (POST /api/v1/admin/search-index) with its default options.
+    // Declared so drizzle-kit push keeps it. Its quantized, per-size and
+    // per-partition siblings (chunks_*embedding*_idx) are only managed by the
+    // service: do not let push drop them.
+    embeddingIndex: index("chunks_embedding_idx")
+      .using("hnsw", table.embedding.op("vector_cosine_ops"))
+      .with({ m: 16, ef_construction: 64 }),
+  })
+);
+
+// -------- 📋 ENUMS <> INGESTION JOBS --------
+export const ingestionJobTypeEnum = pgEnum("ingestion_job_type", [
+  "EXTRACT",
+  "CHUNK",
+  "EMBED_BATCH",
+  "FINALIZE",
+]);
+
+export const ingestionJobStatusEnum = pgEnum("ingestion_job_status", [
+  "QUEUED",
+  "RUNNING",
+  "SUCCEEDED",
+  "FAILED",
+  "CANCELLED",
+]);
+
+// -------- ⚙️ INGESTION JOBS --------
+// Durable queue consumed by the Python service (SELECT ... FOR UPDATE SKIP
+// LOCKED). A RUNNING job whose lockedUntil has passed is claimed again.
+export const ingestionJobs = createTable(
+  "ingestion_job",
+  {
+    id: varchar("id", { length: 256 }).primaryKey().notNull(),
+    type: ingestionJobTypeEnum("type").notNull(),
+    status: ingestionJobStatusEnum("status").notNull().default("QUEUED"),
+    payload: jsonb("payload").notNull().default({}),
+    attempts: integer("attempts").notNull().default(0),
+    maxAttempts: integer("max_attempts").notNull().default(5),
+    runAt: timestamp("run_at", { withTimezone: true })
+      .default(sql`CURRENT_TIMESTAMP`)
+      .notNull(),
+    lockedUntil: timestamp("locked_until", { withTimezone: true }),
+    lockedBy: varchar("locked_by", { length: 256 }),
+    lastError: text("last_error"),
+    resourceId: varchar("resource_id", { length: 256 })
+      .notNull()
+      .references(() => resources.id),
+    workflowId: varchar("workflow_id", { length: 256 })
+      .notNull()
+      .references(() => workflows.id),
+    // Fair-share scheduling: jobs are interleaved across users and workflows,
+    // and lower priorities (interactive uploads) run before higher (rescrape)
+    userId: varchar("user_id", { length: 256 }),
+    priority: integer("priority").notNull().default(0),
+    createdAt: timestamp("created_at", { withTimezone: true })
+      .default(sql`CURRENT_TIMESTAMP`)
+      .notNull(),
+    updatedAt: timestamp("updated_at", { withTimezone: true })
+      .$onUpdate(() => new Date())
+      .notNull(),
+  },
+  (table) => ({
+    statusRunAtIndex: index("ingestion_job_status_run_at_idx").on(
+      table.status,
+      table.runAt
+    ),
+    resourceIdIndex: index("ingestion_job_resource_id_idx").on(
+      table.resourceId
+    ),
+    // The fair-share claim finds the workflows with queued jobs, and the
+    // head of each one's backlog, from this index
+    statusWorkflowIdIndex: index("ingestion_job_status_workflow_id_idx").on(
+      table.status,
+      table.workflowId,
+      table.priority,
+      table.runAt
+    ),
+  })
+);
+
+// -------- 🧩 RESOURCE BATCHES --------
+// Ingestion checkpoint: the chunks of each embedding batch of a resource,
+// written when the resource is chunked and replaced when it is chunked again.
+// completedAt records a stored batch (its chunks are dropped then), so a
+// retried batch is not stored twice and the Python recovery sweep re-enqueues
+// only the missing ones. A negative batchIndex is a streamed extraction.
+export const resourceBatches = createTable(
+  "resource_batch",
+  {
+    resourceId: varchar("resource_id", { length: 256 })
+      .notNull()
+      .references(() => resources.id),
+    batchIndex: integer("batch_index").notNull(),
+    chunks: jsonb("chunks"),
+    completedAt: timestamp("completed_at", { withTimezone: true }),
+    createdAt: timestamp("created_at", { withTimezone: true })
+      .default(sql`CURRENT_TIMESTAMP`)
+      .notNull(),
+    updatedAt: timestamp("updated_at", { withTimezone: true })
+      .$onUpdate(() => new Date())
+      .notNull(),
+  },
+  (table) => ({
+    pk: primaryKey({
+      name: "resource_batch_pkey",
+      columns: [table.resourceId, table.batchIndex],
+    }),
   })
 );
 
+// -------- 📊 WORKFLOW USAGE --------
+// Durable ingestion metering, written by the Python service: the bytes of
+// extracted content and the resources ingested per workflow, added up in
+// memory and flushed periodically (see apps/python/app/usage.py).
+export const workflowUsage = createTable("workflow_usage", {
+  workflowId: varchar("workflow_id", { length: 256 })
+    .primaryKey()
+    .notNull()
+    .references(() => workflows.id),
+  ingestedBytes: bigint("ingested_bytes", { mode: "number" })
+    .notNull()
+    .default(0),
+  ingestedResources: integer("ingested_resources").notNull().default(0),
+  createdAt: timestamp("created_at", { withTimezone: true })
+    .default(sql`CURRENT_TIMESTAMP`)
+    .notNull(),
+  updatedAt: timestamp("updated_at", { withTimezone: true })
+    .$onUpdate(() => new Date())
+    .notNull(),
+});
+
 // -------- 🏭 PROVIDER KEYS --------
 export const providerKeys = createTable(
   "provider_key",
@@ -655,6 +807,8 @@ export const resourceRelations = relations(resources, ({ one, many }) => ({
   }),
   runResources: many(runResources),
   chunks: many(chunks),
+  ingestionJobs: many(ingestionJobs),
+  resourceBatches: many(resourceBatches),
   context: one(contexts, {
     fields: [resources.contextId],
     references: [contexts.id],
@@ -669,6 +823,30 @@ export const chunkRelations = relations(chunks, ({ one }) => ({
   }),
 }));
 
+// -------- ⚙️ INGESTION JOB --------
+export const ingestionJobRelations = relations(ingestionJobs, ({ one }) => ({
+  resource: one(resources, {
+    fields: [ingestionJobs.resourceId],
+    references: [resources.id],
+  }),
+}));
+
+// -------- 🧩 RESOURCE BATCH --------
+export const resourceBatchRelations = relations(resourceBatches, ({ one }) => ({
+  resource: one(resources, {
+    fields: [resourceBatches.resourceId],
+    references: [resources.id],
+  }),
+}));
+
+// -------- 📊 WORKFLOW USAGE --------
+export const workflowUsageRelations = relations(workflowUsage, ({ one }) => ({
+  workflow: one(workflows, {
+    fields: [workflowUsage.workflowId],
+    references: [workflows.id],
+  }),
+}));
+
 // -------- 🏭 PROVIDER KEY --------
 export const providerKeyRelations = relations(providerKeys, ({ one }) => ({
   user: one(users, {